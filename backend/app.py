@@ -1,27 +1,86 @@
 import os
-import threading
+import sys
 import time
-import io
+
+_STARTED = time.perf_counter()
+# `python app.py --profile-startup` profiles everything from here to a fully built
+# index, prints the report and exits instead of serving
+PROFILE_STARTUP = __name__ == '__main__' and '--profile-startup' in sys.argv
+if PROFILE_STARTUP:
+    import cProfile
+    _startup_profiler = cProfile.Profile()
+    _startup_profiler.enable()
+
+# Server engine: 'threading' (Werkzeug, one OS thread per connection), 'eventlet' or
+# 'gevent' (cooperative green threads). Cooperative engines must patch the stdlib
+# before anything else imports it, hence this block comes first.
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import threading
+import json
+import uuid
+import base64
+import hashlib
+import struct
+import hmac
+import secrets
+import tarfile
+import atexit
+import functools
+import mimetypes
 import logging
 import importlib.util
 import pkgutil
-import atexit
-import socket
 import ssl as _ssl
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from pathlib import Path
-from urllib.parse import urlparse, urlunparse
+from urllib.parse import urlparse, quote
 
-# Third-party imports
-import qrcode
+# Third-party imports (qrcode and zeroconf are imported when first used)
 from werkzeug.utils import secure_filename
-from flask import Flask, request, redirect, url_for, send_from_directory, render_template, jsonify, send_file, session
-from flask_socketio import SocketIO
+from flask import (Blueprint, Flask, Response, current_app, g, jsonify, redirect, render_template, request, send_file,
+                   session, url_for)
+from werkzeug.http import http_date
+from flask_socketio import SocketIO, join_room, leave_room
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_cors import CORS
 from jinja2 import TemplateNotFound
 
+# backend/ is not a package: make core/ importable however this module is loaded
+# (``python app.py``, ``backend.app:create_app()`` under gunicorn, the tests)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from core.archives import iter_tar, iter_zip, tar_members
+from core.batch import BatchPart, DiscardPart, read_tar
+from core.blobs import BlobStore
+from core.chunked import ChunkedUploads
+from core.compression import CompressionCache, negotiate as negotiate_coding
+from core.delta import (DELTA_MAX_BLOCK, DELTA_MIN_BLOCK, DeltaSignatures, apply_delta, basis_version,
+                        block_size as delta_block_size)
+from core.expiry import ExpiryScheduler
+from core.feed import ChangeFeed
+from core.file_index import FileIndex
+from core.fileio import (STREAM_BUFFER_SIZE, copy_stream, hash_file, io_inflight, io_queued, iter_file, preallocate,
+                         run_io)
+from core.httputil import file_etag, not_modified, parse_ranges, range_allowed
+from core.metrics import METRICS, Counter, Gauge, Histogram, SamplingProfiler, peak_rss_bytes
+from core.network import NetworkInfo, advertise_zeroconf
+from core.previews import PreviewPipeline, preview_kind
+from core.qrcodes import QR_DEFAULT_BOX_SIZE, QR_FORMATS, QR_MAX_URL_LENGTH, QRCodeCache
+from core.quota import QUOTA_POLICIES, QuotaManager
+from core.rate_limits import M_RATE_LIMITED, ClientRateLimiter
+from core.relay import PeerApprovals, RelayAborted, RelayHub
+from core.state import DigestStore, MemoryStateBackend, PinMapping, PinStore, SQLiteDB, SQLiteStateBackend, hash_pin
+from core.transfers import Transfer, TransferScheduler
+
+_IMPORTED = time.perf_counter()
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -51,142 +110,241 @@ if not hasattr(pkgutil, 'get_loader'):
     pkgutil.get_loader = _get_loader
 
 # Configuration
-UPLOAD_FOLDER = Path(__file__).parent / "uploads"
-UPLOAD_FOLDER.mkdir(exist_ok=True)
+UPLOAD_FOLDER = Path(os.environ.get("UPLOAD_FOLDER") or Path(__file__).parent / "uploads")
+# Internal state (partial uploads etc.) lives in a hidden folder inside the uploads
+# directory so renames into UPLOAD_FOLDER stay on the same filesystem (Docker volumes).
+META_FOLDER = UPLOAD_FOLDER / ".wifix"
+PARTIAL_FOLDER = META_FOLDER / "partial"
 ALLOWED_EXTENSIONS = None  # allow all for Phase 1; restrict later if needed
 # By default keep uploaded files until user explicitly deletes them.
 # Set FILE_TTL_SECONDS in the environment to a positive integer to enable automatic cleanup.
 FILE_TTL_SECONDS = int(os.environ.get("FILE_TTL_SECONDS", 0))  # 0 = disabled by default
+# Expiry is deadline-driven; this is only the longest the expiry thread sleeps without
+# re-checking its queue (guards against wall-clock jumps).
 CLEANUP_INTERVAL_SECONDS = int(os.environ.get("CLEANUP_INTERVAL_SECONDS", 60))
+# Maximum number of files expired (and announced) in one batch; deadlines falling within
+# EXPIRY_COALESCE_SECONDS of the first due one join the same batch.
+EXPIRY_BATCH_SIZE = int(os.environ.get("EXPIRY_BATCH_SIZE", 1000))
+EXPIRY_COALESCE_SECONDS = 1.0
+# Resumable (chunked) uploads: suggested chunk size and how long an unfinished upload is kept
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 8 * 1024 * 1024))
+CHUNKED_UPLOAD_TTL_SECONDS = int(os.environ.get("CHUNKED_UPLOAD_TTL_SECONDS", 24 * 3600))
+# Content-addressed deduplication: identical uploads share one blob (hard links)
+DEDUP_ENABLED = os.environ.get("ENABLE_DEDUP", "0") == "1"
+# Bandwidth shaping (bytes per second, 0 = unlimited); the host can change these live
+# over Socket.IO. Transfers of files up to SMALL_FILE_BYTES are never throttled.
+BANDWIDTH_LIMIT_BPS = int(os.environ.get("BANDWIDTH_LIMIT_BPS", 0))
+CLIENT_BANDWIDTH_LIMIT_BPS = int(os.environ.get("CLIENT_BANDWIDTH_LIMIT_BPS", 0))
+SMALL_FILE_BYTES = int(os.environ.get("SMALL_FILE_BYTES", 1024 * 1024))
+# How often the file index checks the uploads folder for changes made outside the app
+INDEX_RECONCILE_SECONDS = float(os.environ.get("INDEX_RECONCILE_SECONDS", 5))
 
 ROOT_DIR = Path(__file__).parent.parent
-# Look for templates at the repository root `templates/` if present so the
-# app can still render a legacy Jinja UI when run from the backend/ folder.
-app = Flask(__name__, template_folder=str(ROOT_DIR / "templates"))
-app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
-app.config["MAX_CONTENT_LENGTH"] = 1024 * 1024 * 1024  # 1 GiB guard (adjust)
-# Session secret for optional PIN flow
-app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
+
+
+class WifixRequest(Flask.request_class):
+    """Request whose multipart file parts can be sent somewhere other than Werkzeug's
+    spooled temp files: a view sets ``file_stream_factory`` before touching ``files``."""
+
+    file_stream_factory = None  # (filename) -> writable sink
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.file_stream_factory is not None:
+            return self.file_stream_factory(filename or '')
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+# Routes and request hooks live on this blueprint; create_app() registers it on each app
+bp = Blueprint('wifix', __name__)
+MAX_CONTENT_LENGTH = 1024 * 1024 * 1024  # 1 GiB guard (adjust)
 
 # Allow cross-origin Socket.IO connections from the frontend dev server (Vite)
 # In production, restrict to specific origins via CORS_ORIGINS environment variable
 ALLOWED_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:5173,http://localhost:5174,http://127.0.0.1:5173').split(',')
 
-# Enable CORS for all HTTP routes with credentials support
-CORS(app, resources={r"/*": {
-    "origins": ALLOWED_ORIGINS,
-    "supports_credentials": True,
-    "allow_headers": ["Content-Type", "Authorization"],
-    "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-}})
+# Optional Socket.IO message queue (e.g. redis://localhost:6379/0) so emits reach clients
+# connected to any worker process when running more than one.
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+socketio = SocketIO()
+
+
+# ---------------------------------------------------------------------------
+# Shared state
+#
+# The host SID lives behind a small backend interface so several worker
+# processes (or nodes sharing the uploads volume) can agree on it:
+#   STATE_BACKEND=memory  per-process (default, single worker only)
+#   STATE_BACKEND=sqlite  SQLite database in WAL mode at STATE_DB
+# File PINs are always kept in STATE_DB (salted hashes), so they survive restarts.
+# ---------------------------------------------------------------------------
+
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'memory')
+STATE_DB = Path(os.environ.get('STATE_DB') or META_FOLDER / 'state.db')  # follows UPLOAD_FOLDER unless set
+PIN_GRANT_TTL_SECONDS = int(os.environ.get('PIN_GRANT_TTL_SECONDS', 12 * 3600))
+if STATE_BACKEND not in ('memory', 'sqlite'):
+    raise RuntimeError(f"Unknown STATE_BACKEND {STATE_BACKEND!r} (expected 'memory' or 'sqlite')")
 
-socketio = SocketIO(app, cors_allowed_origins=ALLOWED_ORIGINS, async_mode='threading')
 
-# Rate limiting configuration
+# Rate limiting configuration (RATELIMIT_ENABLED=false turns it off, e.g. for benchmarks)
+RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+# Request-count limits only guard against floods; transfer endpoints are limited by
+# bytes and concurrent streams instead (see "Client rate limits").
+RATELIMIT_DEFAULT = os.environ.get('RATELIMIT_DEFAULT', '600 per minute')
 limiter = Limiter(
     get_remote_address,
-    app=app,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    default_limits=[RATELIMIT_DEFAULT] if RATELIMIT_DEFAULT else [],
 )
 
-# Runtime state: which connected socket is the current "host" (UI that started the server)
-HOST_SID = None
 
-# Per-file PIN storage: {filename: pin_code}
-FILE_PINS = {}
+# ---------------------------------------------------------------------------
+# Metrics
+#
+# A minimal Prometheus-compatible registry (text exposition format 0.0.4) fed by
+# request hooks, socket handler wrappers, transfers and the expiry thread.
+# Served at /metrics unless ENABLE_METRICS=0.
+# ---------------------------------------------------------------------------
 
+ENABLE_METRICS = os.environ.get('ENABLE_METRICS', '1') == '1'
+ENABLE_PROFILER = os.environ.get('ENABLE_PROFILER', '0') == '1'
+M_HTTP_REQUESTS = METRICS.register(Counter(
+    'wifix_http_requests_total', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status')))
+M_HTTP_LATENCY = METRICS.register(Histogram(
+    'wifix_http_request_duration_seconds', 'Time to produce the response (headers) per endpoint',
+    ('endpoint', 'method')))
+M_LIST_FILES = METRICS.register(Histogram(
+    'wifix_list_files_seconds', 'Time to build a /files listing from the index'))
+M_SOCKET_EVENTS = METRICS.register(Counter(
+    'wifix_socketio_events_total', 'Socket.IO events handled', ('event',)))
+M_SOCKET_EVENT_LATENCY = METRICS.register(Histogram(
+    'wifix_socketio_event_duration_seconds', 'Socket.IO handler duration', ('event',)))
+M_SOCKET_EMITS = METRICS.register(Counter('wifix_socketio_emits_total', 'Socket.IO emits', ('event',)))
+M_SOCKET_EMIT_FAILURES = METRICS.register(Counter(
+    'wifix_socketio_emit_failures_total', 'Socket.IO emits that raised', ('event',)))
+M_SOCKET_CONNECTIONS = METRICS.register(Gauge('wifix_socketio_connections', 'Connected Socket.IO clients'))
+
+
+def _emit(event, *args, **kwargs):
+    """socketio.emit that never raises into the caller but counts (and logs) failures."""
+    M_SOCKET_EMITS.inc(event=event)
+    try:
+        socketio.emit(event, *args, **kwargs)
+    except Exception as e:
+        M_SOCKET_EMIT_FAILURES.inc(event=event)
+        logger.error(f"Failed to emit {event} event: {e}")
+
+
+def _view_name() -> str:
+    """Endpoint of the current request without the blueprint prefix (``list_files``)."""
+    return (request.endpoint or 'unmatched').rpartition('.')[2]
+
+
+def _socket_on(event):
+    """``@socketio.on`` plus per-event count and duration metrics."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                M_SOCKET_EVENTS.inc(event=event)
+                M_SOCKET_EVENT_LATENCY.observe(time.perf_counter() - started, event=event)
+        return socketio.on(event)(wrapper)
+    return decorator
 
-@socketio.on('become_host')
+
+@bp.before_app_request
+def _metrics_start_timer():
+    g.request_started = time.perf_counter()
+
+
+@bp.after_app_request
+def _metrics_record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = _view_name()
+        M_HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        M_HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+PROFILER = SamplingProfiler()
+
+
+@_socket_on('become_host')
 def handle_become_host(data):
     """Mark the calling socket as the host that can approve incoming connection requests."""
-    global HOST_SID
-    HOST_SID = request.sid
-    try:
-        socketio.emit('host_status', {'available': True}, to=HOST_SID)
-    except Exception:
-        pass
+    STATE.set_host_sid(request.sid)
+    _emit('host_status', {'available': True}, to=request.sid)
 
 
-@socketio.on('request_connect')
+@_socket_on('request_connect')
 def handle_request_connect(data):
     """A client requests to connect to the host. Forward this to the host if present.
     Payload can include a display name: { name: 'Alice' }
     """
-    global HOST_SID
     payload = {'sid': request.sid, 'name': data.get('name') if isinstance(data, dict) else None}
-    if HOST_SID:
-        try:
-            socketio.emit('incoming_request', payload, to=HOST_SID)
-        except Exception:
-            pass
+    host_sid = STATE.get_host_sid()
+    if host_sid:
+        _emit('incoming_request', payload, to=host_sid)
     else:
         # no host: notify requester immediately
-        try:
-            socketio.emit('request_denied', {'reason': 'no_host'}, to=request.sid)
-        except Exception:
-            pass
+        _emit('request_denied', {'reason': 'no_host'}, to=request.sid)
 
 
-@socketio.on('approve_request')
+@_socket_on('approve_request')
 def handle_approve_request(data):
     """Host approves a request. Expects { sid: '<requester-sid>' }"""
     target = None
     if isinstance(data, dict):
         target = data.get('sid')
     if target:
-        try:
-            socketio.emit('request_approved', {'by': request.sid}, to=target)
-        except Exception:
-            pass
+        if request.sid == STATE.get_host_sid():
+            PEERS.approve(request.sid, target)
+        _emit('request_approved', {'by': request.sid}, to=target)
 
 
-@socketio.on('deny_request')
+@_socket_on('deny_request')
 def handle_deny_request(data):
     target = None
     if isinstance(data, dict):
         target = data.get('sid')
     if target:
-        try:
-            socketio.emit('request_denied', {'by': request.sid}, to=target)
-        except Exception:
-            pass
+        _emit('request_denied', {'by': request.sid}, to=target)
+
 
+@_socket_on('connect')
+def _on_connect(auth=None):
+    M_SOCKET_CONNECTIONS.inc()
 
-@socketio.on('disconnect')
-def _on_disconnect():
-    """Cleanup host SID if the host disconnects."""
-    global HOST_SID
-    sid = request.sid
-    if HOST_SID == sid:
-        HOST_SID = None
+
+@_socket_on('disconnect')
+def _on_disconnect(*args):
+    """Cleanup host SID (and the peer approvals and pending relays of this socket) on disconnect."""
+    M_SOCKET_CONNECTIONS.dec()
+    PEERS.drop(request.sid)
+    RELAYS.abort_for(request.sid, 'peer disconnected')
+    if STATE.clear_host_sid(request.sid):
         # broadcast to clients that host is gone
-        try:
-            socketio.emit('host_status', {'available': False})
-        except Exception:
-            pass
+        _emit('host_status', {'available': False})
 
 
-@socketio.on('stop_host')
+@_socket_on('stop_host')
 def handle_stop_host(data):
     """Host requests to stop being the host (from frontend). If the calling socket is the registered host,
-    clear HOST_SID and notify clients that host is no longer available.
+    clear the host SID and notify clients that host is no longer available.
     """
-    global HOST_SID
-    sid = request.sid
-    if HOST_SID == sid:
-        HOST_SID = None
-        try:
-            socketio.emit('host_status', {'available': False})
-        except Exception:
-            pass
+    if STATE.clear_host_sid(request.sid):
+        PEERS.drop(request.sid)
+        _emit('host_status', {'available': False})
 
 def allowed_file(filename: str) -> bool:
     if ALLOWED_EXTENSIONS is None:
         return True
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
+@bp.route('/')
 def index():
     """Basic page with a small upload form for Phase 1.
 
@@ -211,60 +369,133 @@ def index():
         return redirect(vite_url)
 
 
-def _detect_lan_ip():
-    """Try to determine the primary LAN IPv4 address for this host.
-    Returns a string IPv4 address (or '127.0.0.1' on failure).
-    """
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # doesn't need to be reachable; used to pick the outbound interface
-        s.connect(('8.8.8.8', 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except Exception:
-        return '127.0.0.1'
+# ---------------------------------------------------------------------------
+# Network interfaces
+#
+# Addresses are enumerated once and cached; a background task refreshes them when
+# the kernel reports an address change (rtnetlink, Linux) or every
+# NETWORK_REFRESH_SECONDS otherwise, so /info does no syscalls.
+# ---------------------------------------------------------------------------
 
+NETWORK_REFRESH_SECONDS = int(os.environ.get('NETWORK_REFRESH_SECONDS', 30))
+# Listen address; '::' serves IPv4 and IPv6 (dual stack) and makes IPv6 URLs reachable
+BIND_HOST = os.environ.get('HOST', '0.0.0.0')
+NETWORK = NetworkInfo(include_ipv6=':' in BIND_HOST, refresh_seconds=NETWORK_REFRESH_SECONDS)
 
-@app.route('/info', methods=['GET'])
+
+@bp.route('/info', methods=['GET'])
 def info():
-    """Return JSON with connection URLs (host_url and lan_url) for device discovery/UI."""
+    """Return JSON with connection URLs (host_url, lan_url and every lan_urls entry) for device discovery/UI."""
     host_url = request.host_url  # includes scheme and trailing slash
-    lan_ip = _detect_lan_ip()
     parsed = urlparse(host_url)
-    # build lan_url by replacing the netloc host with lan_ip (keep port if present)
-    netloc = lan_ip
-    if parsed.port:
-        netloc = f"{lan_ip}:{parsed.port}"
-    lan_url = urlunparse((parsed.scheme, netloc, parsed.path, parsed.params, parsed.query, parsed.fragment))
-    return jsonify({'host_url': host_url, 'lan_url': lan_url, 'lan_ip': lan_ip})
+    lan_urls = NETWORK.urls(parsed.port, parsed.scheme)
+    return jsonify({'host_url': host_url, 'lan_url': lan_urls[0], 'lan_ip': NETWORK.primary,
+                    'lan_urls': lan_urls, 'storage': QUOTA.usage()})
+
+
+# ---------------------------------------------------------------------------
+# In-memory file index
+#
+# Upload, delete and cleanup update the index directly; a background reconcile
+# loop stats the uploads *directory* (one syscall) and only rescans when its
+# mtime changes, which catches files added or removed behind the app's back.
+# ---------------------------------------------------------------------------
+
+def index_reconcile_worker():
+    """Background thread picking up changes made to UPLOAD_FOLDER outside the app."""
+    while True:
+        time.sleep(INDEX_RECONCILE_SECONDS)
+        try:
+            FILE_INDEX.reconcile()
+        except Exception as e:
+            logger.warning(f"File index reconcile failed: {e}")
+
+
+# ---------------------------------------------------------------------------
+# File change feed
+#
+# Every index mutation gets a sequence number. Mutations are coalesced for
+# FEED_COALESCE_SECONDS (last op per file wins) and broadcast as one
+# ``files_changed`` event to the sockets that called ``subscribe_files``. A bounded
+# replay log lets a reconnecting client catch up from its last seq; if it fell
+# off the log (or the server restarted, see ``epoch``) it gets ``files_snapshot``.
+# ---------------------------------------------------------------------------
+
+FEED_REPLAY_SIZE = int(os.environ.get('FEED_REPLAY_SIZE', 1000))
+FEED_COALESCE_SECONDS = 0.25
+FEED_ROOM = 'files'
 
 
-@app.route('/files', methods=['GET'])
+@_socket_on('subscribe_files')
+def handle_subscribe_files(data):
+    """Join the change feed. Payload: { since: <seq>, epoch: '<epoch>' } from the last
+    event seen, or nothing for a fresh snapshot."""
+    if PIN_ENABLED and not session.get('authed'):
+        _emit('files_error', {'error': 'unauthorized'}, to=request.sid)
+        return
+    since = epoch = None
+    if isinstance(data, dict):
+        epoch = data.get('epoch')
+        try:
+            since = int(data['since']) if data.get('since') is not None else None
+        except (TypeError, ValueError):
+            since = None
+    join_room(FEED_ROOM)
+    INDEX_READY.wait(INDEX_READY_TIMEOUT_SECONDS)  # a snapshot before the first scan would be empty
+    event, payload = FEED.catch_up(since, epoch)
+    _emit(event, payload, to=request.sid)
+
+
+@_socket_on('unsubscribe_files')
+def handle_unsubscribe_files(data=None):
+    leave_room(FEED_ROOM)
+
+
+@bp.route('/files', methods=['GET'])
 @limiter.exempt
 def list_files():
-    """Return list of available uploaded files as JSON.
-    Each item: { filename, url, mtime, has_pin }
+    """Return list of available uploaded files as JSON, served from the in-memory index.
+    Each item: { filename, url, mtime, size, type, has_pin, sha256 }
+
+    Optional query params: ``since`` (unix mtime) for incremental listing, ``limit``
+    and ``cursor`` for pagination (the next cursor is sent in ``X-Next-Cursor``).
+    Responses carry an ETag; an unchanged listing answers ``If-None-Match`` with 304.
     """
     # Enforce PIN if enabled: listing requires auth to see files in the UI
     if PIN_ENABLED and not session.get('authed'):
         return jsonify({'error': 'unauthorized'}), 401
 
-    uploads = Path(app.config['UPLOAD_FOLDER'])
-    items = []
-    for p in uploads.iterdir():
-        if p.is_file():
-            items.append({
-                'filename': p.name,
-                'url': url_for('download_file', filename=p.name, _external=True),
-                'mtime': p.stat().st_mtime,
-                'size': p.stat().st_size,
-                'type': p.suffix.lower().lstrip('.') if p.suffix else '',
-                'has_pin': p.name in FILE_PINS,
-            })
-    # sort newest first
-    items.sort(key=lambda x: x['mtime'], reverse=True)
-    return jsonify(items)
+    try:
+        since = float(request.args['since']) if 'since' in request.args else None
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        cursor = FileIndex.decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'invalid listing parameters'}), 400
+    if limit is not None and limit <= 0:
+        return jsonify({'error': 'invalid listing parameters'}), 400
+
+    etag = FILE_INDEX.etag_for(since, cursor, limit)
+    inm = request.headers.get('If-None-Match')
+    if inm and etag in [t.strip() for t in inm.split(',')]:
+        return Response(status=304, headers={'ETag': etag})
+
+    entries, next_cursor = FILE_INDEX.page(since=since, cursor=cursor, limit=limit)
+    root = request.url_root
+    items = [{
+        'filename': e['filename'],
+        'url': root + e['path'],
+        'mtime': e['mtime'],
+        'size': e['size'],
+        'type': e['type'],
+        'has_pin': e['has_pin'],
+        'sha256': e['sha256'],
+    } for e in entries]
+    resp = jsonify(items)
+    resp.headers['ETag'] = etag
+    resp.headers['Cache-Control'] = 'no-cache'
+    if next_cursor:
+        resp.headers['X-Next-Cursor'] = next_cursor
+    return resp
 
 
 # Simple PIN-based access control (optional)
@@ -272,110 +503,1127 @@ PIN_ENABLED = os.environ.get('ACCESS_PIN') is not None
 PIN_VALUE = os.environ.get('ACCESS_PIN')
 
 
-@app.route('/auth/status', methods=['GET'])
+@bp.route('/auth/status', methods=['GET'])
 def auth_status():
     return jsonify({'pin_required': PIN_ENABLED, 'authed': bool(session.get('authed'))})
 
 
-@app.route('/auth', methods=['POST'])
+@bp.route('/auth', methods=['POST'])
 def auth():
     if not PIN_ENABLED:
         return jsonify({'ok': True, 'authed': True})
     data = request.get_json() or {}
     pin = data.get('pin')
-    if pin and PIN_VALUE and pin == PIN_VALUE:
+    if isinstance(pin, str) and PIN_VALUE and hmac.compare_digest(pin.encode(), PIN_VALUE.encode()):
         session['authed'] = True
         return jsonify({'ok': True, 'authed': True})
     return jsonify({'ok': False, 'authed': False}), 401
 
 
-@app.route('/auth/logout', methods=['POST'])
+@bp.route('/auth/logout', methods=['POST'])
 def auth_logout():
     session.pop('authed', None)
     return jsonify({'ok': True})
 
-@app.route('/upload', methods=['POST'])
-@limiter.limit("10 per minute")
+
+
+# ---------------------------------------------------------------------------
+# Client rate limits
+#
+# Request counts say little about cost on a file share, so transfer endpoints are
+# limited by what they move instead: bytes per client over a sliding window
+# (two fixed-window counters interpolated, O(1) memory per client) and the
+# number of concurrent transfers. Both budgets shrink while the server is busy
+# (many active transfers, a deep disk queue). A client over its byte budget gets
+# 429 for new transfers and has running ones paced to the sustainable rate.
+# Idle clients are evicted so thousands of addresses stay cheap.
+# ---------------------------------------------------------------------------
+
+RATE_WINDOW_SECONDS = float(os.environ.get('RATE_WINDOW_SECONDS', 600))
+RATE_BYTES_PER_WINDOW = int(os.environ.get('RATE_BYTES_PER_WINDOW', 10 * 1024 ** 3))
+RATE_MAX_STREAMS = int(os.environ.get('RATE_MAX_STREAMS', 8))
+RATE_MAX_CLIENTS = int(os.environ.get('RATE_MAX_CLIENTS', 10000))
+# Load at which limits start to shrink, and the floor they shrink to
+RATE_LOAD_TRANSFERS = int(os.environ.get('RATE_LOAD_TRANSFERS', 32))
+RATE_LOAD_DISK_QUEUE = int(os.environ.get('RATE_LOAD_DISK_QUEUE', 16))
+RATE_MIN_SCALE = float(os.environ.get('RATE_MIN_SCALE', 0.25))
+
+def _server_load():
+    """(active transfers, disk operations in flight or queued) for the rate limiter."""
+    return TRANSFERS.active_count(), io_inflight() + io_queued()
+
+
+def rate_limited(view):
+    """Guard a transfer endpoint with the byte/stream limiter instead of a request count."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if RATES.enabled:
+            refused = RATES.admit(get_remote_address())
+            if refused:
+                reason, retry_after = refused
+                M_RATE_LIMITED.inc(reason=reason)
+                logger.warning(f"Rate limited {get_remote_address()} on {request.path}: {reason}")
+                resp = jsonify({'error': 'rate limited', 'reason': reason, 'retry_after': int(retry_after) + 1})
+                resp.status_code = 429
+                resp.headers['Retry-After'] = str(int(retry_after) + 1)
+                return resp
+        return view(*args, **kwargs)
+    return limiter.exempt(wrapper)
+
+
+def _start_download(filename, size) -> Transfer:
+    """A download transfer, closed when the response is (whatever the view does after this)."""
+    t = TRANSFERS.start('download', filename, size)
+    g.setdefault('downloads', []).append(t)
+    return t
+
+
+@bp.after_app_request
+def _close_downloads_with_response(response):
+    for t in g.pop('downloads', ()):
+        response.call_on_close(t.close)
+    return response
+
+
+@bp.teardown_app_request
+def _close_request_transfers(exc=None):
+    # uploads end with the request; downloads only if no response took them over
+    for t in g.pop('transfers', []) + g.pop('downloads', []):
+        t.close()
+    QUOTA.release(g.pop('quota_reserved', 0))
+
+
+@_socket_on('set_bandwidth_limits')
+def handle_set_bandwidth_limits(data):
+    """Host changes shaping live. Expects any of
+    { global_bps, client_bps, small_file_bytes, weights: { '<client ip>': weight } }.
+    """
+    if request.sid != STATE.get_host_sid():
+        return
+    if isinstance(data, dict):
+        try:
+            TRANSFERS.set_limits(data.get('global_bps'), data.get('client_bps'),
+                                 data.get('small_file_bytes'), data.get('weights'))
+            logger.info(f"Bandwidth limits updated: {TRANSFERS.limits()}")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Ignoring invalid bandwidth limits {data!r}: {e}")
+    _emit('bandwidth_limits', TRANSFERS.limits(), to=request.sid)
+
+
+@_socket_on('get_transfer_stats')
+def handle_get_transfer_stats(data=None):
+    """Host asks who is using the link; replies with per-transfer throughput."""
+    if request.sid != STATE.get_host_sid():
+        return
+    _emit('transfer_stats', TRANSFERS.stats(), to=request.sid)
+
+
+def _saved_name_for(original: str) -> str:
+    """Build the on-disk name for an uploaded file: ``{timestamp}_{secure name}``."""
+    filename = secure_filename(original)
+    # Limit filename length
+    if len(filename) > 255:
+        name, ext = os.path.splitext(filename)
+        filename = name[:250] + ext
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+    return f"{timestamp}_{filename}"
+
+
+def _client_sha256(field=None):
+    """The SHA-256 (hex) a client expects its upload to have, or None if it sent none.
+
+    Taken from a ``sha256`` form/query/JSON ``field``, an RFC 9530 ``Repr-Digest``
+    or ``Content-Digest`` header (``sha-256=:<base64>:``) or a legacy RFC 3230
+    ``Digest`` header (``SHA-256=<base64>``). Raises ValueError when malformed.
+    """
+    if field:
+        digest = str(field).strip().lower()
+        if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+            raise ValueError('invalid sha256')
+        return digest
+    for header in ('Repr-Digest', 'Content-Digest', 'Digest'):
+        for item in request.headers.get(header, '').split(','):
+            algorithm, _, value = item.strip().partition('=')
+            if algorithm.lower() != 'sha-256':
+                continue
+            try:
+                raw = base64.b64decode(value.strip().strip(':'), validate=True)
+            except ValueError:
+                raise ValueError(f'invalid {header}')
+            if len(raw) != 32:
+                raise ValueError(f'invalid {header}')
+            return raw.hex()
+    return None
+
+
+def _checksum_mismatch(expected: str, actual: str):
+    logger.warning(f"Upload checksum mismatch: expected {expected[:12]}, got {actual[:12]}")
+    return jsonify({'error': 'checksum mismatch', 'expected': expected, 'sha256': actual}), 400
+
+
+
+
+def _remove_upload(path: Path):
+    """Delete a visible upload (releasing its blob when deduplication is on)."""
+    if DEDUP_ENABLED:
+        BLOBS.unlink(path)
+    else:
+        path.unlink()
+
+
+def _publish_upload(tmp: Path, dest: Path, digest: str = None) -> bool:
+    """Move a completely written temp file to ``dest``; returns True if deduplicated."""
+    if DEDUP_ENABLED:
+        return BLOBS.adopt(tmp, digest or hash_file(tmp), dest)
+    os.replace(tmp, dest)
+    return False
+
+
+def _parse_ttl(value):
+    """Parse an optional per-file TTL in seconds; raises ValueError on bad input."""
+    if value in (None, ''):
+        return None
+    ttl = int(value)
+    if ttl <= 0:
+        raise ValueError('ttl must be a positive number of seconds')
+    return ttl
+
+
+def _finalize_upload(saved_name: str, dest: Path, file_pin: str = '', started: float = None,
+                     ttl: int = None, deduplicated: bool = False, pin_hash: str = '', sha256: str = None,
+                     announce: bool = True, download_url: str = None):
+    """Common bookkeeping once an upload has landed at ``dest``.
+
+    Stores the optional PIN, per-file TTL and content digest, notifies connected clients
+    (unless ``announce`` is False; batches send one event for all their files) and
+    returns the JSON response body shared by all upload flavours. When
+    ``started`` (a ``time.perf_counter()`` value) is given, throughput and peak
+    RSS are logged and included in the response.
+    """
+    # the file now counts as used space; drop the request's reservation
+    QUOTA.release(g.pop('quota_reserved', 0))
+    # Store PIN if provided
+    if file_pin:
+        FILE_PINS[saved_name] = file_pin
+    elif pin_hash:
+        PIN_STORE.set_hash(saved_name, pin_hash)
+    if file_pin or pin_hash:
+        logger.info(f"PIN set for file: {saved_name}")
+
+    if sha256:
+        DIGESTS.set(saved_name, sha256, dest.stat())
+    size = FILE_INDEX.add(dest)['size']
+    if ttl:
+        EXPIRY.schedule(saved_name, time.time() + ttl, persist=True)
+    download_url = download_url or url_for('wifix.download_file', filename=saved_name, _external=True)
+    stats = None
+    if started is not None:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        stats = {
+            'bytes': size,
+            'seconds': round(elapsed, 4),
+            'mb_per_s': round(size / elapsed / 1e6, 2),
+            'peak_rss': peak_rss_bytes(),
+        }
+        logger.info(f"File uploaded successfully: {saved_name} ({size} bytes, "
+                    f"{stats['mb_per_s']} MB/s, peak RSS {stats['peak_rss']})")
+    else:
+        logger.info(f"File uploaded successfully: {saved_name} ({size} bytes)")
+    # notify via socketio (if clients connected)
+    if announce:
+        _emit('file_uploaded', {
+            'filename': saved_name,
+            'url': download_url,
+            'size': size,
+            'has_pin': bool(file_pin or pin_hash),
+            'sha256': sha256,
+        })
+    body = {
+        'filename': saved_name,
+        'url': download_url,
+        'has_pin': bool(file_pin or pin_hash),
+        'sha256': sha256,
+    }
+    expires = EXPIRY.deadline(saved_name)
+    if expires:
+        body['expires_at'] = expires
+    if DEDUP_ENABLED:
+        body['deduplicated'] = deduplicated
+    if stats:
+        body['stats'] = stats
+    return body
+
+
+@bp.route('/upload', methods=['POST'])
+@rate_limited
 def upload_file():
     # expects form field named 'file' and optional 'pin' field
     # enforce auth when PIN is enabled
+    started = time.perf_counter()
     if PIN_ENABLED and not session.get('authed'):
         logger.warning(f"Unauthorized upload attempt from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
+    if not QUOTA.reserve(request.content_length):
+        return _insufficient_storage()
+    g.quota_reserved = request.content_length
+    transfer = TRANSFERS.wrap_input(None, request.content_length)
     if 'file' not in request.files:
         return jsonify({'error': 'no file part'}), 400
     f = request.files['file']
     if f.filename == '':
         return jsonify({'error': 'no selected file'}), 400
     
-    # Get optional PIN from form data
+    # Get optional PIN and TTL from form data
     file_pin = request.form.get('pin', '').strip()
+    try:
+        ttl = _parse_ttl(request.form.get('ttl'))
+    except ValueError:
+        return jsonify({'error': 'invalid ttl'}), 400
+    try:
+        expected = _client_sha256(request.form.get('sha256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     if f and allowed_file(f.filename):
         filename = secure_filename(f.filename)
-        # Limit filename length
-        if len(filename) > 255:
-            name, ext = os.path.splitext(filename)
-            filename = name[:250] + ext
-        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
-        saved_name = f"{timestamp}_{filename}"
-        dest = Path(app.config['UPLOAD_FOLDER']) / saved_name
+        saved_name = _saved_name_for(f.filename)
+        transfer.filename = saved_name
+        dest = UPLOAD_FOLDER / saved_name
+        hasher = hashlib.sha256()
+        tmp = PARTIAL_FOLDER / f"{uuid.uuid4().hex}.upload"
         try:
-            f.save(dest)
-            
-            # Store PIN if provided
-            if file_pin:
-                FILE_PINS[saved_name] = file_pin
-                logger.info(f"PIN set for file: {saved_name}")
-            
-            download_url = url_for('download_file', filename=saved_name, _external=True)
-            logger.info(f"File uploaded successfully: {saved_name} ({dest.stat().st_size} bytes)")
-            # notify via socketio (if clients connected)
-            try:
-                socketio.emit('file_uploaded', {
-                    'filename': saved_name, 
-                    'url': download_url, 
-                    'size': dest.stat().st_size,
-                    'has_pin': bool(file_pin)
-                }, broadcast=True)
-            except Exception as e:
-                logger.error(f"Failed to emit file_uploaded event: {e}")
-            return jsonify({
-                'filename': saved_name, 
-                'url': download_url,
-                'has_pin': bool(file_pin)
-            }), 201
+            with open(tmp, 'wb') as fh:
+                copy_stream(f.stream, fh, hasher=hasher)
+            digest = hasher.hexdigest()
+            if expected and expected != digest:
+                return _checksum_mismatch(expected, digest)
+            deduplicated = _publish_upload(tmp, dest, digest)
+            return jsonify(_finalize_upload(saved_name, dest, file_pin, started, ttl, deduplicated,
+                                            sha256=digest)), 201
         except Exception as e:
             logger.error(f"Upload failed for {filename}: {e}")
             return jsonify({'error': 'upload failed', 'detail': str(e)}), 500
+        finally:
+            if tmp.exists():
+                tmp.unlink()
     return jsonify({'error': 'file type not allowed'}), 400
 
-@app.route('/download/<path:filename>', methods=['GET'])
+
+@bp.route('/upload/digest', methods=['POST'])
+@rate_limited
+def upload_by_digest():
+    """Publish a file by content hash without sending its bytes.
+
+    Expects JSON { sha256, filename, pin?, ttl? }. Answers 201 like ``/upload``
+    when the blob is already stored, 404 when the client has to upload it.
+    """
+    started = time.perf_counter()
+    if PIN_ENABLED and not session.get('authed'):
+        logger.warning(f"Unauthorized upload attempt from {request.remote_addr}")
+        return jsonify({'error': 'unauthorized'}), 401
+    if not DEDUP_ENABLED:
+        return jsonify({'error': 'deduplication disabled'}), 404
+    data = request.get_json(silent=True) or {}
+    digest = str(data.get('sha256') or '').lower()
+    original = str(data.get('filename') or '')
+    if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+        return jsonify({'error': 'invalid sha256'}), 400
+    if not original or not secure_filename(original):
+        return jsonify({'error': 'no selected file'}), 400
+    if not allowed_file(original):
+        return jsonify({'error': 'file type not allowed'}), 400
+    try:
+        ttl = _parse_ttl(data.get('ttl'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid ttl'}), 400
+    if not BLOBS.exists(digest):
+        return jsonify({'error': 'unknown digest'}), 404
+
+    saved_name = _saved_name_for(original)
+    dest = UPLOAD_FOLDER / saved_name
+    try:
+        BLOBS.link(digest, dest)
+    except FileNotFoundError:
+        # blob released between the check and the link
+        return jsonify({'error': 'unknown digest'}), 404
+    except Exception as e:
+        logger.error(f"Digest upload failed for {original}: {e}")
+        return jsonify({'error': 'upload failed', 'detail': str(e)}), 500
+    pin = str(data.get('pin') or '').strip()
+    return jsonify(_finalize_upload(saved_name, dest, pin, started, ttl, deduplicated=True, sha256=digest)), 201
+
+
+@bp.route('/upload/stream', methods=['POST', 'PUT'])
+@rate_limited
+def upload_stream():
+    """Raw-body upload: ``?filename=<name>&pin=<optional>&ttl=<optional>`` with the file bytes as the body.
+
+    Unlike ``/upload`` this bypasses multipart parsing, so the body is never
+    spooled to a temporary file by Werkzeug: it is copied from ``request.stream``
+    straight into a partial file and atomically renamed into place.
+    """
+    started = time.perf_counter()
+    if PIN_ENABLED and not session.get('authed'):
+        logger.warning(f"Unauthorized upload attempt from {request.remote_addr}")
+        return jsonify({'error': 'unauthorized'}), 401
+    original = request.args.get('filename', '')
+    if not original or not secure_filename(original):
+        return jsonify({'error': 'no selected file'}), 400
+    if not allowed_file(original):
+        return jsonify({'error': 'file type not allowed'}), 400
+    length = request.content_length
+    if length is None:
+        return jsonify({'error': 'content-length required'}), 411
+    file_pin = request.args.get('pin', '').strip()
+    try:
+        ttl = _parse_ttl(request.args.get('ttl'))
+    except ValueError:
+        return jsonify({'error': 'invalid ttl'}), 400
+    try:
+        expected = _client_sha256(request.args.get('sha256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not QUOTA.reserve(length):
+        return _insufficient_storage()
+    g.quota_reserved = length
+
+    saved_name = _saved_name_for(original)
+    dest = UPLOAD_FOLDER / saved_name
+    tmp = PARTIAL_FOLDER / f"{uuid.uuid4().hex}.stream"
+    hasher = hashlib.sha256()
+    TRANSFERS.wrap_input(saved_name, length)
+    try:
+        with open(tmp, 'wb') as fh:
+            written = copy_stream(request.stream, fh, length, hasher)
+        if written != length:
+            raise IOError(f"connection closed after {written} of {length} bytes")
+        digest = hasher.hexdigest()
+        if expected and expected != digest:
+            return _checksum_mismatch(expected, digest)
+        deduplicated = _publish_upload(tmp, dest, digest)
+        return jsonify(_finalize_upload(saved_name, dest, file_pin, started, ttl, deduplicated,
+                                        sha256=digest)), 201
+    except Exception as e:
+        logger.error(f"Streaming upload failed for {original}: {e}")
+        return jsonify({'error': 'upload failed', 'detail': str(e)}), 500
+    finally:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Resumable chunked uploads
+#
+# init -> PUT chunks at arbitrary offsets (possibly in parallel) -> finalize.
+# Chunks are written straight into a preallocated file under PARTIAL_FOLDER, and
+# the received byte ranges are persisted next to it so an upload survives both
+# dropped connections and server restarts.
+# ---------------------------------------------------------------------------
+
+CHUNK_FINALIZE_WAIT_SECONDS = 30  # finalize waits this long for in-flight chunk PUTs
+
+
+@bp.route('/upload/chunked', methods=['POST'])
+@rate_limited
+def chunked_upload_init():
+    """Start a resumable upload. Expects JSON { filename, size, pin?, ttl?, sha256? }."""
+    if PIN_ENABLED and not session.get('authed'):
+        logger.warning(f"Unauthorized upload attempt from {request.remote_addr}")
+        return jsonify({'error': 'unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '')
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid size'}), 400
+    try:
+        ttl = _parse_ttl(data.get('ttl'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid ttl'}), 400
+    try:
+        expected = _client_sha256(data.get('sha256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not filename or not secure_filename(filename):
+        return jsonify({'error': 'no selected file'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'file type not allowed'}), 400
+    if size < 0 or size > current_app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'file too large'}), 413
+
+    CHUNKED_UPLOADS.purge_stale()
+    pin = str(data.get('pin') or '').strip()
+    up = CHUNKED_UPLOADS.new(filename, size, hash_pin(pin) if pin else '', ttl=ttl, sha256=expected)
+    if not QUOTA.reserve(size):
+        return _insufficient_storage()
+    up.reserved = size
+    try:
+        preallocate(up.data_path, size)
+        up.save_meta()
+    except Exception as e:
+        up.discard()
+        logger.error(f"Chunked upload init failed for {filename}: {e}")
+        return jsonify({'error': 'upload failed', 'detail': str(e)}), 500
+    CHUNKED_UPLOADS.add(up)
+    logger.info(f"Chunked upload started: {up.upload_id} ({filename}, {size} bytes)")
+    return jsonify(up.status()), 201
+
+
+@bp.route('/upload/chunked/<upload_id>', methods=['GET'])
+@limiter.exempt
+def chunked_upload_status(upload_id):
+    """Report received ranges so a client can resume from the last acknowledged offset."""
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    up = CHUNKED_UPLOADS.get(upload_id)
+    if not up:
+        return jsonify({'error': 'upload not found'}), 404
+    with up.lock:
+        return jsonify(up.status())
+
+
+@bp.route('/upload/chunked/<upload_id>', methods=['PUT'])
+@rate_limited
+def chunked_upload_put(upload_id):
+    """Write the raw request body at ``?offset=N``. Chunks may arrive in any order and in parallel."""
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    up = CHUNKED_UPLOADS.get(upload_id)
+    if not up:
+        return jsonify({'error': 'upload not found'}), 404
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'invalid offset'}), 400
+    length = request.content_length
+    if length is None:
+        return jsonify({'error': 'content-length required'}), 411
+    if offset < 0 or offset + length > up.size:
+        return jsonify({'error': 'chunk outside file bounds'}), 416
+    if not up.begin_write():
+        return jsonify({'error': 'upload is being finalized'}), 409
+
+    written = 0
+    # A chunk starting exactly where the hashed prefix ends is hashed as it is written.
+    inline = offset == up.hashed and up.hash_lock.acquire(blocking=False)
+    if inline and offset != up.hashed:
+        up.hash_lock.release()
+        inline = False
+    TRANSFERS.wrap_input(up.filename, length)
+    try:
+        # Each request gets its own descriptor, so parallel chunks never share a file position.
+        with open(up.data_path, 'r+b') as fh:
+            fh.seek(offset)
+            while written < length:
+                buf = request.stream.read(min(STREAM_BUFFER_SIZE, length - written))
+                if not buf:
+                    break
+                run_io(fh.write, buf)
+                written += len(buf)
+                if inline:
+                    up.hasher.update(buf)
+                    up.hashed += len(buf)
+    except Exception as e:
+        logger.warning(f"Chunk write interrupted for {upload_id} at {offset + written}: {e}")
+    finally:
+        if inline:
+            up.hash_lock.release()
+        # Keep whatever made it to disk; a dropped link only loses the unwritten tail.
+        status = up.end_write(offset, offset + written)
+    if written < length:
+        return jsonify({'error': 'incomplete chunk', **status}), 400
+    up.advance_hash()
+    return jsonify(status), 200
+
+
+@bp.route('/upload/chunked/<upload_id>/finalize', methods=['POST'])
+@rate_limited
+def chunked_upload_finalize(upload_id):
+    """Move a fully received upload into the uploads folder and announce it.
+
+    The expected SHA-256 may be given here (JSON ``sha256`` or a digest header)
+    instead of at init; on a mismatch the upload is discarded.
+    """
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        expected = _client_sha256((request.get_json(silent=True) or {}).get('sha256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    up = CHUNKED_UPLOADS.get(upload_id)
+    if not up:
+        return jsonify({'error': 'upload not found'}), 404
+    if not up.close(CHUNK_FINALIZE_WAIT_SECONDS):
+        return jsonify({'error': 'chunks still being written', **up.status()}), 409
+    with up.lock:
+        if not up.complete:
+            up.closed = False
+            return jsonify({'error': 'upload incomplete', **up.status()}), 409
+    if CHUNKED_UPLOADS.pop(upload_id) is not up:
+        return jsonify({'error': 'upload not found'}), 404  # finalized concurrently
+
+    saved_name = _saved_name_for(up.filename)
+    dest = UPLOAD_FOLDER / saved_name
+    try:
+        digest = up.digest()
+        expected = expected or up.sha256
+        if expected and expected != digest:
+            up.discard()
+            return _checksum_mismatch(expected, digest)
+        deduplicated = _publish_upload(up.data_path, dest, digest)
+        up.discard()
+        return jsonify(_finalize_upload(saved_name, dest, pin_hash=up.pin_hash, ttl=up.ttl,
+                                         deduplicated=deduplicated, sha256=digest)), 201
+    except Exception as e:
+        CHUNKED_UPLOADS.add(up)
+        up.reopen()
+        logger.error(f"Finalize failed for chunked upload {upload_id}: {e}")
+        return jsonify({'error': 'upload failed', 'detail': str(e)}), 500
+
+
+@bp.route('/upload/chunked/<upload_id>', methods=['DELETE'])
+@limiter.exempt
+def chunked_upload_abort(upload_id):
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    up = CHUNKED_UPLOADS.pop(upload_id)
+    if not up:
+        return jsonify({'error': 'upload not found'}), 404
+    up.discard()
+    return jsonify({'ok': True}), 200
+
+
+def _file_body(path: Path, start: int, length: int, transfer: Transfer, fh=None):
+    """Response body for one contiguous region of ``path`` (or of ``fh``, already open).
+
+    When the WSGI server offers ``wsgi.file_wrapper`` (gunicorn does, and uses
+    ``os.sendfile`` for it) the open file is handed over positioned at ``start``;
+    the server stops after Content-Length bytes. Otherwise, or when bandwidth
+    shaping has to pace the bytes, we stream in chunks.
+    """
+    wrapper = request.environ.get('wsgi.file_wrapper')
+    if wrapper is not None and not (TRANSFERS.limited and transfer.shaped):
+        fh = fh or open(path, 'rb')
+        fh.seek(start)
+        return wrapper(fh, 256 * 1024)
+    return transfer.wrap_iter(iter_file(path, start, length, fh=fh))
+
+
+# ---------------------------------------------------------------------------
+# Batch uploads
+#
+# Many files in one request: multipart with any number of file parts, or a TAR
+# stream (optionally gzip/bz2/xz compressed). Each file is written straight into
+# PARTIAL_FOLDER while the body is parsed (a stream factory replaces Werkzeug's
+# spooled temp files) and hashed on the way; the disk writes go through a small
+# I/O pool so parsing the next buffer overlaps with writing the previous one.
+# Everything is published together at the end: one manifest, one
+# ``files_uploaded`` event and one rate-limit hit per batch.
+# ---------------------------------------------------------------------------
+
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+BATCH_IO_WORKERS = int(os.environ.get('BATCH_IO_WORKERS', 4))
+
+_batch_io_pool = None
+_batch_io_lock = threading.Lock()
+
+
+def _batch_pool():
+    global _batch_io_pool
+    with _batch_io_lock:
+        if _batch_io_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _batch_io_pool = ThreadPoolExecutor(BATCH_IO_WORKERS, thread_name_prefix='batch-io')
+        return _batch_io_pool
+
+
+def _batch_part(original: str, parts: list, skipped: list):
+    """New sink for a file called ``original``, or a discarding one with the reason recorded."""
+    if len(parts) >= BATCH_MAX_FILES:
+        skipped.append({'name': original, 'error': 'too many files'})
+    elif not original or not secure_filename(original):
+        skipped.append({'name': original, 'error': 'no selected file'})
+    elif not allowed_file(original):
+        skipped.append({'name': original, 'error': 'file type not allowed'})
+    else:
+        part = BatchPart(original, PARTIAL_FOLDER, _batch_pool)
+        parts.append(part)
+        return part
+    return DiscardPart(original)
+
+
+def _unique_saved_name(original: str, taken: set) -> str:
+    """``_saved_name_for`` plus a counter when a batch holds the same name twice in one second."""
+    saved = _saved_name_for(original)
+    stem, ext = os.path.splitext(saved)
+    n = 1
+    while saved in taken or (UPLOAD_FOLDER / saved).exists():
+        saved = f"{stem}_{n}{ext}"
+        n += 1
+    taken.add(saved)
+    return saved
+
+
+@bp.route('/upload/batch', methods=['POST'])
+@rate_limited
+def upload_batch():
+    """Upload many files in one request.
+
+    Either ``multipart/form-data`` with any number of file parts (plus optional
+    ``pin`` and ``ttl`` fields applying to all of them), or a TAR archive as the
+    raw body (``Content-Type: application/x-tar``, ``?pin=&ttl=``). Answers 201
+    with { files: [...], skipped: [{name, error}], stats }.
+    """
+    started = time.perf_counter()
+    if PIN_ENABLED and not session.get('authed'):
+        logger.warning(f"Unauthorized upload attempt from {request.remote_addr}")
+        return jsonify({'error': 'unauthorized'}), 401
+    if request.content_length is None:
+        return jsonify({'error': 'content-length required'}), 411
+    if not QUOTA.reserve(request.content_length):
+        return _insufficient_storage()
+    g.quota_reserved = request.content_length
+    transfer = TRANSFERS.wrap_input('batch', request.content_length)
+
+    parts, skipped = [], []
+    try:
+        if request.mimetype == 'multipart/form-data':
+            request.file_stream_factory = lambda filename: _batch_part(filename, parts, skipped)
+            request.files  # parse the whole body, writing parts as they stream past
+            fields = request.form
+        else:
+            read_tar(request.stream, lambda name: _batch_part(name, parts, skipped), skipped)
+            fields = request.args
+        for part in parts:
+            part.finish()
+    except Exception as e:
+        for part in parts:
+            part.discard()
+        logger.error(f"Batch upload failed after {len(parts)} file(s): {e}")
+        return jsonify({'error': 'upload failed', 'detail': str(e)}), 400 if isinstance(e, tarfile.TarError) else 500
+
+    pin = str(fields.get('pin') or '').strip()
+    try:
+        ttl = _parse_ttl(fields.get('ttl'))
+    except ValueError:
+        ttl = None
+        skipped.extend({'name': p.original, 'error': 'invalid ttl'} for p in parts)
+        for part in parts:
+            part.discard()
+        parts = []
+    if not parts:
+        return jsonify({'error': 'no files uploaded', 'skipped': skipped}), 400
+
+    transfer.filename = f'{len(parts)} files'
+    pin_hash = hash_pin(pin) if pin else ''  # one key derivation for the whole batch
+    root = request.url_root
+    taken = set()
+    manifest = []
+    reserved = g.pop('quota_reserved', 0)  # held until every file is indexed, not just the first
+    try:
+        for part in parts:
+            saved_name = _unique_saved_name(part.original, taken)
+            dest = UPLOAD_FOLDER / saved_name
+            digest = part.hasher.hexdigest()
+            deduplicated = _publish_upload(part.tmp, dest, digest)
+            body = _finalize_upload(saved_name, dest, ttl=ttl, deduplicated=deduplicated, pin_hash=pin_hash,
+                                    sha256=digest, announce=False, download_url=root + 'download/' + quote(saved_name))
+            manifest.append(dict(body, original=part.original, size=part.size))
+    except Exception as e:
+        logger.error(f"Batch upload failed while publishing: {e}")
+        for part in parts:
+            part.discard()
+        return jsonify({'error': 'upload failed', 'detail': str(e), 'files': manifest}), 500
+    finally:
+        QUOTA.release(reserved)
+
+    total = sum(f['size'] for f in manifest)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    stats = {'files': len(manifest), 'bytes': total, 'seconds': round(elapsed, 4),
+             'mb_per_s': round(total / elapsed / 1e6, 2), 'peak_rss': peak_rss_bytes()}
+    logger.info(f"Batch uploaded: {len(manifest)} file(s), {total} bytes, {stats['mb_per_s']} MB/s"
+                f"{f', {len(skipped)} skipped' if skipped else ''}")
+    _emit('files_uploaded', {'files': [{k: f[k] for k in ('filename', 'url', 'size', 'has_pin', 'sha256')}
+                                       for f in manifest]})
+    return jsonify({'files': manifest, 'skipped': skipped, 'stats': stats}), 201
+
+
+# ---------------------------------------------------------------------------
+# Delta uploads
+#
+# rsync-style updates of a file the server already has. The client fetches the
+# basis file's block signature (Adler-32 + truncated BLAKE2b per block), finds
+# the blocks it can reuse with a rolling checksum, and uploads only a delta:
+# "copy bytes [offset, offset+length) of the basis" and "literal data" ops.
+# The server streams the new version together from the basis and the delta
+# (see backend/delta_sync.py for the client side).
+# ---------------------------------------------------------------------------
+
+DELTA_SIGNATURE_CACHE = int(os.environ.get('DELTA_SIGNATURE_CACHE', 16))
+
+
+
+def _original_name(saved_name: str) -> str:
+    """Strip the ``{timestamp}_`` prefix added by ``_saved_name_for``."""
+    stamp, sep, rest = saved_name.partition('_')
+    return rest if sep and len(stamp) == 14 and stamp.isdigit() else saved_name
+
+
+@bp.route('/upload/delta/<path:filename>/signature', methods=['GET'])
+@rate_limited
+def delta_signature(filename):
+    """Block signature of ``filename`` for building a delta against it.
+
+    ``?block_size=`` overrides the default (~sqrt of the file size). Answers
+    { filename, size, version, block_size, weak, strong } where ``weak`` is the
+    base64 of big-endian uint32 Adler-32 values and ``strong`` the base64 of
+    16-byte BLAKE2b digests, one per block (the last block may be short).
+    """
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    basis = _resolve_upload(filename)
+    if basis is None:
+        return jsonify({'error': 'file not found'}), 404
+    if not _check_file_pin(basis.name, request.args.get('pin', '').strip()):
+        return jsonify({'error': 'invalid_pin', 'message': 'Invalid PIN'}), 403
+    st = basis.stat()
+    block = request.args.get('block_size', type=int) or delta_block_size(st.st_size)
+    if not DELTA_MIN_BLOCK <= block <= DELTA_MAX_BLOCK:
+        return jsonify({'error': f'block_size must be between {DELTA_MIN_BLOCK} and {DELTA_MAX_BLOCK}'}), 400
+    started = time.perf_counter()
+    weak, strong = SIGNATURES.get(basis, st, block)
+    logger.info(f"Delta signature for {basis.name}: {len(weak) // 4} blocks of {block} bytes "
+                f"in {time.perf_counter() - started:.3f}s")
+    return jsonify({
+        'filename': basis.name,
+        'size': st.st_size,
+        'version': basis_version(st),
+        'block_size': block,
+        'weak': base64.b64encode(weak).decode(),
+        'strong': base64.b64encode(strong).decode(),
+    })
+
+
+@bp.route('/upload/delta/<path:filename>', methods=['POST', 'PUT'])
+@rate_limited
+def upload_delta(filename):
+    """Upload a new version of ``filename`` as a delta against it.
+
+    Query: ``size`` (of the new version, required), ``version`` (from the
+    signature; 409 if the basis changed since), optional ``filename`` for the
+    new file (defaults to the basis' original name), ``sha256``, ``pin``
+    (the new file's), ``basis_pin`` and ``ttl``. The body is the delta. The
+    new version is stored as a regular upload; the basis is left untouched.
+    """
+    started = time.perf_counter()
+    if PIN_ENABLED and not session.get('authed'):
+        logger.warning(f"Unauthorized upload attempt from {request.remote_addr}")
+        return jsonify({'error': 'unauthorized'}), 401
+    basis = _resolve_upload(filename)
+    if basis is None:
+        return jsonify({'error': 'file not found'}), 404
+    if not _check_file_pin(basis.name, request.args.get('basis_pin', '').strip()):
+        return jsonify({'error': 'invalid_pin', 'message': 'Invalid PIN'}), 403
+    version = request.args.get('version')
+    if version and version != basis_version(basis.stat()):
+        return jsonify({'error': 'basis file changed', 'version': basis_version(basis.stat())}), 409
+    original = request.args.get('filename') or _original_name(basis.name)
+    if not secure_filename(original):
+        return jsonify({'error': 'no selected file'}), 400
+    if not allowed_file(original):
+        return jsonify({'error': 'file type not allowed'}), 400
+    size = request.args.get('size', type=int)
+    if size is None or size < 0:
+        return jsonify({'error': 'size required'}), 400
+    if request.content_length is None:
+        return jsonify({'error': 'content-length required'}), 411
+    file_pin = request.args.get('pin', '').strip()
+    try:
+        ttl = _parse_ttl(request.args.get('ttl'))
+        expected = _client_sha256(request.args.get('sha256'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not QUOTA.reserve(size):
+        return _insufficient_storage()
+    g.quota_reserved = size
+
+    saved_name = _unique_saved_name(original, set())  # never the basis, even within the same second
+    dest = UPLOAD_FOLDER / saved_name
+    tmp = PARTIAL_FOLDER / f"{uuid.uuid4().hex}.delta"
+    hasher = hashlib.sha256()
+    TRANSFERS.wrap_input(saved_name, request.content_length)
+    try:
+        with open(tmp, 'wb') as out:
+            try:
+                applied = apply_delta(request.stream, basis, out, size, hasher)
+            except (ValueError, struct.error) as e:
+                return jsonify({'error': 'invalid delta', 'detail': str(e)}), 400
+        digest = hasher.hexdigest()
+        if expected and expected != digest:
+            return _checksum_mismatch(expected, digest)
+        deduplicated = _publish_upload(tmp, dest, digest)
+        body = _finalize_upload(saved_name, dest, file_pin, started, ttl, deduplicated, sha256=digest)
+        body['delta'] = dict(applied, basis=basis.name, wire_bytes=request.content_length)
+        logger.info(f"Delta upload {saved_name} from {basis.name}: {request.content_length} bytes sent "
+                    f"for {size} ({applied['copied_bytes']} reused)")
+        return jsonify(body), 201
+    except Exception as e:
+        logger.error(f"Delta upload failed for {original}: {e}")
+        return jsonify({'error': 'upload failed', 'detail': str(e)}), 500
+    finally:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# ---------------------------------------------------------------------------
+# Download compression
+#
+# Full-body GETs negotiate Accept-Encoding (zstd and br when their packages are
+# installed, gzip always). Whether a file is worth compressing is decided once
+# per version from its MIME type, or by deflating a 64 KiB sample when the type
+# says nothing. The first compressed GET streams; from the second on, the
+# output is also teed into META_FOLDER/compressed so later requests are plain
+# (sendfile-able) file responses. Range requests always get the identity bytes.
+# ---------------------------------------------------------------------------
+
+COMPRESSION_ENABLED = os.environ.get('ENABLE_COMPRESSION', '1') == '1'
+COMPRESS_CACHE_BYTES = int(os.environ.get('COMPRESS_CACHE_BYTES', 512 * 1024 * 1024))
+
+
+def _send_file_ranges(path: Path, download_name: str, as_attachment: bool = True):
+    """Serve ``path`` with validators, 304s and single/multi-range (206) support."""
+    st = path.stat()
+    size = st.st_size
+    etag = file_etag(st)
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'no-cache',
+    }
+    coding = None
+    if COMPRESSION_ENABLED and COMPRESSION.compressible(path, st, mimetype, etag):
+        headers['Vary'] = 'Accept-Encoding'
+        if request.method in ('GET', 'HEAD') and 'Range' not in request.headers:
+            coding = negotiate_coding(request.accept_encodings)
+    if coding:
+        # each representation needs its own strong validator
+        etag = headers['ETag'] = f'{etag[:-1]}-{coding}"'
+    else:
+        entry = FILE_INDEX.get(path.name)
+        if entry and entry['sha256'] and entry['size'] == size and entry['mtime'] == st.st_mtime:
+            # digest of the whole file, so range responses carry it too (RFC 9530 Repr-Digest)
+            b64 = base64.b64encode(bytes.fromhex(entry['sha256'])).decode()
+            headers['Repr-Digest'] = f'sha-256=:{b64}:'
+            headers['Digest'] = f'SHA-256={b64}'  # RFC 3230, for older clients
+    if not_modified(request.headers, etag, st.st_mtime):
+        return Response(status=304, headers=headers)
+    if coding:
+        return _send_compressed(path, st, download_name, mimetype, etag, coding, headers, as_attachment)
+
+    ranges = None
+    if request.method in ('GET', 'HEAD') and range_allowed(request.headers, etag, st.st_mtime):
+        ranges = parse_ranges(request.headers.get('Range'), size)
+
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    transfer = _start_download(download_name, size)
+    if ranges is None:
+        resp = Response(_file_body(path, 0, size, transfer), mimetype=mimetype, headers=headers, direct_passthrough=True)
+        resp.content_length = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        transfer.size = end - start
+        resp = Response(_file_body(path, start, end - start, transfer), status=206, mimetype=mimetype,
+                        headers=headers, direct_passthrough=True)
+        resp.content_length = end - start
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        length = 0
+        for start, end in ranges:
+            head = (f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+                    f'Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n').encode()
+            parts.append((head, start, end))
+            length += len(head) + end - start
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        length += len(tail)
+
+        def multipart():
+            for head, start, end in parts:
+                yield head
+                yield from iter_file(path, start, end - start)
+            yield tail
+
+        transfer.size = length
+        resp = Response(transfer.wrap_iter(multipart()), status=206, headers=headers,
+                        content_type=f'multipart/byteranges; boundary={boundary}', direct_passthrough=True)
+        resp.content_length = length
+
+    if as_attachment:
+        resp.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return resp
+
+
+def _send_compressed(path, st, download_name, mimetype, etag, coding, headers, as_attachment):
+    """Full-body response in ``coding``, from the variant cache when it has it."""
+    headers['Content-Encoding'] = coding
+    del headers['Accept-Ranges']  # ranges are only served on the identity representation
+    # only GETs that send the body count towards hotness; HEAD never fills the cache
+    cached, fill = COMPRESSION.lookup(path.name, etag, coding, count=request.method == 'GET')
+    fh = None
+    if cached is not None:
+        # open now: once open, eviction can unlink the variant without breaking this response
+        try:
+            fh = open(cached, 'rb')
+        except FileNotFoundError:
+            COMPRESSION.forget(cached)
+    if fh is not None:
+        size = os.fstat(fh.fileno()).st_size
+        transfer = _start_download(download_name, size)
+        resp = Response(_file_body(cached, 0, size, transfer, fh), mimetype=mimetype, headers=headers,
+                        direct_passthrough=True)
+        resp.content_length = size
+    else:
+        target = COMPRESSION.variant_path(path.name, etag, coding) if fill else None
+        transfer = _start_download(download_name, None)
+        resp = Response(transfer.wrap_iter(COMPRESSION.stream(path, st.st_size, coding, target)),
+                        mimetype=mimetype, headers=headers, direct_passthrough=True)
+    if as_attachment:
+        resp.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return resp
+
+
+def _check_file_pin(filename: str, provided_pin: str) -> bool:
+    """True if ``filename`` is not PIN-protected or the PIN was verified (now or earlier in the session)."""
+    if filename not in FILE_PINS:
+        return True
+    # Check if PIN was already verified in this session
+    token = session.get('pin_grant')
+    if token and PIN_STORE.has_grant(token, filename):
+        return True
+    if not provided_pin or not FILE_PINS.verify(filename, provided_pin):
+        return False
+    # Remember the verification server-side under the session's grant token
+    if not token:
+        token = session['pin_grant'] = secrets.token_urlsafe(16)
+    PIN_STORE.grant(token, filename)
+    return True
+
+
+def _resolve_upload(filename: str):
+    """Map a user-supplied name to a file inside UPLOAD_FOLDER, or None.
+
+    Rejects path traversal and anything under the internal META_FOLDER.
+    """
+    uploads = UPLOAD_FOLDER.resolve()
+    candidate = (uploads / filename).resolve()
+    if not str(candidate).startswith(str(uploads)) or not candidate.is_file():
+        return None
+    if candidate.is_relative_to(META_FOLDER.resolve()):
+        return None
+    return candidate
+
+
+@bp.route('/download/<path:filename>', methods=['GET'])
+@rate_limited
 def download_file(filename):
-    uploads = Path(app.config['UPLOAD_FOLDER'])
     # Security: ensure path is within uploads
-    candidate = (uploads / filename).resolve()
-    if not str(candidate).startswith(str(uploads.resolve())) or not candidate.exists():
+    candidate = _resolve_upload(filename)
+    if candidate is None:
         return jsonify({'error': 'file not found'}), 404
     
-    # Check if file has PIN protection
-    if filename in FILE_PINS:
-        # Verify PIN from session or query parameter
-        provided_pin = request.args.get('pin', '').strip()
-        session_key = f'file_pin_{filename}'
-        
-        # Check if PIN was already verified in this session
-        if not session.get(session_key):
-            # Verify provided PIN
-            if provided_pin != FILE_PINS[filename]:
-                return jsonify({'error': 'invalid_pin', 'message': 'Invalid PIN'}), 403
-            # Store verification in session
-            session[session_key] = True
+    # Check if file has PIN protection (PIN from session or query parameter)
+    if not _check_file_pin(candidate.name, request.args.get('pin', '').strip()):
+        return jsonify({'error': 'invalid_pin', 'message': 'Invalid PIN'}), 403
     
-    return send_from_directory(directory=str(uploads), path=filename, as_attachment=True)
+    QUOTA.touch(candidate.name)
+    return _send_file_ranges(candidate, candidate.name)
+
+
+# ---------------------------------------------------------------------------
+# Bulk downloads
+#
+# Many files in one response, archived on the fly: ZIP (stored, ZIP64-capable,
+# written with data descriptors) or TAR. Archive bytes are produced per 1 MiB
+# read, so memory stays bounded and nothing is written to disk.
+# ---------------------------------------------------------------------------
+
+@bp.route('/download/bulk', methods=['GET', 'POST'])
+@rate_limited
+def download_bulk():
+    """Stream several files as one archive.
+
+    Parameters (JSON body or query string): ``filenames`` (list; ``name`` may be
+    repeated in the query), or ``since`` (unix mtime) for everything newer;
+    ``format`` is ``zip`` (default) or ``tar``; ``pins`` maps filenames to PINs.
+    Every PIN-protected file must be unlocked in the session or by ``pins``.
+    """
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    data = request.get_json(silent=True) or {}
+    names = data.get('filenames') or request.args.getlist('name')
+    since = data.get('since', request.args.get('since'))
+    fmt = str(data.get('format') or request.args.get('format') or 'zip').lower()
+    pins = data.get('pins') if isinstance(data.get('pins'), dict) else {}
+    if fmt not in ('zip', 'tar'):
+        return jsonify({'error': 'unsupported format'}), 400
+
+    explicit = bool(names)
+    if not explicit:
+        if since is None:
+            return jsonify({'error': 'filenames or since required'}), 400
+        try:
+            names = [e['filename'] for e in FILE_INDEX.page(since=float(since))[0]]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid since'}), 400
+
+    files, missing, locked = [], [], []
+    for name in dict.fromkeys(str(n) for n in names):
+        path = _resolve_upload(name)
+        if path is None:
+            missing.append(name)
+        elif not _check_file_pin(path.name, str(pins.get(name) or pins.get(path.name) or '').strip()):
+            locked.append(name)
+        elif path not in files:
+            files.append(path)
+    if explicit and missing:
+        return jsonify({'error': 'file not found', 'missing': missing}), 404
+    if explicit and locked:
+        return jsonify({'error': 'invalid_pin', 'message': 'Invalid PIN', 'locked': locked}), 403
+    if not files:
+        return jsonify({'error': 'no files selected'}), 404
+
+    download_name = f"wifix-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}.{fmt}"
+    if fmt == 'tar':
+        members, trailer, length = tar_members(files)
+        transfer = _start_download(download_name, length)
+        resp = Response(transfer.wrap_iter(iter_tar(members, trailer)), mimetype='application/x-tar',
+                        direct_passthrough=True)
+        resp.content_length = length
+    else:
+        transfer = _start_download(download_name, None)
+        resp = Response(transfer.wrap_iter(iter_zip(files)), mimetype='application/zip', direct_passthrough=True)
+    resp.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if locked:
+        # files skipped from a ``since`` selection because their PIN was not supplied
+        resp.headers['X-Skipped-Locked'] = str(len(locked))
+    logger.info(f"Bulk download: {len(files)} file(s) as {fmt}")
+    return resp
 
 
-@app.route('/delete/<path:filename>', methods=['DELETE'])
+@bp.route('/delete/<path:filename>', methods=['DELETE'])
 @limiter.limit("20 per minute")
 def delete_file(filename):
     """Delete an uploaded file from the uploads folder. Returns 200 on success.
@@ -386,20 +1634,16 @@ def delete_file(filename):
         logger.warning(f"Unauthorized delete attempt from {request.remote_addr}")
         return jsonify({'error': 'unauthorized'}), 401
 
-    uploads = Path(app.config['UPLOAD_FOLDER'])
-    candidate = (uploads / filename).resolve()
-    if not str(candidate).startswith(str(uploads.resolve())) or not candidate.exists():
+    candidate = _resolve_upload(filename)
+    if candidate is None:
         return jsonify({'error': 'file not found'}), 404
     try:
-        candidate.unlink()
+        _remove_upload(candidate)
+        FILE_INDEX.remove(candidate.name)
         # Remove PIN if exists
-        if filename in FILE_PINS:
-            del FILE_PINS[filename]
-        logger.info(f"File deleted: {filename}")
-        try:
-            socketio.emit('file_deleted', {'filename': filename}, broadcast=True)
-        except Exception as e:
-            logger.error(f"Failed to emit file_deleted event: {e}")
+        if candidate.name in FILE_PINS:
+            del FILE_PINS[candidate.name]
+        logger.info(f"File deleted: {candidate.name}")
         return jsonify({'ok': True}), 200
     except Exception as e:
         logger.error(f"Delete failed for {filename}: {e}")
@@ -407,55 +1651,599 @@ def delete_file(filename):
 
 
 
-@app.route('/qr')
+# ---------------------------------------------------------------------------
+# Previews
+#
+# After a file lands in the index, a thumbnail + dimensions (images) or a text
+# snippet is built in a small process pool and stored as sidecars under
+# META_FOLDER/previews (<sha1(name)>.json, plus .jpg for thumbnails). The queue
+# is bounded and lossy: under burst load jobs are dropped and rebuilt on demand
+# when /preview is first asked for that file. Removal from the index cancels
+# pending work and deletes the sidecars.
+# ---------------------------------------------------------------------------
+
+PREVIEWS_ENABLED = os.environ.get('ENABLE_PREVIEWS', '1') == '1'
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', 2))
+PREVIEW_QUEUE_SIZE = int(os.environ.get('PREVIEW_QUEUE_SIZE', 256))
+PREVIEW_MAX_IMAGE_BYTES = int(os.environ.get('PREVIEW_MAX_IMAGE_BYTES', 64 * 1024 * 1024))
+
+
+@bp.route('/preview/<path:filename>', methods=['GET'])
+@limiter.exempt
+def preview(filename):
+    """Preview metadata ({ kind, width, height, snippet, thumbnail_url }), or the
+    JPEG thumbnail itself with ``?thumbnail=1``. 202 while the preview is being built,
+    404 for files that have no preview."""
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    candidate = _resolve_upload(filename)
+    if candidate is None:
+        return jsonify({'error': 'file not found'}), 404
+    if not _check_file_pin(candidate.name, request.args.get('pin', '').strip()):
+        return jsonify({'error': 'invalid_pin', 'message': 'Invalid PIN'}), 403
+    if not PREVIEWS_ENABLED or preview_kind(candidate.name) is None:
+        return jsonify({'error': 'no preview available'}), 404
+
+    st = candidate.stat()
+    meta = PREVIEWS.load(candidate.name, st)
+    if meta is None:
+        if PREVIEWS.status(candidate.name) == 'missing' and not PREVIEWS.enqueue(candidate.name):
+            return jsonify({'error': 'preview queue full'}), 503
+        resp = jsonify({'status': 'pending'})
+        resp.status_code = 202
+        resp.headers['Retry-After'] = '1'
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp
+
+    want_thumb = request.args.get('thumbnail') in ('1', 'true')
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}-{"t" if want_thumb else "m"}"'
+    # the preview of a given file version never changes; PIN-protected ones stay out of shared caches
+    headers = {'ETag': etag,
+               'Cache-Control': ('private' if candidate.name in FILE_PINS else 'public') + ', max-age=31536000, immutable'}
+    if not_modified(request.headers, etag, st.st_mtime):
+        return Response(status=304, headers=headers)
+    if want_thumb:
+        if not meta.get('thumbnail'):
+            return jsonify({'error': 'no thumbnail'}), 404
+        thumb = Path(str(PREVIEWS.sidecar(candidate.name)) + '.jpg')
+        resp = send_file(str(thumb), mimetype='image/jpeg', conditional=False, etag=False, max_age=None)
+        resp.headers.update(headers)
+        return resp
+    body = {k: meta[k] for k in ('kind', 'width', 'height', 'snippet') if k in meta}
+    body['status'] = 'ready'
+    body['filename'] = candidate.name
+    if meta.get('thumbnail'):
+        body['thumbnail_url'] = url_for('wifix.preview', filename=candidate.name, thumbnail=1)
+    resp = jsonify(body)
+    resp.headers.update(headers)
+    return resp
+
+
+# ---------------------------------------------------------------------------
+# QR codes
+#
+# Every landing page asks for the same one or two codes, so rendered images are
+# kept in a small LRU keyed by (url, size, format). The server's own URLs are
+# rendered at startup and pinned; arbitrary ``url=`` values share the remaining
+# QR_CACHE_SIZE slots and simply evict each other.
+# ---------------------------------------------------------------------------
+
+QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 64))
+QR_CACHE = QRCodeCache(QR_CACHE_SIZE)
+
+
+@bp.route('/qr')
 def qr():
-    """Return a PNG QR code for the provided URL (query param `url`) or the server base URL by default."""
+    """Return a QR code for the provided URL (query param `url`) or the server base URL by default.
+
+    Optional ``size`` (pixels per module, 1-40) and ``format`` (``png`` or ``svg``).
+    """
     target = request.args.get('url')
     if not target:
         # use host_url which usually contains scheme and host
         target = request.host_url
+    fmt = request.args.get('format', 'png').lower()
+    try:
+        size = int(request.args.get('size', QR_DEFAULT_BOX_SIZE))
+    except ValueError:
+        size = 0
+    if fmt not in QR_FORMATS or not 1 <= size <= 40 or len(target) > QR_MAX_URL_LENGTH:
+        return jsonify({'error': 'invalid qr parameters'}), 400
     try:
-        buf = io.BytesIO()
-        img = qrcode.make(target)
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        return send_file(buf, mimetype='image/png')
+        body, etag = QR_CACHE.get(target, size, fmt)
     except Exception:
         return jsonify({'error': 'failed to generate qr code'}), 500
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=3600'}
+    inm = request.headers.get('If-None-Match')
+    if inm and ('*' in inm or etag in [t.strip() for t in inm.split(',')]):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype=QR_FORMATS[fmt], headers=headers)
+
+
+# ---------------------------------------------------------------------------
+# File expiry
+#
+# Deadlines live in a min-heap; the expiry thread sleeps until the earliest one
+# instead of stat-sweeping the folder. Files get FILE_TTL_SECONDS from their mtime
+# unless a per-file TTL was given at upload (persisted in META_FOLDER/expiry.json).
+# ---------------------------------------------------------------------------
+
+def _delete_upload(name: str):
+    """Remove an upload the server dropped on its own (expiry, eviction), its index entry and PIN."""
+    try:
+        _remove_upload(UPLOAD_FOLDER / name)
+    except FileNotFoundError:
+        pass
+    FILE_INDEX.remove(name)
+    # Remove PIN if exists
+    if name in FILE_PINS:
+        del FILE_PINS[name]
+
 
 def cleanup_worker():
-    """Background thread to delete files older than FILE_TTL_SECONDS"""
-    uploads = Path(app.config['UPLOAD_FOLDER'])
+    """Background thread deleting files as their expiry deadlines come due."""
     while True:
-        now = datetime.now(timezone.utc)
-        cutoff = now - timedelta(seconds=FILE_TTL_SECONDS)
-        for p in uploads.iterdir():
-            try:
-                mtime = datetime.fromtimestamp(p.stat().st_mtime, tz=timezone.utc)
-                if mtime < cutoff:
-                    p.unlink()
-                    # Remove PIN if exists
-                    if p.name in FILE_PINS:
-                        del FILE_PINS[p.name]
-                    socketio.emit('file_deleted', {'filename': p.name})
-            except Exception:
-                # ignore errors for now (permissions, race conditions)
-                pass
-        time.sleep(CLEANUP_INTERVAL_SECONDS)
-
-# start cleanup thread only if FILE_TTL_SECONDS is enabled (> 0)
-if FILE_TTL_SECONDS and FILE_TTL_SECONDS > 0:
-    cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
-    cleanup_thread.start()
+        try:
+            EXPIRY.run_once()
+        except Exception as e:
+            logger.error(f"Expiry run failed: {e}")
+            time.sleep(1)
+
+
+# ---------------------------------------------------------------------------
+# Storage quota
+#
+# Usage is summed incrementally from index changes. Uploads reserve their size
+# (Content-Length, or the declared size of a resumable upload) before writing;
+# a reservation that would cross QUOTA_BYTES or leave less than
+# QUOTA_MIN_FREE_BYTES on disk first evicts files, else the upload gets 507.
+# Above the high-water mark the eviction thread trims usage to the low-water mark.
+# Candidates sit in a heap with lazy invalidation (least recently downloaded
+# first, or largest first); PIN-protected and kept files are never candidates.
+# ---------------------------------------------------------------------------
+
+QUOTA_BYTES = int(os.environ.get('QUOTA_BYTES', 0))  # 0 = no quota (disk free space still guarded)
+QUOTA_HIGH_WATER = float(os.environ.get('QUOTA_HIGH_WATER', 0.9))
+QUOTA_LOW_WATER = float(os.environ.get('QUOTA_LOW_WATER', 0.8))
+QUOTA_MIN_FREE_BYTES = int(os.environ.get('QUOTA_MIN_FREE_BYTES', 256 * 1024 * 1024))
+QUOTA_EVICTION = os.environ.get('QUOTA_EVICTION', 'lru')  # lru | size | off
+if QUOTA_EVICTION not in QUOTA_POLICIES:
+    raise RuntimeError(f"Unknown QUOTA_EVICTION {QUOTA_EVICTION!r} (expected 'lru', 'size' or 'off')")
+
+
+def _insufficient_storage():
+    return jsonify({'error': 'insufficient storage', 'quota': QUOTA.usage()}), 507
+
+
+@_socket_on('keep_file')
+def handle_keep_file(data):
+    """Host exempts a file from eviction (or lifts it). Expects { filename, keep: true|false }."""
+    if request.sid != STATE.get_host_sid() or not isinstance(data, dict):
+        return
+    name = str(data.get('filename') or '')
+    if FILE_INDEX.get(name) is None:
+        return
+    QUOTA.set_kept(name, bool(data.get('keep', True)))
+    _emit('file_kept', {'filename': name, 'keep': bool(data.get('keep', True))}, to=request.sid)
+
+
+# ---------------------------------------------------------------------------
+# Peer relay
+#
+# One-off transfers between the host and a client it approved, without touching
+# UPLOAD_FOLDER. The sender offers a file over Socket.IO (`relay_offer`), each
+# side gets a one-time URL, and the sender's PUT body is piped through a bounded
+# in-memory buffer into the receiver's GET response: a full buffer stops the
+# server reading the upload (TCP backpressure), an empty one parks the download.
+# Both requests have to reach the same process, so relays need a single worker
+# (or sticky routing) when running several.
+# ---------------------------------------------------------------------------
+
+RELAY_ENABLED = os.environ.get('ENABLE_RELAY', '1') == '1'
+RELAY_BUFFER_BYTES = int(os.environ.get('RELAY_BUFFER_BYTES', 8 * 1024 * 1024))
+RELAY_TIMEOUT_SECONDS = float(os.environ.get('RELAY_TIMEOUT_SECONDS', 60))
+RELAY_MAX_ACTIVE = int(os.environ.get('RELAY_MAX_ACTIVE', 16))
+
+
+@_socket_on('relay_offer')
+def handle_relay_offer(data):
+    """Offer a file to an approved peer. Expects { to: '<peer-sid>', filename, size, ref? }.
+
+    The sender gets ``relay_created`` with the URL to PUT the bytes to, the peer
+    ``relay_incoming`` with the URL to GET them from; ``ref`` is echoed back.
+    """
+    if not isinstance(data, dict):
+        return
+    ref = data.get('ref')
+    if not RELAY_ENABLED:
+        _emit('relay_error', {'ref': ref, 'error': 'relay disabled'}, to=request.sid)
+        return
+    peer = data.get('to')
+    filename = secure_filename(str(data.get('filename') or ''))
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        size = -1
+    if not peer or not PEERS.approved(request.sid, peer):
+        _emit('relay_error', {'ref': ref, 'error': 'peer not approved'}, to=request.sid)
+        return
+    if not filename or size < 0:
+        _emit('relay_error', {'ref': ref, 'error': 'invalid offer'}, to=request.sid)
+        return
+    relay = RELAYS.create(request.sid, peer, filename, size)
+    if relay is None:
+        _emit('relay_error', {'ref': ref, 'error': 'too many relays'}, to=request.sid)
+        return
+    _emit('relay_created', {
+        'ref': ref,
+        'relay_id': relay.id,
+        'to': peer,
+        'url': url_for('wifix.relay_send', relay_id=relay.id, key=relay.send_key, _external=True),
+    }, to=request.sid)
+    _emit('relay_incoming', {
+        'relay_id': relay.id,
+        'from': request.sid,
+        'filename': filename,
+        'size': size,
+        'url': url_for('wifix.relay_receive', relay_id=relay.id, key=relay.recv_key, _external=True),
+    }, to=peer)
+
+
+@_socket_on('relay_cancel')
+def handle_relay_cancel(data):
+    """Either side withdraws. Expects { relay_id }."""
+    relay = RELAYS.get(data.get('relay_id')) if isinstance(data, dict) else None
+    if relay is not None and request.sid in (relay.sender, relay.receiver):
+        RELAYS.abort(relay, 'cancelled')
+
+
+def _relay_for(relay_id, side):
+    relay = RELAYS.get(relay_id)
+    key = request.args.get('key', '')
+    if relay is None or not hmac.compare_digest(key, relay.send_key if side == 'sending' else relay.recv_key):
+        return None
+    return relay
+
+
+@bp.route('/relay/<relay_id>', methods=['PUT', 'POST'])
+@rate_limited
+def relay_send(relay_id):
+    """Sender side of a relay: the raw file bytes as the body (Content-Length = offered size).
+
+    Answers once the receiver has taken the last byte, 409 if the relay failed.
+    """
+    relay = _relay_for(relay_id, 'sending')
+    if relay is None:
+        return jsonify({'error': 'relay not found'}), 404
+    if request.content_length != relay.size:
+        return jsonify({'error': 'content-length must match the offered size'}), 400
+    if not RELAYS.attach(relay, 'sending'):
+        return jsonify({'error': 'relay already has a sender'}), 409
+    TRANSFERS.wrap_input(relay.filename, relay.size)
+    try:
+        remaining = relay.size
+        while remaining:
+            buf = request.stream.read(min(STREAM_BUFFER_SIZE, remaining))
+            if not buf:
+                raise RelayAborted('sender disconnected')
+            relay.put(buf, RELAY_TIMEOUT_SECONDS)
+            remaining -= len(buf)
+        relay.finish(RELAY_TIMEOUT_SECONDS)
+    except Exception as e:
+        RELAYS.abort(relay, str(e) if isinstance(e, RelayAborted) else 'sender disconnected')
+        return jsonify({'error': 'relay aborted', 'reason': relay.error}), 409
+    RELAYS.complete(relay)
+    return jsonify({'relay_id': relay.id, 'bytes': relay.delivered}), 200
+
+
+@bp.route('/relay/<relay_id>', methods=['GET'])
+@rate_limited
+def relay_receive(relay_id):
+    """Receiver side of a relay: streams the sender's bytes as they arrive."""
+    relay = _relay_for(relay_id, 'receiving')
+    if relay is None:
+        return jsonify({'error': 'relay not found'}), 404
+    if not RELAYS.attach(relay, 'receiving'):
+        return jsonify({'error': 'relay already has a receiver'}), 409
+    transfer = _start_download(relay.filename, relay.size)
+
+    def body():
+        done = False
+        try:
+            while True:
+                chunk = relay.get(RELAY_TIMEOUT_SECONDS)
+                if chunk is None:
+                    done = True
+                    return
+                yield chunk
+        except RelayAborted:
+            return  # the response ends short of Content-Length, so the client sees the failure
+        finally:
+            if not done:
+                RELAYS.abort(relay, 'receiver disconnected')
+
+    mimetype = mimetypes.guess_type(relay.filename)[0] or 'application/octet-stream'
+    resp = Response(transfer.wrap_iter(body()), mimetype=mimetype, direct_passthrough=True,
+                    headers={'Cache-Control': 'no-store'})
+    resp.content_length = relay.size
+    resp.headers.set('Content-Disposition', 'attachment', filename=relay.filename)
+    return resp
+
+
+@bp.route('/stats', methods=['GET'])
+@limiter.exempt
+def stats():
+    """Internal counters for capacity monitoring."""
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    return jsonify({
+        'files': len(FILE_INDEX),
+        'active_transfers': TRANSFERS.active_count(),
+        'expiry': EXPIRY.stats(),
+        'dedup': BLOBS.stats() if DEDUP_ENABLED else None,
+        'transfers': TRANSFERS.stats(),
+        'rate_limits': RATES.stats(),
+        'qr': QR_CACHE.stats(),
+        'feed': FEED.stats(),
+        'quota': QUOTA.usage(),
+        'compression': COMPRESSION.stats() if COMPRESSION_ENABLED else None,
+        'previews': PREVIEWS.stats() if PREVIEWS_ENABLED else None,
+        'relay': RELAYS.stats() if RELAY_ENABLED else None,
+        'delta_signatures': SIGNATURES.stats(),
+        'startup': STARTUP,
+    })
+
+
+@bp.route('/metrics', methods=['GET'])
+@limiter.exempt
+def metrics():
+    """Prometheus text exposition of the counters above. Disable with ENABLE_METRICS=0."""
+    if not ENABLE_METRICS:
+        return jsonify({'error': 'not found'}), 404
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/debug/profile', methods=['GET'])
+@limiter.exempt
+def debug_profile():
+    """Sample all thread stacks for ``seconds`` and return collapsed stacks (opt-in: ENABLE_PROFILER=1)."""
+    if not ENABLE_PROFILER:
+        return jsonify({'error': 'not found'}), 404
+    if PIN_ENABLED and not session.get('authed'):
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        seconds = min(float(request.args.get('seconds', 5)), 60.0)
+        interval = max(float(request.args.get('interval', 0.01)), 0.001)
+    except ValueError:
+        return jsonify({'error': 'invalid profile parameters'}), 400
+    try:
+        body = PROFILER.profile(seconds, interval)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(body, mimetype='text/plain')
+
+
+METRICS.register(Gauge('wifix_files', 'Files in the upload index', fn=lambda: len(FILE_INDEX)))
+METRICS.register(Gauge('wifix_expiry_queued', 'Files with a pending expiry deadline',
+                       fn=lambda: EXPIRY.stats()['queued']))
+METRICS.register(Gauge('wifix_expiry_lateness_max_seconds', 'Worst observed expiry lateness',
+                       fn=lambda: EXPIRY.lateness_max))
+METRICS.register(Gauge('wifix_active_transfers', 'In-flight uploads and downloads',
+                       fn=lambda: TRANSFERS.active_count()))
+
+# ---------------------------------------------------------------------------
+# Startup
+#
+# Importing this module only reads configuration: it touches no files, opens no
+# database and starts no threads. create_app() builds a fresh Flask app and the
+# state behind it (folders, SQLite state and PINs, upload index, quota, ...),
+# wires CORS, the limiter and Socket.IO, and starts the services: interface
+# discovery and the change feed right away, then the initial index scan and
+# everything derived from it (partial uploads, blobs, expiry deadlines, quota
+# usage) in a background task, so connections are accepted immediately. Requests
+# that need the index wait for it; the landing page, /info, auth and QR codes don't.
+# ---------------------------------------------------------------------------
+
+INDEX_READY = threading.Event()
+INDEX_READY_TIMEOUT_SECONDS = 30
+INDEX_FREE_ENDPOINTS = {'index', 'static', 'info', 'auth_status', 'auth', 'auth_logout', 'qr',
+                        'relay_send', 'relay_receive', 'stats', 'metrics', 'debug_profile'}
+STARTUP = {}  # phase -> seconds since this module started loading
+
+
+def _startup_mark(phase: str):
+    STARTUP[phase] = round(time.perf_counter() - _STARTED, 4)
+
+
+DB = None  # SQLiteDB at STATE_DB, opened by create_app()
+
+
+def _close_state():
+    """Close the state database of the latest app (at exit, or when a new app replaces it)."""
+    global DB
+    if DB is not None:
+        DB.close()
+        DB = None
+
+
+def _create_state(upload_folder: Path, rate_limits: bool):
+    """Create the folders and the state behind the routes (module globals) for ``upload_folder``."""
+    global UPLOAD_FOLDER, META_FOLDER, PARTIAL_FOLDER, STATE_DB, INDEX_READY
+    global DB, STATE, PIN_STORE, FILE_PINS, DIGESTS, FILE_INDEX, FEED, RATES, TRANSFERS, BLOBS, SIGNATURES
+    global COMPRESSION, PREVIEWS, EXPIRY, QUOTA, CHUNKED_UPLOADS, PEERS, RELAYS
+    UPLOAD_FOLDER = upload_folder
+    META_FOLDER = UPLOAD_FOLDER / ".wifix"
+    PARTIAL_FOLDER = META_FOLDER / "partial"
+    STATE_DB = Path(os.environ.get('STATE_DB') or META_FOLDER / 'state.db')
+    UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+    PARTIAL_FOLDER.mkdir(parents=True, exist_ok=True)
+    INDEX_READY = threading.Event()
+
+    _close_state()
+    DB = SQLiteDB(STATE_DB)
+    STATE = SQLiteStateBackend(DB) if STATE_BACKEND == 'sqlite' else MemoryStateBackend()
+    PIN_STORE = PinStore(DB, PIN_GRANT_TTL_SECONDS, shared=STATE_BACKEND == 'sqlite')
+    # Per-file PIN storage: {filename: pin hash}
+    FILE_PINS = PinMapping(PIN_STORE)
+    DIGESTS = DigestStore(DB)
+    FILE_INDEX = FileIndex(UPLOAD_FOLDER, DIGESTS, FILE_PINS)
+    FEED = ChangeFeed(FILE_INDEX, _emit, FEED_ROOM, FEED_REPLAY_SIZE, FEED_COALESCE_SECONDS)
+    RATES = ClientRateLimiter(RATE_WINDOW_SECONDS, RATE_BYTES_PER_WINDOW, RATE_MAX_STREAMS, RATE_MAX_CLIENTS,
+                              _server_load, RATE_LOAD_TRANSFERS, RATE_LOAD_DISK_QUEUE, RATE_MIN_SCALE,
+                              enabled=rate_limits)
+    TRANSFERS = TransferScheduler(RATES, BANDWIDTH_LIMIT_BPS, CLIENT_BANDWIDTH_LIMIT_BPS, SMALL_FILE_BYTES)
+    BLOBS = BlobStore(META_FOLDER / 'blobs')
+    SIGNATURES = DeltaSignatures(DELTA_SIGNATURE_CACHE)
+    COMPRESSION = CompressionCache(META_FOLDER / 'compressed', COMPRESS_CACHE_BYTES, FILE_INDEX)
+    PREVIEWS = PreviewPipeline(META_FOLDER / 'previews', UPLOAD_FOLDER, PREVIEW_WORKERS, PREVIEW_QUEUE_SIZE,
+                               PREVIEW_MAX_IMAGE_BYTES, FILE_INDEX)
+    EXPIRY = ExpiryScheduler(FILE_TTL_SECONDS, META_FOLDER / 'expiry.json', _delete_upload,
+                             lambda names: _emit('files_deleted', {'filenames': names, 'reason': 'expired'}),
+                             CLEANUP_INTERVAL_SECONDS, EXPIRY_BATCH_SIZE, EXPIRY_COALESCE_SECONDS)
+    QUOTA = QuotaManager(UPLOAD_FOLDER, QUOTA_BYTES, QUOTA_EVICTION, META_FOLDER / 'keep.json', FILE_INDEX,
+                         _delete_upload, lambda names: _emit('files_deleted', {'filenames': names, 'reason': 'evicted'}),
+                         QUOTA_HIGH_WATER, QUOTA_LOW_WATER, QUOTA_MIN_FREE_BYTES)
+    CHUNKED_UPLOADS = ChunkedUploads(PARTIAL_FOLDER, CHUNK_SIZE, CHUNKED_UPLOAD_TTL_SECONDS, QUOTA)
+    PEERS = PeerApprovals()
+    RELAYS = RelayHub(RELAY_MAX_ACTIVE, RELAY_BUFFER_BYTES, RELAY_TIMEOUT_SECONDS, _emit)
+
+
+def _build_index(start_workers: bool = True):
+    """Initial index scan and the state derived from it, then the workers that need it."""
+    try:
+        CHUNKED_UPLOADS.load()
+        if DEDUP_ENABLED:
+            BLOBS.load()
+        FILE_INDEX.reconcile(force=True)
+        entries = FILE_INDEX.page()[0]
+        EXPIRY.load(entries)
+        FILE_INDEX.listeners.append(EXPIRY.on_index_change)
+        FILE_INDEX.listeners.append(FEED.on_index_change)
+        QUOTA.load(entries)
+        for up in CHUNKED_UPLOADS.values():
+            up.reserved = up.size if QUOTA.reserve(up.size, force=True) else 0
+        FILE_INDEX.listeners.append(QUOTA.on_index_change)
+        DIGESTS.prune(e['filename'] for e in entries)
+        FILE_INDEX.listeners.append(DIGESTS.on_index_change)
+        if COMPRESSION_ENABLED:
+            COMPRESSION.load()
+            FILE_INDEX.listeners.append(COMPRESSION.on_index_change)
+        if PREVIEWS_ENABLED:
+            FILE_INDEX.listeners.append(PREVIEWS.on_index_change)
+    except Exception as e:
+        logger.error(f"Initial index build failed: {e}")
+    finally:
+        INDEX_READY.set()
+    _startup_mark('index_ready')
+    logger.info(f"Startup: imports {STARTUP['imports']}s, serving after {STARTUP.get('app_ready', '-')}s, "
+                f"index of {len(FILE_INDEX)} files ready after {STARTUP['index_ready']}s")
+    if not start_workers:
+        return
+
+    socketio.start_background_task(index_reconcile_worker)
+    socketio.start_background_task(cleanup_worker)
+    socketio.start_background_task(QUOTA.run)
+    if PREVIEWS_ENABLED:
+        socketio.start_background_task(PREVIEWS.run)
+    port = int(os.environ.get('PORT', 5000))
+    socketio.start_background_task(QR_CACHE.prewarm, NETWORK.urls(port) + [f'http://127.0.0.1:{port}/'])
+
+
+def create_app(config: dict = None) -> Flask:
+    """Build the Flask app, the state behind it, and start the background services.
+
+    ``config`` overrides app.config, e.g. ``{'UPLOAD_FOLDER': path}``. Servers call
+    this at load time: ``gunicorn -k eventlet -w 1 'backend.app:create_app()'``.
+    Each call returns a fresh app over fresh state; the routes use the state of the
+    latest one, so serve one app per process. With ``TESTING`` the index is built
+    before returning, previews run in threads and no long-running workers start
+    (tests drive ``FEED.flush()``, ``PREVIEWS.dispatch()`` and friends directly).
+    """
+    # Look for templates at the repository root `templates/` if present so the
+    # app can still render a legacy Jinja UI when run from the backend/ folder.
+    app = Flask(__name__, template_folder=str(ROOT_DIR / "templates"))
+    app.request_class = WifixRequest
+    app.config["UPLOAD_FOLDER"] = str(UPLOAD_FOLDER)
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    app.config['RATELIMIT_ENABLED'] = RATELIMIT_ENABLED
+    # Session secret for optional PIN flow
+    app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
+    app.config.update(config or {})
+    _create_state(Path(app.config['UPLOAD_FOLDER']), app.config['RATELIMIT_ENABLED'])
+    atexit.unregister(_close_state)
+    atexit.register(_close_state)
+    # With the SQLite state backend, limiter counters default to the same database so
+    # all workers count against the same limits.
+    app.config.setdefault('RATELIMIT_STORAGE_URI', RATELIMIT_STORAGE_URL or (
+        f"sqlite://{STATE_DB}" if STATE_BACKEND == 'sqlite' else "memory://"))
+
+    # Enable CORS for all HTTP routes with credentials support
+    CORS(app, resources={r"/*": {
+        "origins": ALLOWED_ORIGINS,
+        "supports_credentials": True,
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+        "expose_headers": ["ETag", "X-Next-Cursor", "X-Skipped-Locked"],
+        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+    }})
+    limiter.init_app(app)
+    socketio.init_app(app, cors_allowed_origins=ALLOWED_ORIGINS, async_mode=ASYNC_MODE,
+                      message_queue=SOCKETIO_MESSAGE_QUEUE)
+    app.register_blueprint(bp)
+
+    if app.testing:
+        if PREVIEWS_ENABLED:
+            PREVIEWS.start(fork=False)
+        _build_index(start_workers=False)
+        return app
+    if PREVIEWS_ENABLED:
+        PREVIEWS.start()
+    NETWORK.refresh()
+    # start_background_task picks a green thread under eventlet/gevent, an OS thread otherwise
+    socketio.start_background_task(NETWORK.watch)
+    socketio.start_background_task(FEED.run)
+    socketio.start_background_task(_build_index)
+    if os.environ.get('ENABLE_ZEROCONF', '1') == '1':
+        socketio.start_background_task(advertise_zeroconf, NETWORK, int(os.environ.get('PORT', 5000)))
+    _startup_mark('app_ready')
+    return app
+
+
+@bp.before_app_request
+def _wait_for_startup():
+    if INDEX_READY.is_set() or _view_name() in INDEX_FREE_ENDPOINTS:
+        return None
+    if not INDEX_READY.wait(INDEX_READY_TIMEOUT_SECONDS):
+        return jsonify({'error': 'starting up'}), 503, {'Retry-After': '1'}
+    return None
+
+
+def _print_startup_report():
+    import pstats
+    print(json.dumps(STARTUP, indent=2))
+    stats = pstats.Stats(_startup_profiler, stream=sys.stdout)
+    stats.sort_stats('cumulative').print_stats(30)
+
+
+STARTUP['imports'] = round(_IMPORTED - _STARTED, 4)
+_startup_mark('module')
 
 if __name__ == '__main__':
     # run with socketio so real-time features can be added later
-    # eventlet is recommended for production/local LAN tests
+    # ASYNC_MODE=eventlet is recommended for production/local LAN tests; in that mode
+    # socketio.run serves through eventlet's WSGI server instead of Werkzeug.
     # allow_unsafe_werkzeug=True is intentional for local development/testing
+    app = create_app()
+    if PROFILE_STARTUP:
+        INDEX_READY.wait()
+        _startup_profiler.disable()
+        _print_startup_report()
+        sys.exit(0)
 
     # Get LAN IP and port
-    lan_ip = _detect_lan_ip()
     port = int(os.environ.get('PORT', 5000))
+    lan_urls = NETWORK.urls(port)
     
     # Display startup banner with shareable link
     print("\n" + "="*60)
@@ -463,48 +2251,15 @@ if __name__ == '__main__':
     print("="*60)
     print("\n📡 Server is running on:")
     print(f"   Local:   http://127.0.0.1:{port}")
-    print(f"   Network: http://{lan_ip}:{port}")
+    for url in lan_urls:
+        print(f"   Network: {url}")
     print("\n🔗 Share this link with others:")
-    print(f"   👉 http://{lan_ip}:{port}")
-    print(f"\n📱 Scan QR code at: http://{lan_ip}:{port}/qr")
+    print(f"   👉 {lan_urls[0]}")
+    print(f"\n📱 Scan QR code at: {lan_urls[0]}qr")
     print("\n💡 Instructions:")
     print("   1. Open the link above in your browser to become the HOST")
     print("   2. Share the link with others to let them connect as CLIENTS")
     print("   3. As HOST, you'll approve/deny incoming connections")
     print("\n" + "="*60 + "\n")
 
-    # Optionally advertise via Zeroconf/mDNS on the LAN for auto-discovery
-    zeroconf = None
-    info = None
-    if os.environ.get('ENABLE_ZEROCONF', '1') == '1':
-        try:
-            from zeroconf import ServiceInfo, Zeroconf
-            svc_name = f"WifiX on {lan_ip}._wifi-share._tcp.local."  # visible name in mDNS browsers
-            # simple text record
-            desc = {'path': '/'}
-            info = ServiceInfo(
-                "_wifi-share._tcp.local.",
-                svc_name,
-                addresses=[socket.inet_aton(lan_ip)],
-                port=port,
-                properties=desc,
-                server=(socket.gethostname() + '.local.')
-            )
-            zeroconf = Zeroconf()
-            zeroconf.register_service(info)
-            logger.info(f"Zeroconf: registered service {svc_name}")
-        except Exception as e:
-            logger.warning(f"Zeroconf registration failed: {e}")
-
-    def _cleanup_zeroconf():
-        try:
-            if zeroconf and info:
-                zeroconf.unregister_service(info)
-                zeroconf.close()
-                logger.info('Zeroconf: service unregistered')
-        except Exception:
-            pass
-
-    atexit.register(_cleanup_zeroconf)
-
-    socketio.run(app, host='0.0.0.0', port=port, allow_unsafe_werkzeug=True)
+    socketio.run(app, host=BIND_HOST, port=port, allow_unsafe_werkzeug=True)
@@ -0,0 +1,822 @@
+"""Transfer benchmarks for the WifiX backend.
+
+Launches ``app.py`` in a throwaway uploads folder (or targets an already running
+server with ``--url``) and drives it with synthetic clients using only the
+standard library. Results are printed and written as JSON.
+
+Examples::
+
+    python benchmark.py upload --size-mb 1024
+    python benchmark.py upload --size-mb 256 --modes stream --output upload.json
+    python benchmark.py download --size-mb 512 --repeat 5
+    python benchmark.py --server-env ASYNC_MODE=eventlet load --clients 500 --pollers 200
+    python benchmark.py mixed --sizes 1K,1M,64M,1G --uploaders 4 --downloaders 8
+    python benchmark.py listing --files 5000
+    python benchmark.py sockets --clients 300
+    python benchmark.py compression --size-mb 64 --link-mbps 100
+    python benchmark.py delta --size-mb 512 --change-mb 4
+    python benchmark.py --output base.json suite
+    python benchmark.py compare base.json new.json --threshold 10
+
+``--app`` points at a different ``app.py`` (e.g. a checkout of an older release)
+so the same scenario can be compared across implementations; ``compare`` then
+flags metrics that got worse by more than the threshold and exits non-zero.
+"""
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import http.client
+from pathlib import Path
+from urllib.parse import urlparse, quote
+
+BACKEND_DIR = Path(__file__).parent
+BLOCK = os.urandom(1024 * 1024)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """A WifiX server process started for the duration of one measurement."""
+
+    def __init__(self, url=None, env=None, app=None, prefill=0):
+        self.url = url
+        self.app = Path(app) if app else BACKEND_DIR / 'app.py'
+        self.proc = None
+        self.tmpdir = None
+        self.env = env or {}
+        self.prefill = prefill  # files written into the uploads folder before start
+
+    def __enter__(self):
+        if self.url:
+            for i in range(self.prefill):
+                upload_stream(self, f'bench-prefill-{i:06d}.txt', 1024)
+            return self
+        port = _free_port()
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='wifix-bench-')
+        for i in range(self.prefill):
+            Path(self.tmpdir.name, f'bench-prefill-{i:06d}.txt').write_bytes(BLOCK[:1024])
+        env = dict(os.environ, PORT=str(port), UPLOAD_FOLDER=self.tmpdir.name,
+                   ENABLE_ZEROCONF='0', FILE_TTL_SECONDS='0', RATELIMIT_ENABLED='0', **self.env)
+        self.proc = subprocess.Popen([sys.executable, str(self.app)], env=env,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.url = f'http://127.0.0.1:{port}'
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                    return self
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError('server did not start')
+
+    def __exit__(self, *exc):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.wait(timeout=10)
+        if self.tmpdir:
+            self.tmpdir.cleanup()
+
+    def proc_stats(self):
+        """Peak RSS (bytes) and CPU seconds of the spawned server, read from /proc (Linux only)."""
+        if not self.proc:
+            return {}
+        stats = {}
+        try:
+            for line in Path(f'/proc/{self.proc.pid}/status').read_text().splitlines():
+                if line.startswith('VmHWM:'):
+                    stats['peak_rss'] = int(line.split()[1]) * 1024
+            fields = Path(f'/proc/{self.proc.pid}/stat').read_text().rsplit(')', 1)[1].split()
+            stats['cpu_seconds'] = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError):
+            pass
+        return stats
+
+    def connection(self):
+        parsed = urlparse(self.url)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=600)
+
+
+def _body(size):
+    """Yield ``size`` bytes of incompressible data without holding it all in memory."""
+    remaining = size
+    while remaining > 0:
+        chunk = BLOCK[:min(len(BLOCK), remaining)]
+        remaining -= len(chunk)
+        yield chunk
+
+
+def upload_multipart(server, name, size):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n').encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+
+    def parts():
+        yield head
+        yield from _body(size)
+        yield tail
+
+    conn = server.connection()
+    conn.request('POST', '/upload', body=parts(), headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+        'Content-Length': str(len(head) + size + len(tail)),
+    })
+    resp = conn.getresponse()
+    data = json.loads(resp.read() or b'{}')
+    conn.close()
+    return resp.status, data
+
+
+def upload_stream(server, name, size):
+    conn = server.connection()
+    conn.request('POST', f'/upload/stream?filename={quote(name)}', body=_body(size),
+                 headers={'Content-Type': 'application/octet-stream', 'Content-Length': str(size)})
+    resp = conn.getresponse()
+    data = json.loads(resp.read() or b'{}')
+    conn.close()
+    return resp.status, data
+
+
+UPLOAD_MODES = {'multipart': upload_multipart, 'stream': upload_stream}
+
+
+def bench_upload(args):
+    size = args.size_mb * 1024 * 1024
+    results = {}
+    for mode in args.modes:
+        # Fresh server per mode so peak RSS is attributable to that mode alone.
+        with Server(args.url, app=args.app, env=args.server_env) as server:
+            start = time.perf_counter()
+            status, data = UPLOAD_MODES[mode](server, f'bench-{mode}.bin', size)
+            elapsed = time.perf_counter() - start
+            results[mode] = {
+                'status': status,
+                'bytes': size,
+                'seconds': round(elapsed, 3),
+                'mb_per_s': round(size / elapsed / 1e6, 2),
+                'server': data.get('stats'),
+                **server.proc_stats(),
+            }
+    return results
+
+
+def download(server, filename, headers=None):
+    """GET a file, discarding the body; returns (status, headers, bytes received)."""
+    conn = server.connection()
+    conn.request('GET', f'/download/{quote(filename)}', headers=headers or {})
+    resp = conn.getresponse()
+    received = 0
+    while True:
+        buf = resp.read(1024 * 1024)
+        if not buf:
+            break
+        received += len(buf)
+    conn.close()
+    return resp.status, resp.headers, received
+
+
+def bench_download(args):
+    size = args.size_mb * 1024 * 1024
+    with Server(args.url, app=args.app, env=args.server_env) as server:
+        status, data = upload_multipart(server, 'bench-download.bin', size)
+        if status != 201:
+            raise RuntimeError(f'seeding upload failed: {status} {data}')
+        name = data['filename']
+        results = {}
+
+        def measure(label, headers=None, expect=200):
+            before = server.proc_stats().get('cpu_seconds')
+            timings, received, etag = [], 0, None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                status, resp_headers, n = download(server, name, headers)
+                timings.append(time.perf_counter() - start)
+                if status != expect:
+                    raise RuntimeError(f'{label}: expected {expect}, got {status}')
+                received += n
+                etag = resp_headers.get('ETag')
+            after = server.proc_stats().get('cpu_seconds')
+            total = sum(timings)
+            results[label] = {
+                'requests': args.repeat,
+                'bytes': received,
+                'mb_per_s': round(received / total / 1e6, 2) if received else None,
+                'mean_seconds': round(total / args.repeat, 4),
+                'cpu_seconds_per_download': (round((after - before) / args.repeat, 4)
+                                             if before is not None and after is not None else None),
+            }
+            return etag
+
+        etag = measure('full')
+        half = size // 2
+        measure('range_second_half', {'Range': f'bytes={half}-'}, expect=206)
+        if etag:
+            measure('conditional_304', {'If-None-Match': etag}, expect=304)
+    return results
+
+
+def _text_body(size):
+    """Yield ``size`` bytes of log-like text, compressible roughly as real logs/CSV are."""
+    line = 0
+    remaining = size
+    while remaining > 0:
+        chunk = ''.join(f'{1700000000 + line + i},INFO,worker-{(line + i) % 17},request {(line + i) * 7919 % 100003} '
+                        f'served in {(line + i) % 997} ms\n' for i in range(2000)).encode()
+        line += 2000
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
+def bench_compression(args):
+    """Identity vs compressed downloads of a text file and a random file, optionally over a shaped link."""
+    size = args.size_mb * 1024 * 1024
+    env = dict(args.server_env)
+    if args.link_mbps:
+        env.setdefault('BANDWIDTH_LIMIT_BPS', str(int(args.link_mbps * 1e6 / 8)))
+    with Server(args.url, app=args.app, env=env) as server:
+        names = {}
+        for kind, body in (('text', _text_body(size)), ('random', _body(size))):
+            conn = server.connection()
+            conn.request('POST', f'/upload/stream?filename=bench-compress-{kind}.'
+                         f'{"log" if kind == "text" else "bin"}', body=body,
+                         headers={'Content-Type': 'application/octet-stream', 'Content-Length': str(size)})
+            resp = conn.getresponse()
+            data = json.loads(resp.read() or b'{}')
+            conn.close()
+            if resp.status != 201:
+                raise RuntimeError(f'seeding upload failed: {resp.status} {data}')
+            names[kind] = data['filename']
+
+        results = {'size': size, 'link_mbps': args.link_mbps}
+        for kind, name in names.items():
+            for coding in ('identity', *args.encodings):
+                timings, wire, served = [], 0, None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    status, headers, n = download(server, name, {'Accept-Encoding': coding})
+                    timings.append(time.perf_counter() - start)
+                    if status != 200:
+                        raise RuntimeError(f'{kind}/{coding}: got {status}')
+                    wire += n
+                    served = headers.get('Content-Encoding', 'identity')
+                total = sum(timings)
+                results[f'{kind}_{coding}'] = {
+                    'content_encoding': served,
+                    'wire_bytes': wire // args.repeat,
+                    'ratio': round(wire / (size * args.repeat), 3),
+                    'mean_seconds': round(total / args.repeat, 4),
+                    # file bytes delivered per second, i.e. what the user experiences
+                    'effective_mb_per_s': round(size * args.repeat / total / 1e6, 2),
+                }
+            base = results[f'{kind}_identity']['mean_seconds']
+            for coding in args.encodings:
+                entry = results[f'{kind}_{coding}']
+                entry['speedup'] = round(base / entry['mean_seconds'], 2) if entry['mean_seconds'] else None
+    return results
+
+
+def bench_delta(args):
+    """Re-share a modified copy of a large file: full upload vs delta upload."""
+    import random
+    import delta_sync
+
+    size = args.size_mb * 1024 * 1024
+    change = args.change_mb * 1024 * 1024
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp, Server(args.url, app=args.app, env=args.server_env) as server:
+        old, new = Path(tmp) / 'old.bin', Path(tmp) / 'new.bin'
+        with open(old, 'wb') as fh:
+            for chunk in _body(size):
+                fh.write(os.urandom(len(chunk)))
+        # The new version: the same data with `change` bytes rewritten in place (split over
+        # --edits spots) plus a small insertion, which shifts everything after it.
+        data = bytearray(old.read_bytes())
+        for _ in range(args.edits):
+            at = rng.randrange(0, max(1, size - change // args.edits))
+            data[at:at + change // args.edits] = os.urandom(change // args.edits)
+        at = rng.randrange(0, size)
+        data[at:at] = b'inserted by benchmark.py'
+        new.write_bytes(data)
+        del data
+
+        start = time.perf_counter()
+        conn = server.connection()
+        with open(old, 'rb') as body:
+            conn.request('POST', '/upload/stream?filename=bench-delta.bin', body=body,
+                         headers={'Content-Type': 'application/octet-stream', 'Content-Length': str(size)})
+            resp = conn.getresponse()
+            seeded = json.loads(resp.read() or b'{}')
+        conn.close()
+        full_seconds = time.perf_counter() - start
+        if resp.status != 201:
+            raise RuntimeError(f'seeding upload failed: {resp.status} {seeded}')
+
+        start = time.perf_counter()
+        result = delta_sync.upload_delta(server.url, seeded['filename'], str(new), 'bench-delta.bin')
+        delta_seconds = time.perf_counter() - start
+        new_size = new.stat().st_size
+        return {
+            'size': new_size,
+            'changed_bytes': change,
+            'full_upload_seconds': round(full_seconds, 3),
+            'delta_seconds': round(delta_seconds, 3),
+            'wire_bytes': result['client']['wire_bytes'],
+            'wire_ratio': round(result['client']['wire_bytes'] / new_size, 4),
+            'copied_bytes': result['delta']['copied_bytes'],
+            'literal_bytes': result['delta']['literal_bytes'],
+            'sha256_match': result['sha256'] == hashlib.sha256(new.read_bytes()).hexdigest(),
+            'server': result.get('stats'),
+            **server.proc_stats(),
+        }
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _latency_summary(timings):
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2) if timings else None,
+        'p99_ms': round(percentile(timings, 99) * 1000, 2) if timings else None,
+        'max_ms': round(max(timings) * 1000, 2) if timings else None,
+    }
+
+
+def _long_poll(server, stop):
+    """Hold an Engine.IO long-polling connection open, as a browser Socket.IO client does."""
+    try:
+        conn = server.connection()
+        conn.request('GET', '/socket.io/?EIO=4&transport=polling')
+        body = conn.getresponse().read().decode(errors='replace')
+        sid = json.loads(body[body.index('{'):])['sid']
+        conn.close()
+        while not stop.is_set():
+            conn = server.connection()
+            conn.request('GET', f'/socket.io/?EIO=4&transport=polling&sid={sid}')
+            payload = conn.getresponse().read()
+            conn.close()
+            if payload.startswith(b'2'):  # ping -> pong keeps the session alive
+                conn = server.connection()
+                conn.request('POST', f'/socket.io/?EIO=4&transport=polling&sid={sid}', body=b'3')
+                conn.getresponse().read()
+                conn.close()
+    except Exception:
+        pass
+
+
+def bench_load(args):
+    """Many concurrent clients hitting cheap endpoints while long-poll sockets hold connections."""
+    with Server(args.url, app=args.app, env=args.server_env) as server:
+        status, data = upload_multipart(server, 'bench-load.bin', 64 * 1024)
+        if status != 201:
+            raise RuntimeError(f'seeding upload failed: {status} {data}')
+        paths = ['/files', '/info', f"/download/{quote(data['filename'])}"]
+        stop = threading.Event()
+        pollers = [threading.Thread(target=_long_poll, args=(server, stop), daemon=True)
+                   for _ in range(args.pollers)]
+        for t in pollers:
+            t.start()
+
+        timings, errors, lock = [], [0], threading.Lock()
+
+        def client(i):
+            local = []
+            deadline = time.time() + args.duration
+            n = i
+            while time.time() < deadline:
+                path = paths[n % len(paths)]
+                n += 1
+                start = time.perf_counter()
+                try:
+                    conn = server.connection()
+                    conn.request('GET', path)
+                    resp = conn.getresponse()
+                    resp.read()
+                    conn.close()
+                    if resp.status >= 400:
+                        raise RuntimeError(resp.status)
+                    local.append(time.perf_counter() - start)
+                except Exception:
+                    with lock:
+                        errors[0] += 1
+            with lock:
+                timings.extend(local)
+
+        clients = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        result = {
+            'clients': args.clients,
+            'pollers': args.pollers,
+            'duration': args.duration,
+            'errors': errors[0],
+            'requests_per_s': round(len(timings) / args.duration, 1),
+            **_latency_summary(timings),
+            **server.proc_stats(),
+        }
+        stop.set()
+    return result
+
+
+def _parse_size(text):
+    """'1K', '64M', '1G' or plain bytes -> bytes."""
+    text = text.strip().upper().rstrip('B')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _request(server, method, path, headers=None):
+    """Issue one request and drain the body; returns (status, headers, seconds)."""
+    start = time.perf_counter()
+    conn = server.connection()
+    conn.request(method, path, headers=headers or {})
+    resp = conn.getresponse()
+    resp.read()
+    conn.close()
+    return resp.status, resp.headers, time.perf_counter() - start
+
+
+def _cpu_delta(server, before):
+    after = server.proc_stats().get('cpu_seconds')
+    return round(after - before, 3) if before is not None and after is not None else None
+
+
+def bench_mixed(args):
+    """Concurrent uploaders and downloaders over a spread of file sizes."""
+    sizes = [_parse_size(s) for s in args.sizes.split(',')]
+    with Server(args.url, app=args.app, env=args.server_env) as server:
+        seeded = {}
+        for size in sizes:
+            status, data = upload_stream(server, f'bench-mixed-{size}.bin', size)
+            if status != 201:
+                raise RuntimeError(f'seeding upload failed: {status} {data}')
+            seeded[size] = data['filename']
+        samples = {('upload', size): [] for size in sizes}
+        samples.update({('download', size): [] for size in sizes})
+        errors, lock = [0], threading.Lock()
+
+        def worker(direction, i):
+            for r in range(args.rounds):
+                size = sizes[(i + r) % len(sizes)]
+                start = time.perf_counter()
+                try:
+                    if direction == 'upload':
+                        status, _ = upload_stream(server, f'bench-mixed-{i}-{r}.bin', size)
+                        ok = status == 201
+                    else:
+                        status, _, received = download(server, seeded[size])
+                        ok = status == 200 and received == size
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        samples[(direction, size)].append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=worker, args=('upload', i)) for i in range(args.uploaders)]
+        threads += [threading.Thread(target=worker, args=('download', i)) for i in range(args.downloaders)]
+        cpu_before = server.proc_stats().get('cpu_seconds')
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - start
+
+        results = {'uploaders': args.uploaders, 'downloaders': args.downloaders, 'errors': errors[0]}
+        total_bytes = 0
+        for (direction, size), timings in samples.items():
+            moved = size * len(timings)
+            total_bytes += moved
+            results.setdefault(direction, {})[str(size)] = {
+                **_latency_summary(timings),
+                'mb_per_s': round(moved / sum(timings) / 1e6, 2) if timings else None,
+            }
+        results.update({
+            'seconds': round(wall, 3),
+            'aggregate_mb_per_s': round(total_bytes / wall / 1e6, 2),
+            'cpu_seconds': _cpu_delta(server, cpu_before),
+            **server.proc_stats(),
+        })
+    return results
+
+
+def bench_listing(args):
+    """Listing, pagination, conditional listing, /info and /qr latency with many files present."""
+    with Server(args.url, app=args.app, env=args.server_env, prefill=args.files) as server:
+        results = {'files': args.files}
+        cpu_before = server.proc_stats().get('cpu_seconds')
+        _, headers, _ = _request(server, 'GET', '/files')
+        etag = headers.get('ETag')
+        cases = {
+            'files_full': ('/files', None),
+            'files_page_100': ('/files?limit=100', None),
+            'info': ('/info', None),
+            'qr': ('/qr', None),
+        }
+        if etag:
+            cases['files_304'] = ('/files', {'If-None-Match': etag})
+        for label, (path, headers) in cases.items():
+            timings = []
+            for _ in range(args.repeat):
+                status, _, elapsed = _request(server, 'GET', path, headers)
+                if status >= 400:
+                    raise RuntimeError(f'{label}: HTTP {status}')
+                timings.append(elapsed)
+            results[label] = _latency_summary(timings)
+        results['cpu_seconds'] = _cpu_delta(server, cpu_before)
+        results.update(server.proc_stats())
+    return results
+
+
+class SocketIOClient:
+    """Minimal Socket.IO v5 client over Engine.IO v4 long-polling, enough to
+    exercise the host approval flow without third-party packages."""
+
+    def __init__(self, server):
+        self.server = server
+        self.eio_sid = None
+        self.sid = None
+
+    def _call(self, method, body=None):
+        path = '/socket.io/?EIO=4&transport=polling'
+        if self.eio_sid:
+            path += f'&sid={self.eio_sid}'
+        conn = self.server.connection()
+        conn.request(method, path, body=body,
+                     headers={'Content-Type': 'text/plain;charset=UTF-8'} if body else {})
+        resp = conn.getresponse()
+        text = resp.read().decode(errors='replace')
+        conn.close()
+        if resp.status != 200:
+            raise RuntimeError(f'engine.io {method} failed: {resp.status} {text[:80]}')
+        return text
+
+    def connect(self):
+        text = self._call('GET')
+        self.eio_sid = json.loads(text[text.index('{'):])['sid']
+        self._call('POST', '40')
+        while self.sid is None:
+            self.poll()
+
+    def emit(self, event, data=None):
+        self._call('POST', '42' + json.dumps([event, data if data is not None else {}]))
+
+    def poll(self):
+        """One long-poll round trip; returns the Socket.IO events received as (name, data)."""
+        events = []
+        for packet in self._call('GET').split('\x1e'):
+            if packet == '2':
+                self._call('POST', '3')
+            elif packet.startswith('40'):
+                self.sid = json.loads(packet[2:] or '{}').get('sid', self.eio_sid)
+            elif packet.startswith('42'):
+                payload = json.loads(packet[2:])
+                events.append((payload[0], payload[1] if len(payload) > 1 else None))
+        return events
+
+    def wait_for(self, name):
+        while True:
+            for event, data in self.poll():
+                if event == name:
+                    return data
+
+    def close(self):
+        try:
+            self._call('POST', '1')
+        except Exception:
+            pass
+
+
+def bench_sockets(args):
+    """Hundreds of sockets asking an auto-approving host to connect."""
+    with Server(args.url, app=args.app, env=args.server_env) as server:
+        host = SocketIOClient(server)
+        host.connect()
+        host.emit('become_host')
+        host.wait_for('host_status')
+        stop = threading.Event()
+
+        def approve_loop():
+            try:
+                while not stop.is_set():
+                    for event, data in host.poll():
+                        if event == 'incoming_request':
+                            host.emit('approve_request', {'sid': data['sid']})
+            except Exception:
+                pass
+
+        threading.Thread(target=approve_loop, daemon=True).start()
+        connect_times, approve_times, errors, lock = [], [], [0], threading.Lock()
+        barrier = threading.Barrier(args.clients)
+
+        def client(i):
+            sock = SocketIOClient(server)
+            try:
+                start = time.perf_counter()
+                sock.connect()
+                connected = time.perf_counter()
+                barrier.wait(timeout=120)
+                asked = time.perf_counter()
+                sock.emit('request_connect', {'name': f'bench-{i}'})
+                sock.wait_for('request_approved')
+                done = time.perf_counter()
+                with lock:
+                    connect_times.append(connected - start)
+                    approve_times.append(done - asked)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            finally:
+                sock.close()
+
+        cpu_before = server.proc_stats().get('cpu_seconds')
+        start = time.perf_counter()
+        clients = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+        for t in clients:
+            t.start()
+        for t in clients:
+            t.join()
+        wall = time.perf_counter() - start
+        stop.set()
+        result = {
+            'clients': args.clients,
+            'errors': errors[0],
+            'seconds': round(wall, 3),
+            'approvals_per_s': round(len(approve_times) / wall, 1) if wall else None,
+            'connect': _latency_summary(connect_times),
+            'approval': _latency_summary(approve_times),
+            'cpu_seconds': _cpu_delta(server, cpu_before),
+            **server.proc_stats(),
+        }
+        host.close()
+    return result
+
+
+SUITE = ('download', 'mixed', 'listing', 'sockets', 'load', 'compression', 'delta')
+
+
+def bench_suite(args, scenarios):
+    """Every scenario with its default parameters, one fresh server each."""
+    results = {}
+    for name in SUITE:
+        sub_args = scenarios[name].parse_args([])
+        sub_args.url, sub_args.app, sub_args.server_env = args.url, args.app, args.server_env
+        results[name] = sub_args.func(sub_args)
+    return results
+
+
+# Metric name suffixes and whether a larger value is better.
+HIGHER_IS_BETTER = ('_per_s',)
+LOWER_IS_BETTER = ('_ms', 'seconds', 'peak_rss', 'errors', 'cpu_seconds_per_download')
+
+
+def _flatten(node, prefix=''):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _flatten(value, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, node
+
+
+def compare_reports(base, new, threshold):
+    """List (metric, base, new, change %, regressed) for metrics present in both reports."""
+    base_metrics = dict(_flatten(base.get('results', {})))
+    rows = []
+    for key, value in _flatten(new.get('results', {})):
+        leaf = key.rsplit('.', 1)[-1]
+        if key not in base_metrics:
+            continue
+        if leaf.endswith(HIGHER_IS_BETTER):
+            sign = -1
+        elif leaf.endswith(LOWER_IS_BETTER):
+            sign = 1
+        else:
+            continue
+        old = base_metrics[key]
+        if old == 0:
+            change = 0.0 if value == 0 else float('inf')
+        else:
+            change = (value - old) / abs(old) * 100
+        rows.append((key, old, value, change, sign * change > threshold))
+    return rows
+
+
+def run_compare(args):
+    base = json.loads(Path(args.base).read_text())
+    new = json.loads(Path(args.new).read_text())
+    rows = compare_reports(base, new, args.threshold)
+    regressions = [r for r in rows if r[4]]
+    width = max((len(r[0]) for r in rows), default=10)
+    for key, old, value, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f'{key:<{width}}  {old:>12.4g}  {value:>12.4g}  {change:>+8.1f}%  {flag}')
+    print(f'{len(regressions)} regression(s) over {args.threshold}% in {len(rows)} metrics')
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', help='benchmark a running server instead of spawning one')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--app', help='path to the app.py to spawn (default: this checkout)')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the spawned server (repeatable)')
+    sub = parser.add_subparsers(dest='scenario', required=True)
+
+    up = sub.add_parser('upload', help='single large upload, multipart vs raw stream')
+    up.add_argument('--size-mb', type=int, default=1024)
+    up.add_argument('--modes', nargs='+', choices=sorted(UPLOAD_MODES), default=sorted(UPLOAD_MODES))
+    up.set_defaults(func=bench_upload)
+
+    down = sub.add_parser('download', help='full, ranged and conditional downloads of one file')
+    down.add_argument('--size-mb', type=int, default=256)
+    down.add_argument('--repeat', type=int, default=5)
+    down.set_defaults(func=bench_download)
+
+    load = sub.add_parser('load', help='concurrent clients: p50/p99 latency and server memory')
+    load.add_argument('--clients', type=int, default=100)
+    load.add_argument('--pollers', type=int, default=50, help='idle Socket.IO long-poll connections')
+    load.add_argument('--duration', type=float, default=20)
+    load.set_defaults(func=bench_load)
+
+    mixed = sub.add_parser('mixed', help='concurrent uploaders and downloaders across file sizes')
+    mixed.add_argument('--sizes', default='1K,64K,1M,16M,128M',
+                       help='comma-separated sizes, e.g. 1K,1M,1G (default: %(default)s)')
+    mixed.add_argument('--uploaders', type=int, default=4)
+    mixed.add_argument('--downloaders', type=int, default=8)
+    mixed.add_argument('--rounds', type=int, default=5, help='transfers per worker')
+    mixed.set_defaults(func=bench_mixed)
+
+    listing = sub.add_parser('listing', help='/files, /info and /qr latency with thousands of files')
+    listing.add_argument('--files', type=int, default=5000)
+    listing.add_argument('--repeat', type=int, default=50)
+    listing.set_defaults(func=bench_listing)
+
+    sockets = sub.add_parser('sockets', help='Socket.IO request_connect/approve_request round trips')
+    sockets.add_argument('--clients', type=int, default=200)
+    sockets.set_defaults(func=bench_sockets)
+
+    compression = sub.add_parser('compression', help='compressed vs identity downloads, text and random data')
+    compression.add_argument('--size-mb', type=int, default=16)
+    compression.add_argument('--repeat', type=int, default=3,
+                             help='downloads per case; from the second on, the cached variant is served')
+    compression.add_argument('--encodings', nargs='+', default=['gzip'],
+                             help='Accept-Encoding values to try besides identity (default: %(default)s)')
+    compression.add_argument('--link-mbps', type=float, default=0,
+                             help='shape the spawned server to this link speed via BANDWIDTH_LIMIT_BPS')
+    compression.set_defaults(func=bench_compression)
+
+    delta = sub.add_parser('delta', help='delta upload of a modified large file vs a full upload')
+    delta.add_argument('--size-mb', type=int, default=64)
+    delta.add_argument('--change-mb', type=int, default=2, help='bytes rewritten in the new version')
+    delta.add_argument('--edits', type=int, default=8, help='number of places the changes are spread over')
+    delta.set_defaults(func=bench_delta)
+
+    scenarios = {'upload': up, 'download': down, 'load': load, 'mixed': mixed,
+                 'listing': listing, 'sockets': sockets, 'compression': compression, 'delta': delta}
+    suite = sub.add_parser('suite', help=f"run {', '.join(SUITE)} with default parameters")
+    suite.set_defaults(func=lambda a: bench_suite(a, scenarios))
+
+    compare = sub.add_parser('compare', help='diff two JSON reports and flag regressions')
+    compare.add_argument('base')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=10.0,
+                         help='percent change counted as a regression (default: %(default)s)')
+
+    args = parser.parse_args(argv)
+    if args.scenario == 'compare':
+        sys.exit(run_compare(args))
+    args.server_env = dict(item.split('=', 1) for item in args.server_env)
+    report = {'scenario': args.scenario, 'timestamp': time.time(), 'results': args.func(args)}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text)
+
+
+if __name__ == '__main__':
+    main()
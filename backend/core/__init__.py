@@ -0,0 +1,5 @@
+"""Self-contained subsystems of the WifiX server.
+
+``backend/app.py`` holds the Flask routes and Socket.IO handlers and wires these
+together; nothing in here imports the app.
+"""
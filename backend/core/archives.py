@@ -0,0 +1,69 @@
+"""Streaming archives for bulk downloads.
+
+ZIP (stored, ZIP64-capable, written with data descriptors) or TAR. Archive
+bytes are produced per 1 MiB read, so memory stays bounded and nothing is
+written to disk.
+"""
+import tarfile
+import zipfile
+
+from .fileio import STREAM_BUFFER_SIZE, iter_file, run_io
+
+
+class ChunkSink:
+    """Write-only file object collecting archive output until the generator drains it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def iter_zip(files):
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for path in files:
+            zinfo = zipfile.ZipInfo.from_file(path, path.name)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as src, zf.open(zinfo, 'w', force_zip64=zinfo.file_size >= zipfile.ZIP64_LIMIT) as dst:
+                for buf in iter(lambda: run_io(src.read, STREAM_BUFFER_SIZE), b''):
+                    dst.write(buf)
+                    yield from sink.drain()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def tar_members(files):
+    """(header bytes, path, size, padding) per file; sizes are known up front so the
+    archive length can be sent as Content-Length."""
+    members = []
+    for path in files:
+        st = path.stat()
+        tinfo = tarfile.TarInfo(path.name)
+        tinfo.size = st.st_size
+        tinfo.mtime = int(st.st_mtime)
+        tinfo.mode = 0o644
+        header = tinfo.tobuf(format=tarfile.PAX_FORMAT)
+        members.append((header, path, st.st_size, -st.st_size % tarfile.BLOCKSIZE))
+    body = sum(len(h) + size + pad for h, _, size, pad in members) + 2 * tarfile.BLOCKSIZE
+    trailer = 2 * tarfile.BLOCKSIZE + (-body % tarfile.RECORDSIZE)
+    return members, trailer, body - 2 * tarfile.BLOCKSIZE + trailer
+
+
+def iter_tar(members, trailer):
+    for header, path, size, pad in members:
+        yield header
+        yield from iter_file(path, 0, size, STREAM_BUFFER_SIZE)
+        if pad:
+            yield b'\0' * pad
+    yield b'\0' * trailer
@@ -0,0 +1,114 @@
+"""Sinks for batch uploads.
+
+Each file of a batch is written straight into PARTIAL_FOLDER while the body is
+parsed and hashed on the way; the disk writes go through a small I/O pool so
+parsing the next buffer overlaps with writing the previous one.
+"""
+import hashlib
+import os
+import tarfile
+import uuid
+from collections import deque
+from pathlib import Path
+
+from .fileio import STREAM_BUFFER_SIZE, pwrite_all, run_io, submit_io
+
+BATCH_MAX_PENDING_WRITES = 4  # buffers in flight per file before the parser waits for the disk
+
+
+class BatchPart:
+    """Writable sink for one file of a batch: buffers into STREAM_BUFFER_SIZE pieces and
+    hands them to the I/O pool as positional writes, so order of completion doesn't matter.
+
+    ``pool`` returns the executor to submit the writes to.
+    """
+
+    def __init__(self, original: str, folder: Path, pool):
+        self.original = original
+        self.tmp = folder / f"{uuid.uuid4().hex}.batch"
+        self.fd = os.open(self.tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self._pool = pool
+        self._buf = bytearray()
+        self._offset = 0
+        self._pending = deque()
+
+    def write(self, data) -> int:
+        self.hasher.update(data)
+        self.size += len(data)
+        self._buf += data
+        if len(self._buf) >= STREAM_BUFFER_SIZE:
+            self._flush()
+        return len(data)
+
+    def _flush(self):
+        if not self._buf:
+            return
+        buf, self._buf = bytes(self._buf), bytearray()
+        if not hasattr(os, 'pwrite'):  # pragma: no cover - Windows
+            run_io(os.write, self.fd, buf)
+        else:
+            while len(self._pending) >= BATCH_MAX_PENDING_WRITES:
+                self._pending.popleft().result()
+            self._pending.append(submit_io(self._pool(), pwrite_all, self.fd, buf, self._offset))
+        self._offset += len(buf)
+
+    def seek(self, *args):
+        return 0  # Werkzeug rewinds finished parts; we never read them back
+
+    def finish(self):
+        """Wait for every write to land, then close the file."""
+        try:
+            self._flush()
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def discard(self):
+        try:
+            self.finish()
+        except Exception:
+            pass
+        try:
+            self.tmp.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class DiscardPart:
+    """Sink for parts the batch rejects (bad name, too many files): read and dropped."""
+
+    def __init__(self, original: str):
+        self.original = original
+
+    def write(self, data) -> int:
+        return len(data)
+
+    def seek(self, *args):
+        return 0
+
+    def close(self):
+        pass
+
+
+def read_tar(stream, make_part, skipped: list):
+    """Feed every regular file of the TAR ``stream`` into ``make_part(name)``."""
+    with tarfile.open(fileobj=stream, mode='r|*') as tf:
+        for member in tf:
+            if member.isdir():
+                continue
+            name = member.name.rsplit('/', 1)[-1]
+            if not member.isfile():
+                skipped.append({'name': name, 'error': 'not a regular file'})
+                continue
+            sink = make_part(name)
+            src = tf.extractfile(member)
+            for buf in iter(lambda: src.read(STREAM_BUFFER_SIZE), b''):
+                sink.write(buf)
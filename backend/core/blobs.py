@@ -0,0 +1,91 @@
+"""Content-addressed upload storage (deduplication)."""
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Content-addressed storage under META_FOLDER/blobs.
+
+    Each blob is named by its SHA-256 and every user-visible file holding that
+    content is a hard link to it, so the link count is the reference count and
+    downloads keep working on plain paths. The blob goes away with its last link.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self._by_inode = {}
+        self._lock = threading.Lock()
+
+    def path(self, digest: str) -> Path:
+        return self.folder / digest
+
+    def load(self):
+        """Index blobs by inode and drop those no visible file references any more."""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        removed = 0
+        with self._lock:
+            self._by_inode = {}
+            for blob in self.folder.iterdir():
+                st = blob.stat()
+                if st.st_nlink <= 1:
+                    blob.unlink()
+                    removed += 1
+                else:
+                    self._by_inode[(st.st_dev, st.st_ino)] = blob.name
+        if removed:
+            logger.info(f"Dedup: removed {removed} unreferenced blob(s)")
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def link(self, digest: str, dest: Path):
+        """Publish an existing blob under ``dest``."""
+        blob = self.path(digest)
+        try:
+            os.link(blob, dest)
+        except OSError as e:
+            # filesystems without hard links (FAT/exFAT): fall back to a private copy
+            logger.warning(f"Dedup: hard link failed ({e}); copying {digest[:12]}")
+            shutil.copyfile(blob, dest)
+
+    def adopt(self, tmp: Path, digest: str, dest: Path) -> bool:
+        """Move freshly written ``tmp`` into the store and publish it at ``dest``.
+
+        Returns True if identical content was already stored (``tmp`` is discarded).
+        """
+        blob = self.path(digest)
+        with self._lock:
+            duplicate = blob.exists()
+            if duplicate:
+                tmp.unlink()
+            else:
+                os.replace(tmp, blob)
+                st = blob.stat()
+                self._by_inode[(st.st_dev, st.st_ino)] = digest
+            self.link(digest, dest)
+        return duplicate
+
+    def unlink(self, path: Path):
+        """Remove a visible file and its blob if that was the last reference."""
+        # one critical section with adopt(): the link count is the reference count
+        with self._lock:
+            st = path.stat()
+            path.unlink()
+            digest = self._by_inode.get((st.st_dev, st.st_ino))
+            if digest is None:
+                return
+            blob = self.path(digest)
+            try:
+                if blob.stat().st_nlink <= 1:
+                    blob.unlink()
+                    self._by_inode.pop((st.st_dev, st.st_ino), None)
+            except FileNotFoundError:
+                self._by_inode.pop((st.st_dev, st.st_ino), None)
+
+    def stats(self) -> dict:
+        return {'blobs': len(self._by_inode)}
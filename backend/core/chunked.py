@@ -0,0 +1,253 @@
+"""Resumable chunked uploads.
+
+init -> PUT chunks at arbitrary offsets (possibly in parallel) -> finalize.
+Chunks are written straight into a preallocated file under PARTIAL_FOLDER, and
+the received byte ranges are persisted next to it so an upload survives both
+dropped connections and server restarts.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .fileio import STREAM_BUFFER_SIZE, hash_file, iter_file
+from .state import hash_pin
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkedUpload:
+    """State of one resumable upload: target size and the byte ranges received so far."""
+
+    def __init__(self, store, upload_id, filename, size, pin_hash='', created=None, ranges=None, ttl=None,
+                 sha256=None):
+        self.store = store
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.pin_hash = pin_hash  # never keep the PIN itself in the partial manifest
+        self.reserved = 0  # bytes held against the storage quota
+        self.ttl = ttl
+        self.created = created or time.time()
+        self.updated = self.created
+        self.ranges = [tuple(r) for r in (ranges or [])]  # sorted, merged [start, end) pairs
+        self.lock = threading.Lock()
+        # Chunk PUTs register as writers; finalize closes the upload to new chunks and
+        # waits for the writers to drain before the data file is moved.
+        self.writers = 0
+        self.closed = False
+        self.discarded = False
+        self.idle = threading.Condition(self.lock)
+        self.sha256 = sha256  # digest the client expects, if it told us
+        # SHA-256 of the contiguous prefix [0, hashed). Only the holder of hash_lock
+        # feeds it; hash state can't be persisted, so a restart rehashes at finalize.
+        self.hasher = hashlib.sha256()
+        self.hashed = 0
+        self.hash_lock = threading.Lock()
+
+    @property
+    def data_path(self) -> Path:
+        return self.store.folder / f"{self.upload_id}.part"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.store.folder / f"{self.upload_id}.json"
+
+    def add_range(self, start: int, end: int):
+        """Record [start, end) as received, merging with adjacent/overlapping ranges."""
+        if end <= start:
+            return
+        merged = []
+        for s, e in sorted(self.ranges + [(start, end)]):
+            if merged and s <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+            else:
+                merged.append((s, e))
+        self.ranges = merged
+        self.updated = time.time()
+
+    @property
+    def received(self) -> int:
+        return sum(e - s for s, e in self.ranges)
+
+    @property
+    def next_offset(self) -> int:
+        """First byte not yet received (the resume point for a sequential client)."""
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    @property
+    def complete(self) -> bool:
+        return self.ranges == [(0, self.size)] or self.size == 0
+
+    def advance_hash(self, wait: bool = False):
+        """Hash received bytes beyond the hashed prefix, i.e. chunks that arrived ahead of order.
+
+        In-order chunks are hashed while they are written (see ``chunked_upload_put``),
+        so for a sequential client this finds nothing to do.
+        """
+        if not self.hash_lock.acquire(blocking=wait):
+            return  # someone else is hashing and will pick these bytes up
+        try:
+            while True:
+                with self.lock:
+                    start, end = self.hashed, self.next_offset
+                if end <= start:
+                    return
+                for buf in iter_file(self.data_path, start, end - start, STREAM_BUFFER_SIZE):
+                    self.hasher.update(buf)
+                    self.hashed += len(buf)
+        finally:
+            self.hash_lock.release()
+
+    def digest(self) -> str:
+        self.advance_hash(wait=True)
+        if self.hashed != self.size:
+            return hash_file(self.data_path)
+        return self.hasher.hexdigest()
+
+    def save_meta(self):
+        tmp = self.meta_path.with_suffix('.json.tmp')
+        tmp.write_text(json.dumps({
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'pin_hash': self.pin_hash,
+            'ttl': self.ttl,
+            'created': self.created,
+            'ranges': self.ranges,
+            'sha256': self.sha256,
+        }))
+        os.replace(tmp, self.meta_path)
+
+    def status(self) -> dict:
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'received': self.received,
+            'ranges': [list(r) for r in self.ranges],
+            'next_offset': self.next_offset,
+            'complete': self.complete,
+            'chunk_size': self.store.chunk_size,
+        }
+
+    def begin_write(self) -> bool:
+        """Register a chunk writer; False once the upload is finalizing or discarded."""
+        with self.lock:
+            if self.closed:
+                return False
+            self.writers += 1
+            return True
+
+    def end_write(self, start: int, end: int) -> dict:
+        """Record a writer's bytes (unless the upload was discarded meanwhile) and deregister it."""
+        with self.lock:
+            try:
+                if not self.discarded:
+                    self.add_range(start, end)
+                    try:
+                        self.save_meta()
+                    except Exception as e:
+                        logger.error(f"Failed to persist chunk state for {self.upload_id}: {e}")
+                return self.status()
+            finally:
+                self.writers -= 1
+                self.idle.notify_all()
+
+    def close(self, timeout: float) -> bool:
+        """Stop accepting chunks and wait for in-flight ones; reopens and returns False on timeout."""
+        with self.lock:
+            self.closed = True
+            if self.idle.wait_for(lambda: self.writers == 0, timeout):
+                return True
+            self.closed = False
+            return False
+
+    def reopen(self):
+        with self.lock:
+            self.closed = False
+
+    def discard(self):
+        with self.lock:
+            self.closed = self.discarded = True
+        for p in (self.data_path, self.meta_path):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+        self.store.quota.release(self.reserved)
+        self.reserved = 0
+
+
+class ChunkedUploads:
+    """Unfinished uploads by id; their data and manifests live in ``folder``.
+
+    ``quota`` is the QuotaManager holding each upload's reservation.
+    """
+
+    def __init__(self, folder: Path, chunk_size: int, ttl_seconds: int, quota):
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.ttl_seconds = ttl_seconds
+        self.quota = quota
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def new(self, filename, size, pin_hash='', ttl=None, sha256=None) -> ChunkedUpload:
+        """A fresh upload; not registered until ``add``."""
+        return ChunkedUpload(self, uuid.uuid4().hex, filename, size, pin_hash, ttl=ttl, sha256=sha256)
+
+    def load(self):
+        """Re-register unfinished uploads found on disk (e.g. after a restart)."""
+        for meta in self.folder.glob('*.json'):
+            try:
+                data = json.loads(meta.read_text())
+                pin_hash = data.get('pin_hash') or (hash_pin(data['pin']) if data.get('pin') else '')
+                up = ChunkedUpload(self, data['upload_id'], data['filename'], data['size'],
+                                   pin_hash, data.get('created'), data.get('ranges'),
+                                   data.get('ttl'), data.get('sha256'))
+                if up.data_path.exists():
+                    self.add(up)
+                else:
+                    meta.unlink()
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable partial upload {meta.name}: {e}")
+
+    def purge_stale(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            stale = [u for u in self._uploads.values() if u.updated < cutoff]
+            for up in stale:
+                self._uploads.pop(up.upload_id, None)
+        for up in stale:
+            up.discard()
+            logger.info(f"Discarded stale chunked upload {up.upload_id} ({up.filename})")
+
+    def add(self, up: ChunkedUpload):
+        with self._lock:
+            self._uploads[up.upload_id] = up
+
+    def get(self, upload_id):
+        with self._lock:
+            return self._uploads.get(upload_id)
+
+    def pop(self, upload_id):
+        with self._lock:
+            return self._uploads.pop(upload_id, None)
+
+    def values(self) -> list:
+        with self._lock:
+            return list(self._uploads.values())
+
+    def __getitem__(self, upload_id) -> ChunkedUpload:
+        with self._lock:
+            return self._uploads[upload_id]
+
+    def __len__(self):
+        return len(self._uploads)
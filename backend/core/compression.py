@@ -0,0 +1,221 @@
+"""Download compression.
+
+Full-body GETs negotiate Accept-Encoding (zstd and br when their packages are
+installed, gzip always). Whether a file is worth compressing is decided once
+per version from its MIME type, or by deflating a 64 KiB sample when the type
+says nothing. The first compressed GET streams; from the second on, the
+output is also teed into META_FOLDER/compressed so later requests are plain
+(sendfile-able) file responses. Range requests always get the identity bytes.
+"""
+import hashlib
+import os
+import threading
+import uuid
+import zlib
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+from .fileio import iter_file, run_io
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_SAMPLE_BYTES = 64 * 1024
+COMPRESS_MIN_SAVING = 0.1  # sample must shrink by at least 10%
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/xml', 'application/javascript',
+                      'application/x-javascript', 'application/x-sh', 'application/x-yaml',
+                      'application/sql', 'image/svg+xml', 'image/bmp', 'application/x-tar')
+INCOMPRESSIBLE_TYPES = ('image/', 'video/', 'audio/', 'font/woff', 'application/zip', 'application/gzip',
+                        'application/x-gzip', 'application/x-bzip2', 'application/x-xz', 'application/zstd',
+                        'application/x-7z-compressed', 'application/x-rar', 'application/vnd.rar',
+                        'application/java-archive', 'application/vnd.openxmlformats', 'application/epub+zip')
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class _BrotliStream:
+    """zlib-style compress()/flush() over brotli's process()/finish()."""
+
+    def __init__(self):
+        self._c = brotli.Compressor(quality=4)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.finish()
+
+
+def _compressor(encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if encoding == 'br':
+        return _BrotliStream()
+    return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+
+
+CONTENT_CODINGS = [c for c, mod in (('zstd', zstandard), ('br', brotli), ('gzip', zlib)) if mod is not None]
+
+
+def negotiate(accepted):
+    """Best content coding in ``accepted`` (q > 0), in server preference order, or None."""
+    best, best_q = None, 0
+    for coding in CONTENT_CODINGS:
+        q = accepted.quality(coding)
+        if coding == 'gzip':
+            q = max(q, accepted.quality('x-gzip'))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionCache:
+    """Per-version compressibility decisions plus a size-bounded LRU of encoded variants on disk.
+
+    A streamed variant is only kept if its file is still in ``index`` when the
+    stream ends (without an index, always).
+    """
+
+    def __init__(self, folder: Path, max_bytes: int, index=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.index = index
+        self._decisions = OrderedDict()  # (name, etag) -> bool
+        self._requests = defaultdict(int)  # (name, etag, coding) -> compressed downloads so far
+        self._variants = OrderedDict()  # Path -> size
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.served_cached = 0
+        self.served_streamed = 0
+
+    def load(self):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        found = []
+        for p in self.folder.iterdir():
+            if p.suffix == '.tmp':
+                p.unlink()
+                continue
+            st = p.stat()
+            found.append((st.st_mtime, p, st.st_size))
+        for _, p, size in sorted(found):
+            self._variants[p] = size
+            self._bytes += size
+
+    def compressible(self, path: Path, st, mimetype: str, etag: str) -> bool:
+        if st.st_size < COMPRESS_MIN_BYTES:
+            return False
+        key = (path.name, etag)
+        with self._lock:
+            if key in self._decisions:
+                self._decisions.move_to_end(key)
+                return self._decisions[key]
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            verdict = True
+        elif mimetype.startswith(INCOMPRESSIBLE_TYPES):
+            verdict = False
+        else:
+            with open(path, 'rb') as fh:
+                sample = run_io(fh.read, COMPRESS_SAMPLE_BYTES)
+            verdict = len(zlib.compress(sample, 1)) < len(sample) * (1 - COMPRESS_MIN_SAVING)
+        with self._lock:
+            self._decisions[key] = verdict
+            while len(self._decisions) > 4096:
+                self._decisions.popitem(last=False)
+        return verdict
+
+    def variant_path(self, name: str, etag: str, coding: str) -> Path:
+        token = etag.strip('"')
+        return self.folder / f'{hashlib.sha1(name.encode()).hexdigest()}-{token}.{coding}'
+
+    def lookup(self, name: str, etag: str, coding: str, count: bool = True):
+        """(cached variant path or None, whether this download should fill the cache).
+
+        ``count=False`` (HEAD) neither counts towards hotness nor fills.
+        """
+        p = self.variant_path(name, etag, coding)
+        with self._lock:
+            if p in self._variants:
+                self._variants.move_to_end(p)
+                if count:
+                    self.served_cached += 1
+                return p, False
+            if not count:
+                return None, False
+            key = (name, etag, coding)
+            self._requests[key] += 1
+            self.served_streamed += 1
+            hot = self._requests[key] >= 2
+        return None, hot
+
+    def stream(self, path: Path, size: int, coding: str, cache_as: Path = None):
+        """Yield ``path`` encoded with ``coding``; optionally tee the output into the cache."""
+        comp = _compressor(coding)
+        tmp = cache_as.with_name(f'{cache_as.name}.{uuid.uuid4().hex[:8]}.tmp') if cache_as else None
+        out = open(tmp, 'wb') if tmp else None
+        done = False
+        try:
+            for chunk in iter_file(path, 0, size):
+                data = comp.compress(chunk)
+                if data:
+                    if out:
+                        run_io(out.write, data)
+                    yield data
+            data = comp.flush()
+            if out:
+                run_io(out.write, data)
+            yield data
+            done = True
+        finally:
+            if out:
+                out.close()
+                if done and (self.index is None or self.index.get(path.name) is not None):
+                    os.replace(tmp, cache_as)
+                    self._add(cache_as, cache_as.stat().st_size)
+                else:
+                    tmp.unlink()
+
+    def _add(self, p: Path, size: int):
+        evict = []
+        with self._lock:
+            # concurrent fills of the same variant replace each other's file; count it once
+            self._bytes += size - self._variants.pop(p, 0)
+            self._variants[p] = size
+            while self._bytes > self.max_bytes and len(self._variants) > 1:
+                old, old_size = self._variants.popitem(last=False)
+                self._bytes -= old_size
+                evict.append(old)
+        for old in evict:
+            try:
+                old.unlink()
+            except FileNotFoundError:
+                pass
+
+    def forget(self, p: Path):
+        """Stop tracking a variant whose file disappeared under us."""
+        with self._lock:
+            self._bytes -= self._variants.pop(p, 0)
+
+    def on_index_change(self, op, entry):
+        # an add for a known name is a new version, so its old variants are stale either way
+        prefix = hashlib.sha1(entry['filename'].encode()).hexdigest() + '-'
+        with self._lock:
+            gone = [p for p in self._variants if p.name.startswith(prefix)]
+            for p in gone:
+                self._bytes -= self._variants.pop(p)
+            for key in [k for k in self._requests if k[0] == entry['filename']]:
+                del self._requests[key]
+        for p in gone:
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'codings': CONTENT_CODINGS, 'variants': len(self._variants), 'bytes': self._bytes,
+                    'served_cached': self.served_cached, 'served_streamed': self.served_streamed}
@@ -0,0 +1,131 @@
+"""Delta uploads.
+
+rsync-style updates of a file the server already has. The client fetches the
+basis file's block signature (Adler-32 + truncated BLAKE2b per block), finds
+the blocks it can reuse with a rolling checksum, and uploads only a delta:
+"copy bytes [offset, offset+length) of the basis" and "literal data" ops.
+The server streams the new version together from the basis and the delta
+(see backend/delta_sync.py for the client side).
+"""
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from .fileio import STREAM_BUFFER_SIZE, copy_stream, run_io
+
+DELTA_MIN_BLOCK = 1024
+DELTA_MAX_BLOCK = 1024 * 1024
+DELTA_STRONG_BYTES = 16
+
+# Delta body: a sequence of ops, each starting with one byte, terminated by b'E'
+DELTA_OP_COPY = b'C'     # >QQ: basis offset, length
+DELTA_OP_LITERAL = b'L'  # >I: length, then that many bytes
+DELTA_OP_END = b'E'
+
+
+def block_size(size: int) -> int:
+    """~sqrt(size) rounded up to a power of two, as rsync does: fewer, larger blocks
+    for big files keep the signature small while edits still only cost a block or two."""
+    block = DELTA_MIN_BLOCK
+    while block * block < size and block < DELTA_MAX_BLOCK:
+        block *= 2
+    return block
+
+
+def basis_version(st) -> str:
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+class DeltaSignatures:
+    """Block signatures of basis files, computed in one read pass and kept in a small LRU."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._cache = OrderedDict()  # (name, version, block) -> (weak, strong)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compute(path: Path, block: int):
+        weak, strong = [], bytearray()
+        with open(path, 'rb') as fh:
+            for buf in iter(lambda: fh.read(max(block, STREAM_BUFFER_SIZE)), b''):
+                for i in range(0, len(buf), block):
+                    piece = buf[i:i + block]
+                    weak.append(zlib.adler32(piece))
+                    strong += hashlib.blake2b(piece, digest_size=DELTA_STRONG_BYTES).digest()
+        return struct.pack(f'>{len(weak)}I', *weak), bytes(strong)
+
+    def get(self, path: Path, st, block: int):
+        key = (path.name, basis_version(st), block)
+        with self._lock:
+            sig = self._cache.get(key)
+            if sig is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return sig
+        sig = run_io(self._compute, path, block)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = sig
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+        return sig
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'cached': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+def read_exact(stream, n: int) -> bytes:
+    buf = b''
+    while len(buf) < n:
+        part = stream.read(n - len(buf))
+        if not part:
+            raise ValueError('delta ended early')
+        buf += part
+    return buf
+
+
+def apply_delta(stream, basis: Path, out, size: int, hasher) -> dict:
+    """Build the new version into ``out`` from ``basis`` and the delta ops read from ``stream``."""
+    basis_size = basis.stat().st_size
+    copied = literal = 0
+    with open(basis, 'rb') as src:
+        while True:
+            op = read_exact(stream, 1)
+            if op == DELTA_OP_END:
+                break
+            if op == DELTA_OP_COPY:
+                offset, length = struct.unpack('>QQ', read_exact(stream, 16))
+                if offset + length > basis_size:
+                    raise ValueError('copy outside the basis file')
+                if copied + literal + length > size:
+                    raise ValueError('delta produces more than size bytes')
+                if src.tell() != offset:
+                    src.seek(offset)
+                remaining = length
+                while remaining:
+                    buf = run_io(src.read, min(STREAM_BUFFER_SIZE, remaining))
+                    if not buf:
+                        raise ValueError('basis file shrank while applying the delta')
+                    run_io(out.write, buf)
+                    hasher.update(buf)
+                    remaining -= len(buf)
+                copied += length
+            elif op == DELTA_OP_LITERAL:
+                (length,) = struct.unpack('>I', read_exact(stream, 4))
+                if copied + literal + length > size:
+                    raise ValueError('delta produces more than size bytes')
+                if copy_stream(stream, out, length, hasher) != length:
+                    raise ValueError('delta ended early')
+                literal += length
+            else:
+                raise ValueError(f'unknown delta op {op!r}')
+    if copied + literal != size:
+        raise ValueError(f'delta produced {copied + literal} of {size} bytes')
+    return {'copied_bytes': copied, 'literal_bytes': literal}
@@ -0,0 +1,188 @@
+"""File expiry.
+
+Deadlines live in a min-heap; the expiry thread sleeps until the earliest one
+instead of stat-sweeping the folder. Files get the default TTL from their mtime
+unless a per-file TTL was given at upload (persisted in META_FOLDER/expiry.json).
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from .metrics import METRICS, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+M_EXPIRY_RUN = METRICS.register(Histogram(
+    'wifix_expiry_run_seconds', 'Duration of one expiry batch (unlink + notify)'))
+M_EXPIRED = METRICS.register(Counter('wifix_expired_files_total', 'Files deleted by TTL expiry'))
+
+
+class ExpiryScheduler:
+    """Min-heap of (deadline, filename) with lazy invalidation.
+
+    ``remove(name)`` deletes one expired file (and its index entry and PIN);
+    ``on_expired(names)`` is told about each batch. Deadlines within
+    ``coalesce_seconds`` of the first due one join its batch of at most
+    ``batch_size``; with nothing due the thread wakes every ``max_sleep`` seconds.
+    """
+
+    def __init__(self, default_ttl: int, overrides_path: Path, remove, on_expired,
+                 max_sleep: float = 60, batch_size: int = 1000, coalesce_seconds: float = 1.0):
+        self.default_ttl = default_ttl
+        self.overrides_path = overrides_path
+        self.remove = remove
+        self.on_expired = on_expired
+        self.max_sleep = max_sleep
+        self.batch_size = batch_size
+        self.coalesce_seconds = coalesce_seconds
+        self._heap = []
+        self._deadlines = {}
+        self._overrides = {}
+        self._cond = threading.Condition()
+        self.expired_total = 0
+        self.batches_total = 0
+        self.lateness_last = 0.0
+        self.lateness_max = 0.0
+        self._lateness_sum = 0.0
+
+    def load(self, entries):
+        """Fill the queue from the file index (startup)."""
+        try:
+            self._overrides = {k: float(v) for k, v in json.loads(self.overrides_path.read_text()).items()}
+        except FileNotFoundError:
+            self._overrides = {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {self.overrides_path.name}: {e}")
+            self._overrides = {}
+        with self._cond:
+            self._deadlines = {}
+            for entry in entries:
+                deadline = self._default_deadline(entry)
+                if deadline is not None:
+                    self._deadlines[entry['filename']] = deadline
+            # drop overrides whose file no longer exists
+            self._overrides = {k: v for k, v in self._overrides.items() if k in self._deadlines}
+            self._heap = [(d, name) for name, d in self._deadlines.items()]
+            heapq.heapify(self._heap)
+            self._cond.notify()
+        self._save_overrides()
+
+    def _default_deadline(self, entry):
+        name = entry['filename']
+        if name in self._overrides:
+            return self._overrides[name]
+        if self.default_ttl and self.default_ttl > 0:
+            return entry['mtime'] + self.default_ttl
+        return None
+
+    def _save_overrides(self):
+        try:
+            tmp = self.overrides_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(self._overrides))
+            os.replace(tmp, self.overrides_path)
+        except Exception as e:
+            logger.error(f"Failed to persist per-file TTLs: {e}")
+
+    def schedule(self, filename: str, deadline: float, persist: bool = False):
+        with self._cond:
+            self._deadlines[filename] = deadline
+            heapq.heappush(self._heap, (deadline, filename))
+            if persist:
+                self._overrides[filename] = deadline
+            # compact when stale heap entries dominate
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._heap = [(d, n) for n, d in self._deadlines.items()]
+                heapq.heapify(self._heap)
+            if self._heap[0] == (deadline, filename):
+                self._cond.notify()
+        if persist:
+            self._save_overrides()
+
+    def cancel(self, filename: str):
+        with self._cond:
+            self._deadlines.pop(filename, None)
+            had_override = self._overrides.pop(filename, None) is not None
+        if had_override:
+            self._save_overrides()
+
+    def deadline(self, filename: str):
+        return self._deadlines.get(filename)
+
+    def on_index_change(self, op, entry):
+        if op == 'remove':
+            self.cancel(entry['filename'])
+        elif entry['filename'] not in self._deadlines:
+            deadline = self._default_deadline(entry)
+            if deadline is not None:
+                self.schedule(entry['filename'], deadline)
+
+    def _pop_due(self):
+        """Block until at least one deadline is due; return [(deadline, filename)] (bounded batch)."""
+        with self._cond:
+            while True:
+                now = time.time()
+                while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+                    heapq.heappop(self._heap)  # stale entry
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                timeout = self.max_sleep
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - now)
+                self._cond.wait(timeout)
+            due = []
+            horizon = now + self.coalesce_seconds
+            while self._heap and self._heap[0][0] <= horizon and len(due) < self.batch_size:
+                deadline, name = heapq.heappop(self._heap)
+                if self._deadlines.get(name) == deadline:
+                    del self._deadlines[name]
+                    due.append((deadline, name))
+            return due
+
+    def run_once(self):
+        """Wait for the next due batch and expire it."""
+        due = self._pop_due()
+        started = time.perf_counter()
+        now = time.time()
+        expired = []
+        for deadline, name in due:
+            try:
+                self.remove(name)
+            except Exception as e:
+                # ignore errors for now (permissions, race conditions)
+                logger.warning(f"Failed to expire {name}: {e}")
+                continue
+            expired.append(name)
+            late = max(now - deadline, 0.0)
+            self.lateness_last = late
+            self.lateness_max = max(self.lateness_max, late)
+            self._lateness_sum += late
+        if expired:
+            self.expired_total += len(expired)
+            self.batches_total += 1
+            logger.info(f"Expired {len(expired)} file(s)")
+            self.on_expired(expired)
+            M_EXPIRED.inc(len(expired))
+        if due:
+            M_EXPIRY_RUN.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        next_deadline = None
+        with self._cond:
+            for deadline, name in self._heap[:1]:
+                next_deadline = deadline
+            queued = len(self._deadlines)
+            heap_size = len(self._heap)
+        return {
+            'queued': queued,
+            'heap_size': heap_size,
+            'next_deadline': next_deadline,
+            'expired_total': self.expired_total,
+            'batches_total': self.batches_total,
+            'lateness_last_seconds': round(self.lateness_last, 4),
+            'lateness_max_seconds': round(self.lateness_max, 4),
+            'lateness_avg_seconds': round(self._lateness_sum / self.expired_total, 4) if self.expired_total else 0.0,
+        }
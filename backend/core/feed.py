@@ -0,0 +1,91 @@
+"""File change feed.
+
+Every index mutation gets a sequence number. Mutations are coalesced for
+``coalesce_seconds`` (last op per file wins) and broadcast as one
+``files_changed`` event to the sockets that called ``subscribe_files``. A bounded
+replay log lets a reconnecting client catch up from its last seq; if it fell
+off the log (or the server restarted, see ``epoch``) it gets ``files_snapshot``.
+"""
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class ChangeFeed:
+    """Sequenced, coalescing feed of FileIndex changes.
+
+    ``index`` supplies snapshots; ``emit(event, payload, to=room)`` broadcasts.
+    """
+
+    def __init__(self, index, emit, room: str, replay_size: int, coalesce_seconds: float):
+        self.index = index
+        self.emit = emit
+        self.room = room
+        self.coalesce_seconds = coalesce_seconds
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self._log = deque(maxlen=replay_size)  # (seq, op, entry)
+        self._pending = {}  # filename -> (op, entry), insertion-ordered
+        self._pending_from = None
+        self._cond = threading.Condition()
+
+    def on_index_change(self, op, entry):
+        with self._cond:
+            self.seq += 1
+            self._log.append((self.seq, op, entry))
+            if self._pending_from is None:
+                self._pending_from = self.seq
+            self._pending.pop(entry['filename'], None)
+            self._pending[entry['filename']] = (op, entry)
+            self._cond.notify()
+
+    @staticmethod
+    def _delta(changes, first, last) -> dict:
+        latest = {}
+        for op, entry in changes:
+            latest.pop(entry['filename'], None)
+            latest[entry['filename']] = (op, entry)
+        return {
+            'from': first,
+            'seq': last,
+            'upserts': [e for op, e in latest.values() if op == 'add'],
+            'deletes': [e['filename'] for op, e in latest.values() if op == 'remove'],
+        }
+
+    def catch_up(self, since, epoch):
+        """('files_changed', delta) from the replay log, or ('files_snapshot', ...) if it can't."""
+        with self._cond:
+            seq = self.seq
+            oldest = self._log[0][0] if self._log else seq + 1
+            if epoch == self.epoch and since is not None and oldest - 1 <= since <= seq:
+                changes = [(op, e) for s, op, e in self._log if s > since]
+                return 'files_changed', dict(self._delta(changes, since + 1, seq), epoch=self.epoch)
+        # the index may already contain changes numbered after ``seq``; re-applying
+        # them from the next delta is harmless since deltas are idempotent
+        return 'files_snapshot', {'epoch': self.epoch, 'seq': seq, 'files': self.index.page()[0]}
+
+    def flush(self) -> bool:
+        """Broadcast the changes pending right now as one ``files_changed``; False if there were none."""
+        with self._cond:
+            if not self._pending:
+                return False
+            changes = list(self._pending.values())
+            first, last = self._pending_from, self.seq
+            self._pending = {}
+            self._pending_from = None
+        self.emit('files_changed', dict(self._delta(changes, first, last), epoch=self.epoch), to=self.room)
+        return True
+
+    def run(self):
+        """Background task flushing coalesced changes as one broadcast per window."""
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.coalesce_seconds)
+            self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'epoch': self.epoch, 'seq': self.seq, 'replay_log': len(self._log)}
@@ -0,0 +1,199 @@
+"""In-memory index of the uploads folder.
+
+Upload, delete and cleanup update the index directly; a background reconcile
+loop stats the uploads *directory* (one syscall) and only rescans when its
+mtime changes, which catches files added or removed behind the app's back.
+"""
+import base64
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import quote
+
+from .fileio import run_io
+from .metrics import METRICS, Histogram
+
+logger = logging.getLogger(__name__)
+
+M_INDEX_RECONCILE = METRICS.register(Histogram(
+    'wifix_file_index_reconcile_seconds', 'Duration of file index rescans of the uploads folder'))
+
+
+class FileIndex:
+    """Sorted (newest first) in-memory view of the uploads folder.
+
+    ``digests`` is the DigestStore and ``pins`` the FILE_PINS mapping that the
+    ``sha256`` and ``has_pin`` fields of each entry come from.
+    """
+
+    def __init__(self, folder: Path, digests, pins):
+        self.folder = folder
+        self.digests = digests
+        self.pins = pins
+        self.version = 0
+        self._token = uuid.uuid4().hex[:8]  # distinguishes ETags across restarts
+        self._entries = {}
+        self._order = []  # sorted list of (-mtime, filename)
+        self._dir_mtime_ns = None
+        self._lock = threading.RLock()
+        # callables invoked as listener(op, entry) with op 'add' or 'remove', outside the lock
+        self.listeners = []
+
+    def _notify(self, events):
+        for op, entry in events:
+            for listener in self.listeners:
+                try:
+                    listener(op, entry)
+                except Exception as e:
+                    logger.error(f"File index listener failed for {entry['filename']}: {e}")
+
+    @staticmethod
+    def _key(entry):
+        return (-entry['mtime'], entry['filename'])
+
+    def _entry_for(self, path: Path, st=None, pinned=None, digests=None):
+        st = st or path.stat()
+        if digests is None:
+            digest = self.digests.get(path.name, st)
+        else:
+            known = digests.get(path.name)
+            digest = known[0] if known and known[1:] == (st.st_size, st.st_mtime_ns) else None
+        return {
+            'filename': path.name,
+            'path': 'download/' + quote(path.name),
+            'mtime': st.st_mtime,
+            'size': st.st_size,
+            'type': path.suffix.lower().lstrip('.') if path.suffix else '',
+            'has_pin': path.name in (self.pins if pinned is None else pinned),
+            'sha256': digest,
+        }
+
+    def _insert(self, entry):
+        old = self._entries.get(entry['filename'])
+        if old is not None:
+            self._order.pop(bisect.bisect_left(self._order, self._key(old)))
+        self._entries[entry['filename']] = entry
+        bisect.insort(self._order, self._key(entry))
+
+    def _delete(self, filename):
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            self._order.pop(bisect.bisect_left(self._order, self._key(entry)))
+        return entry
+
+    def add(self, path: Path):
+        entry = self._entry_for(path)
+        with self._lock:
+            self._insert(entry)
+            self.version += 1
+        self._notify([('add', entry)])
+        return entry
+
+    def remove(self, filename: str):
+        with self._lock:
+            entry = self._delete(filename)
+            if entry is not None:
+                self.version += 1
+        if entry is not None:
+            self._notify([('remove', entry)])
+        return entry
+
+    def get(self, filename: str):
+        return self._entries.get(filename)
+
+    def set_pin(self, filename: str, has_pin: bool):
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry['has_pin'] != has_pin:
+                self._entries[filename] = dict(entry, has_pin=has_pin)
+                self.version += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def etag_for(self, since=None, cursor=None, limit=None) -> str:
+        """ETag of one listing: the index version plus the (normalized) page parameters."""
+        etag = f'{self._token}-{self.version}'
+        if (since, cursor, limit) != (None, None, None):
+            params = json.dumps([since, list(cursor) if cursor else None, limit])
+            etag += '-' + hashlib.sha1(params.encode()).hexdigest()[:12]
+        return f'"{etag}"'
+
+    def _scan(self):
+        found = {}
+        pinned = set(self.pins)  # one query instead of one per file
+        digests = self.digests.all()
+        for p in self.folder.iterdir():
+            if p.name.startswith('.'):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            if p.is_file():
+                found[p.name] = self._entry_for(p, st, pinned, digests)
+        return found
+
+    def reconcile(self, force: bool = False) -> bool:
+        """Resync with the directory if it changed since the last check. Returns True if rescanned."""
+        try:
+            dir_mtime = self.folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if not force and dir_mtime == self._dir_mtime_ns:
+            return False
+        started = time.perf_counter()
+        found = run_io(self._scan)  # one stat per file: keep it off the event loop
+        events = []
+        with self._lock:
+            for name in list(self._entries):
+                if name not in found:
+                    events.append(('remove', self._delete(name)))
+            for name, entry in found.items():
+                old = self._entries.get(name)
+                if old is None or old['mtime'] != entry['mtime'] or old['size'] != entry['size']:
+                    self._insert(entry)
+                    events.append(('add', entry))
+            if events:
+                self.version += 1
+            self._dir_mtime_ns = dir_mtime
+        M_INDEX_RECONCILE.observe(time.perf_counter() - started)
+        self._notify(events)
+        return True
+
+    def page(self, since=None, cursor=None, limit=None):
+        """Return (entries, next_cursor) from the sorted index.
+
+        ``since`` keeps entries with mtime strictly greater than it; ``cursor``
+        continues after the last entry of a previous page.
+        """
+        with self._lock:
+            order = self._order
+            start = 0
+            if cursor is not None:
+                start = bisect.bisect_right(order, cursor)
+            stop = len(order)
+            if since is not None:
+                stop = bisect.bisect_left(order, (-since, ''))
+            if limit is not None:
+                stop = min(stop, start + limit)
+            keys = order[start:stop]
+            entries = [self._entries[name] for _, name in keys]
+            more = stop < len(order) and (since is None or -order[stop][0] > since)
+        next_cursor = self.encode_cursor(keys[-1]) if keys and more else None
+        return entries, next_cursor
+
+    @staticmethod
+    def encode_cursor(key) -> str:
+        return base64.urlsafe_b64encode(json.dumps([-key[0], key[1]]).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(value: str):
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        mtime, name = json.loads(raw)
+        return (-float(mtime), str(name))
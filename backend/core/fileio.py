@@ -0,0 +1,128 @@
+"""Blocking file I/O that stays off the event loop under eventlet/gevent."""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+# The same switch app.py monkey patches the stdlib for
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+# Buffer size used when copying request bodies to disk
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+_io_inflight = 0  # disk operations currently in run_io
+_io_queued = 0  # disk operations submitted to a pool by submit_io and not yet started
+_io_inflight_lock = threading.Lock()
+
+
+def run_io(fn, *args):
+    """Run a blocking disk operation without stalling the event loop.
+
+    Regular-file reads and writes are not made cooperative by monkey patching, so
+    under eventlet/gevent they are pushed to the engine's native thread pool.
+    In threading mode this is a plain call.
+    """
+    global _io_inflight
+    with _io_inflight_lock:
+        _io_inflight += 1
+    try:
+        if ASYNC_MODE == 'eventlet':
+            from eventlet import tpool
+            return tpool.execute(fn, *args)
+        if ASYNC_MODE == 'gevent':
+            import gevent
+            return gevent.get_hub().threadpool.apply(fn, args)
+        return fn(*args)
+    finally:
+        with _io_inflight_lock:
+            _io_inflight -= 1
+
+
+def io_inflight() -> int:
+    """Disk operations running in ``run_io`` right now."""
+    return _io_inflight
+
+
+def io_queued() -> int:
+    """Disk operations waiting in a pool for a worker (see ``submit_io``)."""
+    return _io_queued
+
+
+def _dequeued():
+    global _io_queued
+    with _io_inflight_lock:
+        _io_queued -= 1
+
+
+def submit_io(pool, fn, *args):
+    """``pool.submit(run_io, fn, *args)``, counted by ``io_queued`` until a worker starts it."""
+    global _io_queued
+    started = []
+
+    def job():
+        started.append(True)
+        _dequeued()
+        return run_io(fn, *args)
+
+    with _io_inflight_lock:
+        _io_queued += 1
+    future = pool.submit(job)
+    future.add_done_callback(lambda f: started or _dequeued())  # cancelled before it ran
+    return future
+
+
+def copy_stream(stream, fh, limit=None, hasher=None) -> int:
+    """Copy ``stream`` into ``fh`` in STREAM_BUFFER_SIZE pieces; returns bytes written.
+
+    When ``hasher`` is given it is updated with every buffer, so the digest comes
+    for free with the write instead of needing a second pass over the file.
+    """
+    written = 0
+    while limit is None or written < limit:
+        size = STREAM_BUFFER_SIZE if limit is None else min(STREAM_BUFFER_SIZE, limit - written)
+        buf = stream.read(size)
+        if not buf:
+            break
+        run_io(fh.write, buf)
+        if hasher is not None:
+            hasher.update(buf)
+        written += len(buf)
+    return written
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for buf in iter(lambda: run_io(fh.read, STREAM_BUFFER_SIZE), b''):
+            hasher.update(buf)
+    return hasher.hexdigest()
+
+
+def iter_file(path: Path, start: int, length: int, buffer_size: int = 256 * 1024, fh=None):
+    with fh or open(path, 'rb') as fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            buf = run_io(fh.read, min(buffer_size, remaining))
+            if not buf:
+                break
+            remaining -= len(buf)
+            yield buf
+
+
+def preallocate(path: Path, size: int):
+    with open(path, 'wb') as fh:
+        if size and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fh.fileno(), 0, size)
+                return
+            except OSError:
+                pass  # filesystem without fallocate support; fall back to a sparse file
+        fh.truncate(size)
+
+
+def pwrite_all(fd, buf, offset):
+    view = memoryview(buf)
+    while view:
+        n = os.pwrite(fd, view, offset)
+        view = view[n:]
+        offset += n
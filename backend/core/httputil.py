@@ -0,0 +1,76 @@
+"""HTTP validators and byte ranges for file responses."""
+from werkzeug.http import parse_date
+
+MAX_RANGES = 16  # per request, as Apache allows; more is answered with 416
+
+
+def file_etag(st) -> str:
+    """Strong validator derived from size and nanosecond mtime (files are never modified in place)."""
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_ranges(header: str, size: int):
+    """Parse a ``Range: bytes=...`` header into a list of (start, end) pairs, end exclusive.
+
+    Overlapping and adjacent ranges are merged (sorted), so a file is never sent
+    more than once per response. Returns None when the header is absent or
+    malformed, or the ranges cover the whole file (serve the full body), and an
+    empty list when nothing is satisfiable or there are more than MAX_RANGES (416).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    specs = header[6:].split(',')
+    if len(specs) > MAX_RANGES:
+        return []
+    ranges = []
+    for spec in specs:
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        first, _, last = spec.partition('-')
+        try:
+            if not first:  # suffix range: last N bytes
+                n = int(last)
+                if n <= 0:
+                    continue
+                start, end = max(size - n, 0), size
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last) + 1, size) if last else size
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if merged == [(0, size)]:
+        return None
+    return merged
+
+
+def not_modified(headers, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since (RFC 9110 13.2.2 precedence)."""
+    inm = headers.get('If-None-Match')
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(',')]
+        # weak comparison is allowed for If-None-Match
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    ims = parse_date(headers.get('If-Modified-Since'))
+    return ims is not None and int(mtime) <= ims.timestamp()
+
+
+def range_allowed(headers, etag: str, mtime: float) -> bool:
+    """If-Range: only honour Range when the client's validator still matches."""
+    if_range = headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag  # strong comparison required
+    date = parse_date(if_range)
+    return date is not None and int(mtime) <= date.timestamp()
@@ -0,0 +1,185 @@
+"""A minimal Prometheus-compatible registry (text exposition format 0.0.4) and an
+opt-in sampling profiler.
+
+Subsystems register their metrics on the process-wide ``METRICS`` registry when
+they are imported, as prometheus_client does with its default registry.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from pathlib import Path
+
+try:
+    import resource  # POSIX only; used to report peak RSS
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_str(names, values):
+    if not names:
+        return ''
+    pairs = (f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+             for n, v in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, '') for n in self.labels)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f'{self.name}{_label_str(self.labels, k)} {v}' for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), fn=None):
+        super().__init__(name, help_text, labels)
+        self._values = defaultdict(float)
+        self._fn = fn  # optional callable sampled at scrape time
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self._fn is not None:
+            try:
+                return self.header() + [f'{self.name} {float(self._fn())}']
+            except Exception:
+                return self.header()
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f'{self.name}{_label_str(self.labels, k)} {v}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_label_str(self.labels + ("le",), key + (bound,))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_label_str(self.labels + ("le",), key + ("+Inf",))} {series[-1]}')
+            lines.append(f'{self.name}_sum{_label_str(self.labels, key)} {series[-2]}')
+            lines.append(f'{self.name}_count{_label_str(self.labels, key)} {series[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+class SamplingProfiler:
+    """Samples every thread's stack with ``sys._current_frames`` and aggregates
+    them as collapsed stacks (``frame;frame;frame count``), the input format of
+    flamegraph tools. Only OS threads are visible; under eventlet/gevent the
+    green threads multiplexed on the main thread show up as the hub."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds: float, interval: float) -> str:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('a profile is already running')
+        try:
+            counts = defaultdict(int)
+            own = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = [f'{f.name} ({Path(f.filename).name}:{f.lineno})'
+                             for f in traceback.extract_stack(frame)]
+                    counts[';'.join(stack)] += 1
+                time.sleep(interval)
+            return '\n'.join(f'{stack} {n}' for stack, n in sorted(counts.items(), key=lambda kv: -kv[1])) + '\n'
+        finally:
+            self._lock.release()
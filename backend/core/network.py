@@ -0,0 +1,166 @@
+"""Network interfaces.
+
+Addresses are enumerated once and cached; a background task refreshes them when
+the kernel reports an address change (rtnetlink, Linux) or every
+``refresh_seconds`` otherwise, so /info does no syscalls.
+"""
+import atexit
+import ipaddress
+import logging
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+_RTMGRP_IPV4_IFADDR = 0x10
+_RTMGRP_IPV6_IFADDR = 0x100
+
+
+class NetworkInfo:
+    """Cached view of this host's LAN addresses, primary (default-route) address first."""
+
+    def __init__(self, include_ipv6: bool, refresh_seconds: float = 30):
+        self.include_ipv6 = include_ipv6
+        self.refresh_seconds = refresh_seconds
+        self.addresses = []
+        self.primary = None
+        self.listeners = []  # called with the new address list after a change
+        self._netlink = None
+
+    @staticmethod
+    def _route_address(family, probe):
+        """Local address the kernel would use to reach ``probe`` (no packet is sent)."""
+        try:
+            with socket.socket(family, socket.SOCK_DGRAM) as s:
+                s.connect((probe, 80))
+                return s.getsockname()[0]
+        except OSError:
+            return None
+
+    @staticmethod
+    def _interface_addresses():
+        try:
+            import ifaddr  # ships with zeroconf
+        except ImportError:
+            found = set()
+            try:
+                for *_, sockaddr in socket.getaddrinfo(socket.gethostname(), None):
+                    found.add(sockaddr[0])
+            except OSError:
+                pass
+            return found
+        found = set()
+        for adapter in ifaddr.get_adapters():
+            for ip in adapter.ips:
+                found.add(ip.ip[0] if ip.is_IPv6 else ip.ip)
+        return found
+
+    @staticmethod
+    def _usable(addr: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(addr.split('%', 1)[0])
+        except ValueError:
+            return False
+        return not (ip.is_loopback or ip.is_link_local or ip.is_multicast or ip.is_unspecified)
+
+    def refresh(self) -> bool:
+        """Re-enumerate addresses. Returns True if the list changed."""
+        routed = [a for a in (self._route_address(socket.AF_INET, '8.8.8.8'),
+                              self._route_address(socket.AF_INET6, '2001:4860:4860::8888')) if a]
+        found = {a for a in self._interface_addresses() | set(routed)
+                 if self._usable(a) and (self.include_ipv6 or ':' not in a)}
+        primary = next((a for a in routed if a in found), None)
+        # primary first, then IPv4 before IPv6
+        addresses = sorted(found, key=lambda a: (a != primary, ':' in a, a))
+        if not addresses:
+            logger.warning('No LAN address found; advertising 127.0.0.1')
+        changed = addresses != self.addresses
+        self.addresses = addresses
+        self.primary = addresses[0] if addresses else '127.0.0.1'
+        if changed:
+            for listener in self.listeners:
+                try:
+                    listener(addresses)
+                except Exception as e:
+                    logger.warning(f"Network change listener failed: {e}")
+        return changed
+
+    def urls(self, port=None, scheme: str = 'http') -> list:
+        addrs = self.addresses or [self.primary or '127.0.0.1']
+        suffix = f':{port}' if port else ''
+        return [f"{scheme}://{f'[{a}]' if ':' in a else a}{suffix}/" for a in addrs]
+
+    def _wait_for_change(self, timeout: float):
+        """Block until an rtnetlink address event arrives or ``timeout`` passes."""
+        if self._netlink is None and hasattr(socket, 'AF_NETLINK'):
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+                sock.bind((0, _RTMGRP_IPV4_IFADDR | _RTMGRP_IPV6_IFADDR))
+                self._netlink = sock
+            except OSError:
+                self._netlink = False
+        if not self._netlink:
+            time.sleep(timeout)
+            return
+        self._netlink.settimeout(timeout)
+        try:
+            self._netlink.recv(65536)
+            time.sleep(0.5)  # let a burst of events (DHCP renew, both families) settle
+        except (socket.timeout, OSError):
+            pass
+
+    def watch(self):
+        """Background task keeping the cache current."""
+        while True:
+            self._wait_for_change(self.refresh_seconds)
+            try:
+                if self.refresh():
+                    logger.info(f"Network addresses changed: {', '.join(self.addresses)}")
+            except Exception as e:
+                logger.warning(f"Network refresh failed: {e}")
+
+    def packed(self) -> list:
+        """Addresses in the binary form zeroconf expects."""
+        return [socket.inet_pton(socket.AF_INET6 if ':' in a else socket.AF_INET, a)
+                for a in self.addresses or [self.primary]]
+
+
+def advertise_zeroconf(network: NetworkInfo, port: int):
+    """Register the service via Zeroconf/mDNS for LAN auto-discovery (background task)."""
+    try:
+        from zeroconf import ServiceInfo, Zeroconf
+    except ImportError:
+        logger.warning("Zeroconf: package not installed; not advertising")
+        return
+    try:
+        svc_name = f"WifiX on {network.primary}._wifi-share._tcp.local."  # visible name in mDNS browsers
+        info = ServiceInfo(
+            "_wifi-share._tcp.local.",
+            svc_name,
+            addresses=network.packed(),
+            port=port,
+            properties={'path': '/'},
+            server=(socket.gethostname() + '.local.')
+        )
+        zeroconf = Zeroconf()
+        zeroconf.register_service(info)
+        logger.info(f"Zeroconf: registered service {svc_name}")
+    except Exception as e:
+        logger.warning(f"Zeroconf registration failed: {e}")
+        return
+
+    def _readvertise(addresses):
+        info.addresses = network.packed()
+        zeroconf.update_service(info)
+        logger.info(f"Zeroconf: now advertising {', '.join(addresses)}")
+
+    def _cleanup_zeroconf():
+        try:
+            zeroconf.unregister_service(info)
+            zeroconf.close()
+            logger.info('Zeroconf: service unregistered')
+        except Exception:
+            pass
+
+    network.listeners.append(_readvertise)
+    atexit.register(_cleanup_zeroconf)
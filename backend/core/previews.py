@@ -0,0 +1,212 @@
+"""Previews.
+
+After a file lands in the index, a thumbnail + dimensions (images) or a text
+snippet is built in a small process pool and stored as sidecars under
+META_FOLDER/previews (<sha1(name)>.json, plus .jpg for thumbnails). The queue
+is bounded and lossy: under burst load jobs are dropped and rebuilt on demand
+when /preview is first asked for that file. Removal from the index cancels
+pending work and deletes the sidecars.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .metrics import METRICS, Counter
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_THUMBNAIL_PX = 320
+PREVIEW_SNIPPET_BYTES = 4096
+PREVIEW_SNIPPET_LINES = 20
+TEXT_EXTENSIONS = {'txt', 'md', 'csv', 'log', 'json', 'xml', 'yaml', 'yml', 'ini', 'cfg', 'py', 'js', 'ts',
+                   'html', 'css', 'sh', 'c', 'h', 'cpp', 'java', 'go', 'rs', 'sql'}
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff'}
+M_PREVIEW_JOBS = METRICS.register(Counter('wifix_preview_jobs_total', 'Preview jobs by outcome', ('result',)))
+
+
+def preview_kind(filename: str):
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in TEXT_EXTENSIONS or (mimetypes.guess_type(filename)[0] or '').startswith('text/'):
+        return 'text'
+    return None
+
+
+def build_preview(path: str, kind: str, sidecar: str) -> dict:
+    """Runs in a pool worker: inspect ``path`` and write the sidecar files.
+
+    Returns the metadata that was written (also stored as ``sidecar + '.json'``).
+    """
+    st = os.stat(path)
+    meta = {'kind': kind, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+    if kind == 'image':
+        from PIL import Image  # optional: image previews need Pillow
+        with Image.open(path) as img:
+            meta['width'], meta['height'] = img.size
+            img.draft('RGB', (PREVIEW_THUMBNAIL_PX, PREVIEW_THUMBNAIL_PX))  # fast JPEG downscale
+            img.thumbnail((PREVIEW_THUMBNAIL_PX, PREVIEW_THUMBNAIL_PX))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            tmp = sidecar + '.jpg.tmp'
+            img.save(tmp, format='JPEG', quality=80, optimize=True)
+            os.replace(tmp, sidecar + '.jpg')
+        meta['thumbnail'] = True
+    else:
+        with open(path, 'rb') as fh:
+            head = fh.read(PREVIEW_SNIPPET_BYTES)
+        if b'\0' not in head:
+            text = head.decode('utf-8', errors='replace')
+            if len(head) == PREVIEW_SNIPPET_BYTES and '\n' in text:
+                text = text[:text.rindex('\n')]  # don't end on a partial line
+            meta['snippet'] = '\n'.join(text.splitlines()[:PREVIEW_SNIPPET_LINES])
+    tmp = sidecar + '.json.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(meta, fh)
+    os.replace(tmp, sidecar + '.json')
+    return meta
+
+
+class PreviewPipeline:
+    """Bounded queue feeding a process pool; one job per file.
+
+    Sidecars go to ``folder``, sources are read from ``uploads``; a job whose
+    file left ``index`` while it ran has its output discarded.
+    """
+
+    def __init__(self, folder: Path, uploads: Path, workers: int, queue_size: int, max_image_bytes: int, index):
+        self.folder = folder
+        self.uploads = uploads
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_image_bytes = max_image_bytes
+        self.index = index
+        self._pending = OrderedDict()  # filename -> kind
+        self._running = {}  # filename -> Future
+        self._cond = threading.Condition()
+        self._pool = None
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self, fork: bool = True):
+        """Create the pool. Workers are forked (a spawned worker would re-run this module,
+        monkey patching included), which is only safe while the caller is the sole
+        thread; otherwise, or without fork, the work stays in threads."""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        self.folder.mkdir(parents=True, exist_ok=True)
+        if fork and 'fork' in multiprocessing.get_all_start_methods():
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            self._pool.submit(os.getpid).result()  # fork all workers now
+        else:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='preview')
+
+    def sidecar(self, filename: str) -> Path:
+        return self.folder / hashlib.sha1(filename.encode()).hexdigest()
+
+    def enqueue(self, filename: str) -> bool:
+        kind = preview_kind(filename)
+        if kind is None or self._pool is None:
+            return False
+        with self._cond:
+            if filename in self._pending or filename in self._running:
+                return True
+            if len(self._pending) >= self.queue_size:
+                self.dropped += 1
+                M_PREVIEW_JOBS.inc(result='dropped')
+                return False
+            self._pending[filename] = kind
+            self._cond.notify()
+        return True
+
+    def cancel(self, filename: str):
+        with self._cond:
+            self._pending.pop(filename, None)
+            future = self._running.get(filename)
+        if future is not None:
+            future.cancel()  # a job already running finishes; _done discards its output
+        self._discard(filename)
+
+    def _discard(self, filename: str):
+        sidecar = self.sidecar(filename)
+        for suffix in ('.json', '.jpg'):
+            try:
+                os.unlink(str(sidecar) + suffix)
+            except FileNotFoundError:
+                pass
+
+    def on_index_change(self, op, entry):
+        if op == 'remove':
+            self.cancel(entry['filename'])
+        else:
+            self.enqueue(entry['filename'])
+
+    def dispatch(self) -> bool:
+        """Move the oldest queued job into the pool; False if none is queued or ``workers`` are busy."""
+        with self._cond:
+            if not self._pending or len(self._running) >= self.workers:
+                return False
+            filename, kind = self._pending.popitem(last=False)
+        path = self.uploads / filename
+        if kind == 'image':
+            try:
+                too_big = path.stat().st_size > self.max_image_bytes
+            except FileNotFoundError:
+                return True
+            if too_big:
+                return True
+        future = self._pool.submit(build_preview, str(path), kind, str(self.sidecar(filename)))
+        with self._cond:
+            self._running[filename] = future
+        future.add_done_callback(lambda f, name=filename: self._done(name, f))
+        return True
+
+    def run(self):
+        """Background task moving queued jobs into the pool, at most ``workers`` at a time."""
+        while True:
+            with self._cond:
+                while not self._pending or len(self._running) >= self.workers:
+                    self._cond.wait()
+            self.dispatch()
+
+    def _done(self, filename: str, future):
+        with self._cond:
+            self._running.pop(filename, None)
+            self._cond.notify()
+        if future.cancelled():
+            M_PREVIEW_JOBS.inc(result='cancelled')
+            return
+        if future.exception() is not None:
+            self.failed += 1
+            M_PREVIEW_JOBS.inc(result='failed')
+            logger.warning(f"Preview failed for {filename}: {future.exception()}")
+            return
+        if self.index.get(filename) is None:  # deleted while the job ran
+            self._discard(filename)
+            M_PREVIEW_JOBS.inc(result='cancelled')
+            return
+        M_PREVIEW_JOBS.inc(result='ok')
+
+    def load(self, filename: str, st):
+        """Sidecar metadata for the current version of ``filename``, or None."""
+        try:
+            meta = json.loads(Path(str(self.sidecar(filename)) + '.json').read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta.get('mtime_ns') != st.st_mtime_ns or meta.get('size') != st.st_size:
+            return None
+        return meta
+
+    def status(self, filename: str) -> str:
+        with self._cond:
+            return 'pending' if filename in self._pending or filename in self._running else 'missing'
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'queued': len(self._pending), 'running': len(self._running),
+                    'dropped': self.dropped, 'failed': self.failed}
@@ -0,0 +1,81 @@
+"""QR codes.
+
+Every landing page asks for the same one or two codes, so rendered images are
+kept in a small LRU keyed by (url, size, format). The server's own URLs are
+rendered at startup and pinned; arbitrary ``url=`` values share the remaining
+slots and simply evict each other.
+"""
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+
+from .fileio import run_io
+
+logger = logging.getLogger(__name__)
+
+QR_MAX_URL_LENGTH = 2048
+QR_DEFAULT_BOX_SIZE = 10  # pixels per module, qrcode's default
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+
+class QRCodeCache:
+    """Bounded LRU of rendered QR images: key -> (body, etag)."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._pinned = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def render(url: str, size: int, fmt: str) -> bytes:
+        import qrcode
+        import qrcode.image.svg
+        buf = io.BytesIO()
+        if fmt == 'svg':
+            img = qrcode.make(url, box_size=size, image_factory=qrcode.image.svg.SvgPathImage)
+            img.save(buf)
+        else:
+            img = qrcode.make(url, box_size=size)
+            img.save(buf, format='PNG')
+        return buf.getvalue()
+
+    def get(self, url: str, size: int, fmt: str, pin: bool = False):
+        key = (url, size, fmt)
+        with self._lock:
+            hit = self._pinned.get(key)
+            if hit is None and key in self._items:
+                self._items.move_to_end(key)
+                hit = self._items[key]
+            if hit is not None:
+                self.hits += 1
+                return hit
+            self.misses += 1
+        body = run_io(self.render, url, size, fmt)
+        entry = (body, f'"{hashlib.sha1(body).hexdigest()[:16]}"')
+        with self._lock:
+            if pin:
+                self._pinned[key] = entry
+            elif self.capacity > 0:
+                self._items[key] = entry
+                self._items.move_to_end(key)
+                while len(self._items) > self.capacity:
+                    self._items.popitem(last=False)
+        return entry
+
+    def prewarm(self, urls):
+        for url in urls:
+            for fmt in QR_FORMATS:
+                try:
+                    self.get(url, QR_DEFAULT_BOX_SIZE, fmt, pin=True)
+                except Exception as e:
+                    logger.warning(f"QR prewarm failed for {url} ({fmt}): {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'cached': len(self._items), 'pinned': len(self._pinned), 'capacity': self.capacity,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,215 @@
+"""Storage quota.
+
+Usage is summed incrementally from index changes. Uploads reserve their size
+(Content-Length, or the declared size of a resumable upload) before writing;
+a reservation that would cross the quota or leave less than ``min_free`` bytes
+on disk first evicts files, else the upload gets 507. Above the high-water mark
+the eviction thread trims usage to the low-water mark. Candidates sit in a heap
+with lazy invalidation (least recently downloaded first, or largest first);
+PIN-protected and kept files are never candidates.
+"""
+import heapq
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+QUOTA_POLICIES = ('lru', 'size', 'off')
+
+
+class QuotaManager:
+    """Incremental usage accounting, reservations and an eviction heap.
+
+    ``remove(name)`` deletes an evicted file (and its index entry);
+    ``on_evicted(names)`` is told about each eviction round.
+    """
+
+    def __init__(self, folder: Path, quota: int, policy: str, keep_path: Path, index, remove, on_evicted,
+                 high_water: float = 0.9, low_water: float = 0.8, min_free: int = 256 * 1024 * 1024):
+        self.folder = folder
+        self.quota = quota
+        self.policy = policy
+        self.keep_path = keep_path
+        self.index = index
+        self.remove = remove
+        self.on_evicted = on_evicted
+        self.high_water = high_water
+        self.low_water = low_water
+        self.min_free = min_free
+        self.used = 0
+        self.reserved = 0
+        self.disk_free = None
+        self.evicted_total = 0
+        self._sizes = {}  # filename -> size, for every indexed file
+        self._priority = {}  # filename -> current heap priority, eviction candidates only
+        self._heap = []
+        self._kept = set()
+        self._cond = threading.Condition()
+
+    def _rank(self, name, size, last_access):
+        if self.policy == 'size':
+            return (-size, last_access, name)
+        return (last_access, name)
+
+    def _push(self, name, size, last_access):
+        prio = self._rank(name, size, last_access)
+        self._priority[name] = prio
+        heapq.heappush(self._heap, prio)
+        if len(self._heap) > 2 * len(self._priority) + 1024:
+            self._heap = list(self._priority.values())  # drop stale entries
+            heapq.heapify(self._heap)
+
+    def load(self, entries):
+        try:
+            self._kept = set(json.loads(self.keep_path.read_text()))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {self.keep_path.name}: {e}")
+        with self._cond:
+            for entry in entries:
+                self._track(entry)
+        self.refresh_disk()
+
+    def _track(self, entry):
+        name = entry['filename']
+        self.used += entry['size'] - self._sizes.get(name, 0)
+        self._sizes[name] = entry['size']
+        self._priority.pop(name, None)
+        if not entry['has_pin'] and name not in self._kept:
+            self._push(name, entry['size'], entry['mtime'])
+
+    def on_index_change(self, op, entry):
+        with self._cond:
+            if op == 'remove':
+                self.used -= self._sizes.pop(entry['filename'], 0)
+                self._priority.pop(entry['filename'], None)
+            else:
+                self._track(entry)
+                if self._over(self.high_water):
+                    self._cond.notify()
+
+    def touch(self, filename):
+        """Record a download (the LRU clock)."""
+        with self._cond:
+            if filename in self._priority:
+                self._push(filename, self._sizes[filename], time.time())
+
+    def set_kept(self, filename, keep: bool):
+        with self._cond:
+            if keep:
+                self._kept.add(filename)
+                self._priority.pop(filename, None)
+            else:
+                self._kept.discard(filename)
+                entry = self.index.get(filename)
+                if entry is not None:
+                    self._track(entry)
+            kept = sorted(self._kept & set(self._sizes))
+        tmp = self.keep_path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(kept))
+        os.replace(tmp, self.keep_path)
+
+    def refresh_disk(self):
+        try:
+            self.disk_free = shutil.disk_usage(self.folder).free
+        except OSError:
+            self.disk_free = None
+
+    def _over(self, fraction) -> bool:
+        return bool(self.quota) and self.used + self.reserved > self.quota * fraction
+
+    def _shortfall(self, n) -> int:
+        """Bytes that must be freed before ``n`` more fit (0 if they already do)."""
+        need = 0
+        if self.quota:
+            need = self.used + self.reserved + n - self.quota
+        if self.disk_free is not None:
+            need = max(need, n + self.min_free - self.disk_free)
+        return max(need, 0)
+
+    def _pop_victims(self, nbytes):
+        """Pop candidates until ``nbytes`` are covered; returns (names, heap priorities, bytes)."""
+        victims, prios, freed = [], [], 0
+        while self._heap and freed < nbytes:
+            prio = heapq.heappop(self._heap)
+            name = prio[-1]
+            if self._priority.get(name) != prio:
+                continue  # stale: touched, kept, protected or gone
+            del self._priority[name]
+            victims.append(name)
+            prios.append(prio)
+            freed += self._sizes.get(name, 0)
+        return victims, prios, freed
+
+    def reserve(self, n: int, force: bool = False) -> bool:
+        """Claim ``n`` bytes for an upload in progress, evicting if needed. False means no room."""
+        n = max(int(n or 0), 0)
+        self.refresh_disk()
+        with self._cond:
+            shortfall = 0 if force else self._shortfall(n)
+            victims, prios, freed = [], [], 0
+            if shortfall and self.policy != 'off':
+                victims, prios, freed = self._pop_victims(shortfall)
+            if shortfall > freed:
+                for name, prio in zip(victims, prios):  # can't make room anyway: evict nothing
+                    self._priority[name] = prio
+                    heapq.heappush(self._heap, prio)
+                return False
+            self.reserved += n
+        self._evict(victims, 'quota')
+        return True
+
+    def release(self, n: int):
+        with self._cond:
+            self.reserved = max(self.reserved - max(int(n or 0), 0), 0)
+
+    def _evict(self, names, reason):
+        if not names:
+            return
+        evicted = []
+        for name in names:
+            try:
+                self.remove(name)
+            except Exception as e:
+                logger.warning(f"Failed to evict {name}: {e}")
+                continue
+            evicted.append(name)
+        if evicted:
+            self.evicted_total += len(evicted)
+            logger.info(f"Evicted {len(evicted)} file(s) ({reason})")
+            self.on_evicted(evicted)
+            self.refresh_disk()
+
+    def run(self):
+        """Background task trimming usage to the low-water mark once it passes the high-water mark."""
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._over(self.high_water), timeout=30)
+                victims = []
+                if self._over(self.high_water) and self.policy != 'off':
+                    excess = self.used + self.reserved - int(self.quota * self.low_water)
+                    victims = self._pop_victims(excess)[0]
+            try:
+                self._evict(victims, 'high-water mark')
+            except Exception as e:
+                logger.error(f"Eviction failed: {e}")
+            self.refresh_disk()
+
+    def usage(self) -> dict:
+        with self._cond:
+            return {
+                'used_bytes': self.used,
+                'reserved_bytes': self.reserved,
+                'quota_bytes': self.quota or None,
+                'disk_free_bytes': self.disk_free,
+                'files': len(self._sizes),
+                'evictable_files': len(self._priority),
+                'evicted_total': self.evicted_total,
+                'policy': self.policy,
+            }
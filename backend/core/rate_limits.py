@@ -0,0 +1,193 @@
+"""Client rate limits.
+
+Request counts say little about cost on a file share, so transfer endpoints are
+limited by what they move instead: bytes per client over a sliding window
+(two fixed-window counters interpolated, O(1) memory per client) and the
+number of concurrent transfers. Both budgets shrink while the server is busy
+(many active transfers, a deep disk queue). A client over its byte budget gets
+429 for new transfers and has running ones paced to the sustainable rate.
+Idle clients are evicted so thousands of addresses stay cheap, and stream slots
+that moved no bytes for a whole window (a response whose close() never ran) are
+reclaimed so they cannot lock a client out.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import METRICS, Counter
+
+M_RATE_LIMITED = METRICS.register(Counter(
+    'wifix_rate_limited_total', 'Transfers refused by the client rate limiter', ('reason',)))
+
+
+class _ClientWindow:
+    __slots__ = ('start', 'prev', 'cur', 'streams', 'seen', 'active')
+
+    def __init__(self, now):
+        self.start = now
+        self.prev = 0
+        self.cur = 0
+        self.streams = 0
+        self.seen = now
+        self.active = now  # last time one of its streams opened, closed or moved bytes
+
+    def roll(self, now, window):
+        elapsed = now - self.start
+        if elapsed >= 2 * window:
+            self.prev = self.cur = 0
+            self.start = now
+        elif elapsed >= window:
+            self.prev, self.cur = self.cur, 0
+            self.start += window
+
+    def bytes(self, now, window) -> float:
+        """Bytes in the last ``window`` seconds, weighting the previous window by its overlap."""
+        self.roll(now, window)
+        return self.prev * max(0.0, 1 - (now - self.start) / window) + self.cur
+
+
+class ClientRateLimiter:
+    """Per-client byte budgets and stream caps, scaled by server load.
+
+    ``load()`` returns (active transfers, disk operations in flight or queued);
+    limits start shrinking once either passes ``load_transfers`` or
+    ``load_disk_queue`` and never go below ``min_scale`` of the configured ones.
+    """
+
+    def __init__(self, window, bytes_per_window, max_streams, max_clients, load,
+                 load_transfers=32, load_disk_queue=16, min_scale=0.25, enabled=True):
+        self.window = window
+        self.bytes_per_window = bytes_per_window
+        self.max_streams = max_streams
+        self.max_clients = max_clients
+        self.load_transfers = load_transfers
+        self.load_disk_queue = load_disk_queue
+        self.min_scale = min_scale
+        self._load = load
+        self._switched_on = enabled
+        self._clients = OrderedDict()  # least recently seen first
+        self._scale = (1.0, 0.0)  # (value, computed at)
+        self._swept = time.monotonic()
+        self.evicted = 0
+        self.expired_streams = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._switched_on and bool(self.bytes_per_window or self.max_streams)
+
+    def scale(self, now=None) -> float:
+        """Fraction of the configured limits granted under the current load (recomputed each second)."""
+        now = time.monotonic() if now is None else now
+        value, at = self._scale
+        if now - at >= 1.0:
+            transfers, disk_queue = self._load()
+            pressure = max(transfers / max(self.load_transfers, 1), disk_queue / max(self.load_disk_queue, 1))
+            value = 1.0 if pressure <= 1 else max(self.min_scale, 1 / pressure)
+            self._scale = (value, now)
+        return value
+
+    def limits(self, now=None) -> tuple:
+        scale = self.scale(now)
+        return self.bytes_per_window * scale, max(1, int(self.max_streams * scale))
+
+    def _client(self, client, now) -> _ClientWindow:
+        w = self._clients.get(client)
+        if w is None:
+            w = self._clients[client] = _ClientWindow(now)
+            if len(self._clients) > self.max_clients or now - self._swept > self.window:
+                self._sweep(now)
+        else:
+            self._clients.move_to_end(client)
+        w.seen = now
+        return w
+
+    def _expire_streams(self, w, now):
+        """Forget stream slots that moved no bytes for a whole window: their close() was lost."""
+        if w.streams and now - w.active >= self.window:
+            self.expired_streams += w.streams
+            w.streams = 0
+
+    def _sweep(self, now):
+        """Drop clients idle for a whole window (oldest first); over the cap, any idle ones."""
+        self._swept = now
+        for client in list(self._clients):
+            w = self._clients[client]
+            self._expire_streams(w, now)
+            if w.streams:
+                continue
+            if now - w.seen < 2 * self.window and len(self._clients) <= self.max_clients:
+                break
+            del self._clients[client]
+            self.evicted += 1
+
+    def admit(self, client):
+        """None when ``client`` may start a transfer, else ``(reason, retry_after_seconds)``."""
+        now = time.monotonic()
+        budget, streams = self.limits(now)
+        with self._lock:
+            w = self._client(client, now)
+            self._expire_streams(w, now)
+            if self.max_streams and w.streams >= streams:
+                return 'too many concurrent transfers', 1
+            used = w.bytes(now, self.window)
+            if self.bytes_per_window and used >= budget:
+                # time until the sliding window has drained back under the budget
+                return 'transfer budget exceeded', min(self.window, (used - budget) / budget * self.window + 1)
+        return None
+
+    def opened(self, client):
+        now = time.monotonic()
+        with self._lock:
+            w = self._client(client, now)
+            w.streams += 1
+            w.active = now
+
+    def closed(self, client):
+        with self._lock:
+            w = self._clients.get(client)
+            if w is not None and w.streams:
+                w.streams -= 1
+                w.active = time.monotonic()
+
+    def consume(self, client, n) -> float:
+        """Count ``n`` bytes for ``client``; seconds to wait when it is over budget."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        budget = self.limits(now)[0]
+        with self._lock:
+            w = self._client(client, now)
+            used = w.bytes(now, self.window)
+            w.cur += n
+            w.active = now
+        if not self.bytes_per_window or used < budget:
+            return 0.0
+        return n / (budget / self.window)
+
+    def set_limits(self, bytes_per_window=None, max_streams=None):
+        with self._lock:
+            if bytes_per_window is not None:
+                self.bytes_per_window = max(0, int(bytes_per_window))
+            if max_streams is not None:
+                self.max_streams = max(0, int(max_streams))
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        budget, streams = self.limits(now)
+        with self._lock:
+            top = sorted(((w.bytes(now, self.window), c, w.streams) for c, w in self._clients.items()),
+                         reverse=True)[:10]
+            tracked = len(self._clients)
+        return {
+            'enabled': self.enabled,
+            'window_seconds': self.window,
+            'bytes_per_window': self.bytes_per_window,
+            'max_streams': self.max_streams,
+            'load_scale': round(self.scale(now), 3),
+            'effective': {'bytes_per_window': int(budget), 'max_streams': streams},
+            'clients': tracked,
+            'evicted': self.evicted,
+            'expired_streams': self.expired_streams,
+            'top': [{'client': c, 'bytes': int(b), 'streams': s} for b, c, s in top],
+        }
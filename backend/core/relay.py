@@ -0,0 +1,207 @@
+"""Peer relay.
+
+One-off transfers between the host and a client it approved, without touching
+UPLOAD_FOLDER. The sender offers a file over Socket.IO (`relay_offer`), each
+side gets a one-time URL, and the sender's PUT body is piped through a bounded
+in-memory buffer into the receiver's GET response: a full buffer stops the
+server reading the upload (TCP backpressure), an empty one parks the download.
+Both requests have to reach the same process, so relays need a single worker
+(or sticky routing) when running several.
+"""
+import logging
+import secrets
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class PeerApprovals:
+    """Socket pairs joined by the host's ``approve_request``; only those may relay to each other."""
+
+    def __init__(self):
+        self._peers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def approve(self, host_sid, sid):
+        with self._lock:
+            self._peers[host_sid].add(sid)
+            self._peers[sid].add(host_sid)
+
+    def approved(self, a, b) -> bool:
+        with self._lock:
+            return b in self._peers.get(a, ())
+
+    def drop(self, sid):
+        with self._lock:
+            for peer in self._peers.pop(sid, ()):
+                others = self._peers.get(peer)
+                if others is not None:
+                    others.discard(sid)
+                    if not others:
+                        del self._peers[peer]
+
+
+class RelayAborted(Exception):
+    pass
+
+
+class Relay:
+    """One sender -> receiver pipe: a queue of chunks bounded by ``max_buffer`` bytes."""
+
+    def __init__(self, sender, receiver, filename, size, max_buffer):
+        self.id = uuid.uuid4().hex
+        self.sender = sender
+        self.receiver = receiver
+        self.filename = filename
+        self.size = size
+        self.max_buffer = max_buffer
+        self.send_key = secrets.token_urlsafe(16)
+        self.recv_key = secrets.token_urlsafe(16)
+        self.created = time.monotonic()
+        self.sending = False  # each side attaches exactly once
+        self.receiving = False
+        self.delivered = 0
+        self.error = None
+        self._chunks = deque()
+        self._buffered = 0
+        self._eof = False
+        self._drained = False
+        self._cond = threading.Condition()
+
+    def _wait(self, ready, timeout, stalled):
+        """Wait under the condition until ``ready()`` or an abort; abort with ``stalled`` on timeout."""
+        deadline = time.monotonic() + timeout
+        while not ready() and self.error is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.abort(stalled)
+                break
+            self._cond.wait(remaining)
+        if self.error is not None:
+            raise RelayAborted(self.error)
+
+    def put(self, chunk: bytes, timeout: float):
+        """Queue ``chunk`` for the receiver, blocking while the buffer is full."""
+        with self._cond:
+            self._wait(lambda: self._buffered < self.max_buffer, timeout, 'receiver stalled')
+            self._chunks.append(chunk)
+            self._buffered += len(chunk)
+            self._cond.notify_all()
+
+    def finish(self, timeout: float):
+        """Mark the end of the upload and wait until the receiver has taken every byte."""
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+            self._wait(lambda: self._drained, timeout, 'receiver stalled')
+
+    def get(self, timeout: float):
+        """Next chunk for the receiver, or None once the sender finished and the buffer is empty."""
+        with self._cond:
+            self._wait(lambda: self._chunks or self._eof, timeout, 'sender stalled')
+            if not self._chunks:
+                self._drained = True
+                self._cond.notify_all()
+                return None
+            chunk = self._chunks.popleft()
+            self._buffered -= len(chunk)
+            self.delivered += len(chunk)
+            self._cond.notify_all()
+            return chunk
+
+    def abort(self, reason: str) -> bool:
+        """Fail both sides; returns False if the relay had already failed."""
+        with self._cond:
+            if self.error is not None:
+                return False
+            self.error = reason
+            self._chunks.clear()
+            self._buffered = 0
+            self._cond.notify_all()
+            return True
+
+    def info(self) -> dict:
+        return {'relay_id': self.id, 'filename': self.filename, 'size': self.size,
+                'delivered': self.delivered, 'buffered': self._buffered,
+                'sending': self.sending, 'receiving': self.receiving}
+
+
+class RelayHub:
+    """Active relays by id. ``emit(event, payload, to=sid)`` notifies both ends of the outcome."""
+
+    def __init__(self, max_active: int, max_buffer: int, timeout: float, emit):
+        self.max_active = max_active
+        self.max_buffer = max_buffer
+        self.timeout = timeout
+        self.emit = emit
+        self._relays = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.aborted = 0
+        self.bytes = 0
+
+    def create(self, sender, receiver, filename, size):
+        """Register a new relay, or return None when ``max_active`` are already running."""
+        self._purge_unclaimed()
+        with self._lock:
+            if len(self._relays) >= self.max_active:
+                return None
+            relay = Relay(sender, receiver, filename, size, self.max_buffer)
+            self._relays[relay.id] = relay
+        return relay
+
+    def get(self, relay_id):
+        return self._relays.get(relay_id)
+
+    def attach(self, relay, side: str) -> bool:
+        """Claim the ``'sending'`` or ``'receiving'`` end; False if it is already taken."""
+        with self._lock:
+            if getattr(relay, side) or relay.error is not None:
+                return False
+            setattr(relay, side, True)
+            return True
+
+    def complete(self, relay):
+        with self._lock:
+            if self._relays.pop(relay.id, None) is None:
+                return
+            self.completed += 1
+            self.bytes += relay.delivered
+        logger.info(f"Relay {relay.id[:8]} delivered {relay.filename} ({relay.delivered} bytes)")
+        for sid in (relay.sender, relay.receiver):
+            self.emit('relay_complete', {'relay_id': relay.id, 'bytes': relay.delivered}, to=sid)
+
+    def abort(self, relay, reason: str):
+        first = relay.abort(reason)
+        with self._lock:
+            removed = self._relays.pop(relay.id, None) is not None
+            if removed:
+                self.aborted += 1
+        if first or removed:
+            logger.info(f"Relay {relay.id[:8]} aborted: {relay.error}")
+            for sid in (relay.sender, relay.receiver):
+                self.emit('relay_aborted', {'relay_id': relay.id, 'reason': relay.error}, to=sid)
+
+    def abort_for(self, sid, reason: str):
+        """Drop relays of a departed socket that have not been picked up by both sides yet;
+        running ones carry on over HTTP."""
+        with self._lock:
+            pending = [r for r in self._relays.values()
+                       if sid in (r.sender, r.receiver) and not (r.sending and r.receiving)]
+        for relay in pending:
+            self.abort(relay, reason)
+
+    def _purge_unclaimed(self):
+        cutoff = time.monotonic() - self.timeout
+        with self._lock:
+            stale = [r for r in self._relays.values() if r.created < cutoff and not (r.sending or r.receiving)]
+        for relay in stale:
+            self.abort(relay, 'not picked up')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'active': [r.info() for r in self._relays.values()], 'completed': self.completed,
+                    'aborted': self.aborted, 'bytes': self.bytes}
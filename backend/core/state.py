@@ -0,0 +1,324 @@
+"""State shared between worker processes: the host SID, file PINs, upload digests
+and (optionally) the request-count limiter's counters, kept in SQLite."""
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PIN_HASH_ITERATIONS = 100_000
+
+
+class SQLiteDB:
+    """One SQLite connection shared by all threads behind a lock; WAL mode, autocommit.
+
+    Statements are short primary-key lookups, so serialising them costs less than a
+    connection (and a journal-mode switch) per thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(path), timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+
+    def query(self, sql, params=()) -> list:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()) -> int:
+        """Run one statement; returns the number of rows it changed."""
+        with self._lock:
+            return self._db.execute(sql, params).rowcount
+
+    def executemany(self, sql, seq):
+        with self._lock:
+            self._db.executemany(sql, seq)
+
+    @contextmanager
+    def transaction(self):
+        """The raw connection inside BEGIN IMMEDIATE ... COMMIT, held for the whole block."""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def data_version(self) -> int:
+        """Changes whenever another connection (another worker) commits to the database."""
+        return self.query('PRAGMA data_version')[0][0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class MemoryStateBackend:
+    """In-process state; fine for a single worker."""
+
+    def __init__(self):
+        self._host_sid = None
+        self._lock = threading.Lock()
+
+    def get_host_sid(self):
+        return self._host_sid
+
+    def set_host_sid(self, sid):
+        self._host_sid = sid
+
+    def clear_host_sid(self, sid) -> bool:
+        """Clear the host only if it is still ``sid``; returns True if it was."""
+        with self._lock:
+            if self._host_sid == sid:
+                self._host_sid = None
+                return True
+            return False
+
+
+class SQLiteStateBackend:
+    """State shared between processes through one SQLite file."""
+
+    def __init__(self, db: SQLiteDB):
+        self.db = db
+        db.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)')
+
+    def get_host_sid(self):
+        rows = self.db.query("SELECT value FROM kv WHERE key = 'host_sid'")
+        return rows[0][0] if rows else None
+
+    def set_host_sid(self, sid):
+        self.db.execute("INSERT OR REPLACE INTO kv (key, value) VALUES ('host_sid', ?)", (sid,))
+
+    def clear_host_sid(self, sid) -> bool:
+        return self.db.execute("DELETE FROM kv WHERE key = 'host_sid' AND value = ?", (sid,)) > 0
+
+
+def hash_pin(pin: str) -> str:
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', pin.encode(), salt, PIN_HASH_ITERATIONS)
+    return f'pbkdf2_sha256${PIN_HASH_ITERATIONS}${salt.hex()}${digest.hex()}'
+
+
+def verify_pin(pin: str, encoded: str) -> bool:
+    try:
+        algorithm, iterations, salt, expected = encoded.split('$')
+    except ValueError:
+        return False
+    if algorithm != 'pbkdf2_sha256':
+        return False
+    digest = hashlib.pbkdf2_hmac('sha256', pin.encode(), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+class PinStore:
+    """Salted PIN hashes per file, plus the files each session token has unlocked.
+
+    Grants replace the old ``file_pin_<name>`` session keys: the cookie carries one
+    random token however many files were unlocked, and a grant is one primary-key
+    lookup. The names of protected files are kept in memory, so asking whether a
+    download needs a PIN costs no query; with ``shared`` (other worker processes
+    write the same database) the set is reloaded when SQLite's data_version says
+    another connection committed.
+    """
+
+    def __init__(self, db: SQLiteDB, grant_ttl: int, shared: bool = False):
+        self.db = db
+        self.grant_ttl = grant_ttl
+        self.shared = shared
+        self._last_purge = 0.0
+        with db.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS file_pins (filename TEXT PRIMARY KEY, pin TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS pin_grants (token TEXT NOT NULL, filename TEXT NOT NULL, '
+                         'expires REAL NOT NULL, PRIMARY KEY (token, filename)) WITHOUT ROWID')
+            conn.execute('CREATE INDEX IF NOT EXISTS pin_grants_filename ON pin_grants (filename)')
+            # PINs written by older versions were stored in plain text
+            plain = conn.execute("SELECT filename, pin FROM file_pins WHERE pin NOT LIKE 'pbkdf2_sha256$%'").fetchall()
+            for filename, pin in plain:
+                conn.execute('UPDATE file_pins SET pin = ? WHERE filename = ?', (hash_pin(pin), filename))
+        if plain:
+            logger.info(f"Hashed {len(plain)} plain-text file PIN(s)")
+        self._reload()
+
+    def _reload(self):
+        with self.db.transaction() as conn:
+            self._version = conn.execute('PRAGMA data_version').fetchone()[0]
+            self._pinned = {r[0] for r in conn.execute('SELECT filename FROM file_pins')}
+
+    def _names(self) -> set:
+        if self.shared and self.db.data_version() != self._version:
+            self._reload()
+        return self._pinned
+
+    def has_pin(self, filename) -> bool:
+        return filename in self._names()
+
+    def get_hash(self, filename):
+        if not self.has_pin(filename):
+            return None
+        rows = self.db.query('SELECT pin FROM file_pins WHERE filename = ?', (filename,))
+        return rows[0][0] if rows else None
+
+    def set_pin(self, filename, pin):
+        self.set_hash(filename, hash_pin(pin))
+
+    def set_hash(self, filename, encoded):
+        self.db.execute('INSERT OR REPLACE INTO file_pins (filename, pin) VALUES (?, ?)', (filename, encoded))
+        self._pinned.add(filename)
+
+    def delete_pin(self, filename):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM file_pins WHERE filename = ?', (filename,))
+            conn.execute('DELETE FROM pin_grants WHERE filename = ?', (filename,))
+        self._pinned.discard(filename)
+
+    def pin_names(self):
+        return list(self._names())
+
+    def verify(self, filename, pin) -> bool:
+        encoded = self.get_hash(filename)
+        return encoded is not None and verify_pin(pin, encoded)
+
+    def grant(self, token, filename):
+        now = time.time()
+        self.db.execute('INSERT OR REPLACE INTO pin_grants (token, filename, expires) VALUES (?, ?, ?)',
+                        (token, filename, now + self.grant_ttl))
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            self.db.execute('DELETE FROM pin_grants WHERE expires < ?', (now,))
+
+    def has_grant(self, token, filename) -> bool:
+        return bool(self.db.query('SELECT 1 FROM pin_grants WHERE token = ? AND filename = ? AND expires > ?',
+                                  (token, filename, time.time())))
+
+
+class PinMapping(MutableMapping):
+    """``FILE_PINS`` as a dict-like view over the PIN store. Assigning a PIN stores its
+    salted hash; reading returns the encoded hash, so compare with ``verify``."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, filename):
+        encoded = self._store.get_hash(filename)
+        if encoded is None:
+            raise KeyError(filename)
+        return encoded
+
+    def __setitem__(self, filename, pin):
+        self._store.set_pin(filename, pin)
+
+    def __delitem__(self, filename):
+        self._store.delete_pin(filename)
+
+    def __contains__(self, filename):
+        return self._store.has_pin(filename)
+
+    def __iter__(self):
+        return iter(self._store.pin_names())
+
+    def __len__(self):
+        return len(self._store.pin_names())
+
+    def verify(self, filename, pin) -> bool:
+        return self._store.verify(filename, pin)
+
+
+class DigestStore:
+    """SHA-256 of every upload, computed while it was written.
+
+    Each row remembers the size and mtime the digest belongs to, so a file
+    replaced behind our back simply has no known digest instead of a wrong one.
+    """
+
+    def __init__(self, db: SQLiteDB):
+        self.db = db
+        db.execute('CREATE TABLE IF NOT EXISTS file_digests (filename TEXT PRIMARY KEY, '
+                   'sha256 TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)')
+
+    def set(self, filename, digest, st):
+        self.db.execute('INSERT OR REPLACE INTO file_digests (filename, sha256, size, mtime_ns) '
+                        'VALUES (?, ?, ?, ?)', (filename, digest, st.st_size, st.st_mtime_ns))
+
+    def get(self, filename, st):
+        rows = self.db.query('SELECT sha256 FROM file_digests WHERE filename = ? AND size = ? '
+                             'AND mtime_ns = ?', (filename, st.st_size, st.st_mtime_ns))
+        return rows[0][0] if rows else None
+
+    def all(self) -> dict:
+        """{filename: (sha256, size, mtime_ns)}"""
+        return {r[0]: r[1:] for r in self.db.query('SELECT filename, sha256, size, mtime_ns FROM file_digests')}
+
+    def prune(self, present):
+        """Forget digests of files deleted while we were not running."""
+        gone = set(self.all()) - set(present)
+        self.db.executemany('DELETE FROM file_digests WHERE filename = ?', [(n,) for n in gone])
+
+    def on_index_change(self, op, entry):
+        if op == 'remove':
+            self.db.execute('DELETE FROM file_digests WHERE filename = ?', (entry['filename'],))
+
+
+try:
+    from limits.storage import Storage as _LimitsStorage
+except ImportError:  # pragma: no cover - limits always ships with Flask-Limiter
+    _LimitsStorage = None
+
+if _LimitsStorage is not None:
+    class SQLiteLimiterStorage(_LimitsStorage):
+        """Fixed-window rate-limit counters in SQLite, registered as ``sqlite:///path/to.db``.
+
+        Lets several local workers share limiter state without running Redis.
+        """
+
+        STORAGE_SCHEME = ['sqlite']
+
+        def __init__(self, uri=None, wrap_exceptions=False, **options):
+            self.path = uri.split('://', 1)[1]
+            self.db = SQLiteDB(self.path)
+            self.db.execute('CREATE TABLE IF NOT EXISTS rate_limits '
+                            '(key TEXT PRIMARY KEY, value INTEGER NOT NULL, expiry REAL NOT NULL)')
+            super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+        @property
+        def base_exceptions(self):
+            return sqlite3.Error
+
+        def incr(self, key, expiry, amount=1):
+            now = time.time()
+            with self.db.transaction() as conn:
+                conn.execute('DELETE FROM rate_limits WHERE key = ? AND expiry <= ?', (key, now))
+                conn.execute('INSERT INTO rate_limits (key, value, expiry) VALUES (?, ?, ?) '
+                             'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+                             (key, amount, now + expiry))
+                return conn.execute('SELECT value FROM rate_limits WHERE key = ?', (key,)).fetchone()[0]
+
+        def get(self, key):
+            rows = self.db.query('SELECT value FROM rate_limits WHERE key = ? AND expiry > ?', (key, time.time()))
+            return rows[0][0] if rows else 0
+
+        def get_expiry(self, key):
+            rows = self.db.query('SELECT expiry FROM rate_limits WHERE key = ?', (key,))
+            return rows[0][0] if rows else time.time()
+
+        def check(self):
+            try:
+                self.db.query('SELECT 1')
+                return True
+            except sqlite3.Error:
+                return False
+
+        def reset(self):
+            return self.db.execute('DELETE FROM rate_limits')
+
+        def clear(self, key):
+            self.db.execute('DELETE FROM rate_limits WHERE key = ?', (key,))
@@ -0,0 +1,242 @@
+"""Transfer scheduling.
+
+Every upload read and download write goes through a Transfer. When limits are
+set, each transfer is paced by a token bucket whose rate is its weighted share
+of the global cap, plus a per-client bucket; small files skip shaping so UI
+requests stay snappy. Without limits transfers are only counted.
+"""
+import threading
+import time
+
+from flask import g, request
+from flask_limiter.util import get_remote_address
+
+from .metrics import METRICS, Counter
+
+M_TRANSFER_BYTES = METRICS.register(Counter(
+    'wifix_transfer_bytes_total', 'Bytes moved by uploads and downloads', ('direction',)))
+M_TRANSFERS = METRICS.register(Counter(
+    'wifix_transfers_total', 'Completed uploads and downloads', ('direction',)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    def consume(self, n: int, now: float) -> float:
+        """Take ``n`` tokens (may go into debt); returns seconds to wait before proceeding."""
+        if self.rate <= 0:
+            return 0.0
+        burst = max(self.rate * 0.25, 64 * 1024)
+        self.tokens = min(burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= n
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Transfer:
+    """One in-flight upload or download, with live throughput accounting."""
+
+    def __init__(self, scheduler, transfer_id, direction, client, filename, size, weight):
+        self.scheduler = scheduler
+        self.id = transfer_id
+        self.direction = direction
+        self.client = client
+        self.filename = filename
+        self.size = size
+        self.weight = weight
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.bucket = TokenBucket(0)
+        self.closed = False
+        self.counted = False  # False while the body bypasses us (sendfile)
+
+    @property
+    def shaped(self) -> bool:
+        return self.size is None or self.size > self.scheduler.small_file_bytes
+
+    def account(self, n: int):
+        self.counted = True
+        self.bytes += n
+        M_TRANSFER_BYTES.inc(n, direction=self.direction)
+        self.scheduler.throttle(self, n)
+        delay = self.scheduler.rates.consume(self.client, n)
+        if delay > 0:
+            time.sleep(delay)
+
+    def wrap_iter(self, chunks):
+        """Yield ``chunks`` paced by the scheduler; closes the transfer when exhausted."""
+        try:
+            for chunk in chunks:
+                self.account(len(chunk))
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        if not self.counted and self.size:
+            self.bytes = self.size  # handed to the server in one piece (sendfile)
+            M_TRANSFER_BYTES.inc(self.size, direction=self.direction)
+            self.scheduler.rates.consume(self.client, self.size)
+        self.closed = True
+        M_TRANSFERS.inc(direction=self.direction)
+        self.scheduler.finish(self)
+
+    def info(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            'id': self.id,
+            'direction': self.direction,
+            'client': self.client,
+            'filename': self.filename,
+            'size': self.size,
+            'bytes': self.bytes,
+            'seconds': round(elapsed, 3),
+            'mb_per_s': round(self.bytes / elapsed / 1e6, 3),
+        }
+
+
+class ThrottledReader:
+    """File-like wrapper accounting every read of a request body to a Transfer."""
+
+    def __init__(self, stream, transfer):
+        self._stream = stream
+        self._transfer = transfer
+
+    def read(self, *args):
+        data = self._stream.read(*args)
+        if data:
+            self._transfer.account(len(data))
+        return data
+
+    def readinto(self, b):
+        if hasattr(self._stream, 'readinto'):
+            n = self._stream.readinto(b) or 0
+        else:
+            data = self._stream.read(len(b))
+            n = len(data)
+            b[:n] = data
+        if n:
+            self._transfer.account(n)
+        return n
+
+    def readline(self, *args):
+        data = self._stream.readline(*args)
+        if data:
+            self._transfer.account(len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class TransferScheduler:
+    """Active transfers and the bandwidth caps pacing them.
+
+    ``rates`` is the ClientRateLimiter every transfer also reports its bytes and
+    stream slot to.
+    """
+
+    def __init__(self, rates, global_bps=0, client_bps=0, small_file_bytes=1024 * 1024):
+        self.rates = rates
+        self.global_bps = global_bps
+        self.client_bps = client_bps
+        self.small_file_bytes = small_file_bytes
+        self.client_weights = {}
+        self._active = {}
+        self._client_buckets = {}
+        self._total_weight = 0.0
+        self._next_id = 0
+        self.completed_bytes = {'upload': 0, 'download': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.global_bps or self.client_bps)
+
+    def start(self, direction, filename, size, client=None) -> Transfer:
+        if client is None:
+            client = get_remote_address()
+        with self._lock:
+            self._next_id += 1
+            t = Transfer(self, self._next_id, direction, client, filename, size,
+                         float(self.client_weights.get(client, 1.0)))
+            self._active[t.id] = t
+            if t.shaped:
+                self._total_weight += t.weight
+            if client not in self._client_buckets:
+                self._client_buckets[client] = TokenBucket(self.client_bps)
+        self.rates.opened(client)
+        return t
+
+    def finish(self, t: Transfer):
+        with self._lock:
+            if self._active.pop(t.id, None) is None:
+                return
+            if t.shaped:
+                self._total_weight -= t.weight
+            self.completed_bytes[t.direction] = self.completed_bytes.get(t.direction, 0) + t.bytes
+            if not any(a.client == t.client for a in self._active.values()):
+                self._client_buckets.pop(t.client, None)
+        self.rates.closed(t.client)
+
+    def throttle(self, t: Transfer, n: int):
+        if not self.limited or not t.shaped:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.global_bps:
+                # weighted fair share of the global cap among shaped transfers
+                t.bucket.rate = self.global_bps * t.weight / max(self._total_weight, t.weight)
+                delay = t.bucket.consume(n, now)
+            bucket = self._client_buckets.get(t.client)
+            if self.client_bps and bucket is not None:
+                bucket.rate = self.client_bps
+                delay = max(delay, bucket.consume(n, now))
+        if delay > 0:
+            time.sleep(delay)
+
+    def wrap_input(self, filename, size) -> Transfer:
+        """Account the current request body to a new upload transfer.
+
+        Must run before ``request.stream``/``request.files`` is first touched; the
+        transfer is closed when the request is torn down.
+        """
+        t = self.start('upload', filename, size)
+        request.environ['wsgi.input'] = ThrottledReader(request.environ['wsgi.input'], t)
+        g.setdefault('transfers', []).append(t)
+        return t
+
+    def set_limits(self, global_bps=None, client_bps=None, small_file_bytes=None, weights=None):
+        with self._lock:
+            if global_bps is not None:
+                self.global_bps = max(0, int(global_bps))
+            if client_bps is not None:
+                self.client_bps = max(0, int(client_bps))
+            if small_file_bytes is not None:
+                self.small_file_bytes = max(0, int(small_file_bytes))
+            if weights is not None:
+                self.client_weights = {str(k): max(float(v), 0.01) for k, v in dict(weights).items()}
+
+    def limits(self) -> dict:
+        return {
+            'global_bps': self.global_bps,
+            'client_bps': self.client_bps,
+            'small_file_bytes': self.small_file_bytes,
+            'weights': dict(self.client_weights),
+        }
+
+    def active_count(self) -> int:
+        """In-flight uploads and downloads."""
+        with self._lock:
+            return len(self._active)
+
+    def stats(self) -> dict:
+        with self._lock:
+            active = [t.info() for t in self._active.values()]
+        return {'limits': self.limits(), 'active': active, 'completed_bytes': dict(self.completed_bytes)}
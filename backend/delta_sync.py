@@ -0,0 +1,221 @@
+"""Delta uploads to a WifiX server: re-share a modified file by sending only what changed.
+
+Fetches the block signature of a file already on the server, matches the local
+file against it with a rolling Adler-32 (confirmed by BLAKE2b), and uploads a
+delta of "copy from the old file" and "literal data" ops. The server rebuilds
+the new version from its copy plus the delta. Standard library only.
+
+Examples::
+
+    python delta_sync.py http://192.168.1.10:5000 20250101120000_disk.img disk.img
+    python delta_sync.py --pin 1234 --ttl 3600 http://wifix.lan 20250101120000_data.csv data.csv
+"""
+import argparse
+import base64
+import hashlib
+import http.client
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from urllib.parse import urlencode, urlparse, quote
+
+MOD_ADLER = 65521
+STRONG_BYTES = 16
+READ_SIZE = 4 * 1024 * 1024
+MAX_LITERAL = 1024 * 1024  # literal ops are flushed at this size
+OP_COPY, OP_LITERAL, OP_END = b'C', b'L', b'E'
+
+
+def _connection(url):
+    parsed = urlparse(url)
+    cls = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    return cls(parsed.hostname, parsed.port, timeout=600)
+
+
+def fetch_signature(url, filename, pin=None, block_size=None):
+    """GET the block signature of ``filename``; weak/strong come back decoded."""
+    params = {k: v for k, v in (('pin', pin), ('block_size', block_size)) if v}
+    conn = _connection(url)
+    conn.request('GET', f'/upload/delta/{quote(filename)}/signature' + (f'?{urlencode(params)}' if params else ''))
+    resp = conn.getresponse()
+    data = json.loads(resp.read() or b'{}')
+    conn.close()
+    if resp.status != 200:
+        raise RuntimeError(f'signature request failed: {resp.status} {data}')
+    weak = base64.b64decode(data['weak'])
+    data['weak'] = struct.unpack(f'>{len(weak) // 4}I', weak)
+    strong = base64.b64decode(data['strong'])
+    data['strong'] = [strong[i:i + STRONG_BYTES] for i in range(0, len(strong), STRONG_BYTES)]
+    return data
+
+
+class _DeltaWriter:
+    """Encodes ops into ``out``, merging adjacent copies and batching literals."""
+
+    def __init__(self, out):
+        self.out = out
+        self.copy = None  # pending [offset, length]
+        self.literal = bytearray()
+        self.copied = 0
+        self.literal_bytes = 0
+
+    def add_copy(self, offset, length):
+        self.flush_literal()
+        if self.copy and self.copy[0] + self.copy[1] == offset:
+            self.copy[1] += length
+        else:
+            self.flush_copy()
+            self.copy = [offset, length]
+        self.copied += length
+
+    def add_literal(self, data):
+        self.flush_copy()
+        self.literal += data
+        self.literal_bytes += len(data)
+        if len(self.literal) >= MAX_LITERAL:
+            self.flush_literal()
+
+    def flush_copy(self):
+        if self.copy:
+            self.out.write(OP_COPY + struct.pack('>QQ', *self.copy))
+            self.copy = None
+
+    def flush_literal(self):
+        if self.literal:
+            self.out.write(OP_LITERAL + struct.pack('>I', len(self.literal)) + self.literal)
+            self.literal = bytearray()
+
+    def close(self):
+        self.flush_copy()
+        self.flush_literal()
+        self.out.write(OP_END)
+
+
+def make_delta(path, signature, out):
+    """Write the delta turning the signed basis into the file at ``path``; returns (stats, sha256)."""
+    block = signature['block_size']
+    basis_size = signature['size']
+    tail = basis_size % block or block  # length of the basis' last block
+    last = len(signature['weak']) - 1
+    blocks = {}
+    for i, weak in enumerate(signature['weak']):
+        blocks.setdefault(weak, []).append(i)
+
+    def match(window, weak):
+        strong = None
+        for i in blocks.get(weak, ()):
+            if (tail if i == last else block) != len(window):
+                continue
+            if strong is None:
+                strong = hashlib.blake2b(window, digest_size=STRONG_BYTES).digest()
+            if signature['strong'][i] == strong:
+                return i
+        return None
+
+    writer = _DeltaWriter(out)
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        buf = b''
+        view = memoryview(buf)
+        pos = 0  # window start within buf
+        pending = 0  # start of bytes not yet emitted
+        eof = False
+        rolling = None  # (a, b) Adler-32 halves of the window while sliding byte by byte
+        while True:
+            if not eof and len(buf) - pos < block + 1:
+                more = fh.read(READ_SIZE)
+                hasher.update(more)
+                eof = not more
+                if pending < pos:
+                    writer.add_literal(buf[pending:pos])
+                buf = buf[pos:] + more
+                view = memoryview(buf)
+                pos = pending = 0
+                rolling = None
+                continue
+            end = min(pos + block, len(buf))
+            if end == pos:
+                break
+            if end - pos < block:
+                # end of file: only the basis' short last block can still match
+                i = match(view[pos:end], zlib.adler32(view[pos:end]))
+                if i is None:
+                    writer.add_literal(buf[pending:end])
+                else:
+                    if pending < pos:
+                        writer.add_literal(buf[pending:pos])
+                    writer.add_copy(i * block, end - pos)
+                break
+            if rolling is None:
+                weak = zlib.adler32(view[pos:end])
+                rolling = (weak & 0xffff, weak >> 16)
+            else:
+                a, b = rolling
+                out_byte = buf[pos - 1]
+                a = (a - out_byte + buf[end - 1]) % MOD_ADLER
+                b = (b - block * out_byte + a - 1) % MOD_ADLER
+                rolling = (a, b)
+                weak = (b << 16) | a
+            i = match(view[pos:end], weak) if weak in blocks else None
+            if i is None:
+                pos += 1
+                continue
+            if pending < pos:
+                writer.add_literal(buf[pending:pos])
+            writer.add_copy(i * block, block)
+            pos = pending = end
+            rolling = None
+    writer.close()
+    return {'copied_bytes': writer.copied, 'literal_bytes': writer.literal_bytes}, hasher.hexdigest()
+
+
+def upload_delta(url, basis, path, filename=None, pin=None, basis_pin=None, ttl=None, block_size=None):
+    """Upload ``path`` as a new version of the server file ``basis``; returns the server's JSON."""
+    started = time.perf_counter()
+    signature = fetch_signature(url, basis, basis_pin, block_size)
+    with tempfile.TemporaryFile() as delta:
+        stats, digest = make_delta(path, signature, delta)
+        wire = delta.tell()
+        delta.seek(0)
+        params = {'size': os.path.getsize(path), 'version': signature['version'], 'sha256': digest,
+                  'filename': filename or os.path.basename(path)}
+        params.update({k: v for k, v in (('pin', pin), ('basis_pin', basis_pin), ('ttl', ttl)) if v})
+        conn = _connection(url)
+        conn.request('POST', f'/upload/delta/{quote(basis)}?{urlencode(params)}', body=delta,
+                     headers={'Content-Type': 'application/octet-stream', 'Content-Length': str(wire)})
+        resp = conn.getresponse()
+        data = json.loads(resp.read() or b'{}')
+        conn.close()
+    if resp.status != 201:
+        raise RuntimeError(f'delta upload failed: {resp.status} {data}')
+    data['client'] = dict(stats, wire_bytes=wire, seconds=round(time.perf_counter() - started, 3))
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('url', help='server base URL, e.g. http://192.168.1.10:5000')
+    parser.add_argument('basis', help='name of the older version on the server (as listed by /files)')
+    parser.add_argument('path', help='local file to upload')
+    parser.add_argument('--filename', help='name for the new version (default: the local file name)')
+    parser.add_argument('--pin', help='PIN to protect the new version with')
+    parser.add_argument('--basis-pin', help="PIN of the basis file, if it has one")
+    parser.add_argument('--ttl', type=int, help='expire the new version after this many seconds')
+    parser.add_argument('--block-size', type=int, help='signature block size (default: chosen by the server)')
+    args = parser.parse_args(argv)
+    try:
+        result = upload_delta(args.url.rstrip('/'), args.basis, args.path, args.filename, args.pin,
+                              args.basis_pin, args.ttl, args.block_size)
+    except (OSError, RuntimeError) as e:
+        print(f'error: {e}', file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
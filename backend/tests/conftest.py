@@ -0,0 +1,54 @@
+"""Shared fixtures: every test gets a fresh app (TESTING) over its own uploads folder."""
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import app as wifix  # noqa: E402
+
+
+@pytest.fixture()
+def make_app(tmp_path):
+    """create_app() for this test's uploads folder; keyword arguments override app.config.
+
+    Module settings read from the environment (QUOTA_BYTES, FILE_TTL_SECONDS, ...) can be
+    monkeypatched on ``app`` before calling it.
+    """
+    def make(**config):
+        return wifix.create_app({'TESTING': True, 'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                                 'RATELIMIT_ENABLED': False, **config})
+    yield make
+    wifix._close_state()
+
+
+@pytest.fixture()
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture()
+def upload(client):
+    """Upload ``body`` through POST /upload and return the saved file name."""
+    def upload(body: bytes, name: str = 'file.bin', **form):
+        resp = client.post('/upload', data={'file': (io.BytesIO(body), name), **form},
+                           content_type='multipart/form-data')
+        assert resp.status_code == 201, resp.get_json()
+        return resp.get_json()['filename']
+    return upload
+
+
+@pytest.fixture()
+def socket_client(app, client):
+    """Socket.IO test client sharing ``client``'s session cookie."""
+    sc = wifix.socketio.test_client(app, flask_test_client=client)
+    yield sc
+    if sc.is_connected():
+        sc.disconnect()
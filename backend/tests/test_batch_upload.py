@@ -0,0 +1,27 @@
+"""Batch uploads write parts through WifixRequest.file_stream_factory, not Werkzeug temp files."""
+import hashlib
+import io
+import os
+
+import app as wifix
+
+
+def test_multipart_batch_is_streamed_into_batch_parts(client, monkeypatch):
+    created = []
+    real = wifix.BatchPart
+
+    def tracking(*args):
+        part = real(*args)
+        created.append(part)
+        return part
+
+    monkeypatch.setattr(wifix, 'BatchPart', tracking)
+    files = {f'b{i}.txt': os.urandom(2_500_000 if i == 0 else 100 + i) for i in range(5)}
+    resp = client.post(
+        '/upload/batch', content_type='multipart/form-data',
+        data={'files': [(io.BytesIO(body), name) for name, body in files.items()]})
+    assert resp.status_code == 201
+    manifest = resp.get_json()['files']
+    assert sorted(p.original for p in created) == sorted(files)
+    assert {f['original']: f['sha256'] for f in manifest} == {
+        name: hashlib.sha256(body).hexdigest() for name, body in files.items()}
@@ -0,0 +1,49 @@
+"""/download/bulk: streamed ZIP and TAR archives that respect per-file PINs."""
+import io
+import tarfile
+import zipfile
+
+import app as wifix
+
+
+def test_zip_of_named_files(client, upload):
+    a, b = upload(b'a' * 5000, name='a.txt'), upload(b'b' * 70000, name='b.txt')
+    resp = client.post('/download/bulk', json={'filenames': [a, b, a]})
+    assert resp.status_code == 200 and resp.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+        assert zf.namelist() == [a, b]
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+        assert zf.read(b) == b'b' * 70000
+    assert list(wifix.PARTIAL_FOLDER.iterdir()) == []
+
+
+def test_tar_has_an_exact_content_length(client, upload):
+    a, b = upload(b'a' * 513, name='a.txt'), upload(b'b', name='b.txt')
+    resp = client.get(f'/download/bulk?format=tar&name={a}&name={b}')
+    assert resp.content_length == len(resp.data)
+    with tarfile.open(fileobj=io.BytesIO(resp.data)) as tf:
+        assert tf.getnames() == [a, b]
+        assert tf.extractfile(a).read() == b'a' * 513
+
+
+def test_pin_protected_files(client, upload):
+    open_name, locked = upload(b'open', name='open.txt'), upload(b'secret', name='s.txt', pin='4321')
+    resp = client.post('/download/bulk', json={'filenames': [open_name, locked]})
+    assert resp.status_code == 403 and resp.get_json()['locked'] == [locked]
+    resp = client.post('/download/bulk', json={'filenames': [open_name, locked], 'pins': {locked: '4321'}})
+    assert resp.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(resp.data)).read(locked) == b'secret'
+
+
+def test_since_skips_locked_files(client, upload):
+    open_name = upload(b'open', name='open.txt')
+    upload(b'secret', name='s.txt', pin='4321')
+    resp = client.get('/download/bulk?since=0')
+    assert resp.headers['X-Skipped-Locked'] == '1'
+    assert zipfile.ZipFile(io.BytesIO(resp.data)).namelist() == [open_name]
+
+
+def test_bad_requests(client, upload):
+    assert client.post('/download/bulk', json={}).status_code == 400
+    assert client.post('/download/bulk', json={'filenames': ['nope.txt']}).status_code == 404
+    assert client.post('/download/bulk', json={'filenames': [upload(b'x')], 'format': 'rar'}).status_code == 400
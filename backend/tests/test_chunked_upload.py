@@ -0,0 +1,63 @@
+"""Resumable uploads: out-of-order chunks, resume after a restart, and chunk PUTs racing finalize."""
+import os
+
+import app as wifix
+
+
+def _start(client, size):
+    resp = client.post('/upload/chunked', json={'filename': 'chunked.bin', 'size': size})
+    assert resp.status_code == 201
+    return resp.get_json()['upload_id']
+
+
+def test_chunked_round_trip(client):
+    upload_id = _start(client, 8)
+    assert client.put(f'/upload/chunked/{upload_id}?offset=4', data=b'5678').status_code == 200
+    assert client.post(f'/upload/chunked/{upload_id}/finalize').status_code == 409
+    assert client.put(f'/upload/chunked/{upload_id}?offset=0', data=b'1234').status_code == 200
+    resp = client.post(f'/upload/chunked/{upload_id}/finalize')
+    assert resp.status_code == 201
+    assert client.get('/download/' + resp.get_json()['filename']).data == b'12345678'
+
+
+def test_status_survives_restart(make_app):
+    client = make_app().test_client()
+    upload_id = _start(client, 8)
+    assert client.put(f'/upload/chunked/{upload_id}?offset=0', data=b'1234').status_code == 200
+
+    client = make_app().test_client()  # same uploads folder: the partial upload is picked up again
+    status = client.get(f'/upload/chunked/{upload_id}').get_json()
+    assert status['ranges'] == [[0, 4]] and status['next_offset'] == 4
+    assert client.put(f'/upload/chunked/{upload_id}?offset=4', data=b'5678').status_code == 200
+    resp = client.post(f'/upload/chunked/{upload_id}/finalize')
+    assert client.get('/download/' + resp.get_json()['filename']).data == b'12345678'
+
+
+def test_chunk_outside_file_is_refused_and_abort_discards(client):
+    upload_id = _start(client, 4)
+    assert client.put(f'/upload/chunked/{upload_id}?offset=2', data=b'abcd').status_code == 416
+    up = wifix.CHUNKED_UPLOADS[upload_id]
+    assert client.delete(f'/upload/chunked/{upload_id}').status_code == 200
+    assert not os.path.exists(up.data_path)
+    assert client.get(f'/upload/chunked/{upload_id}').status_code == 404
+
+
+def test_finalize_waits_for_in_flight_chunks(client, monkeypatch):
+    upload_id = _start(client, 4)
+    assert client.put(f'/upload/chunked/{upload_id}?offset=0', data=b'abcd').status_code == 200
+    up = wifix.CHUNKED_UPLOADS[upload_id]
+    assert up.begin_write()  # a chunk PUT still streaming its body
+    monkeypatch.setattr(wifix, 'CHUNK_FINALIZE_WAIT_SECONDS', 0.05)
+    assert client.post(f'/upload/chunked/{upload_id}/finalize').status_code == 409
+    assert os.path.exists(up.data_path)
+    up.end_write(0, 0)
+    assert client.post(f'/upload/chunked/{upload_id}/finalize').status_code == 201
+
+
+def test_chunk_rejected_once_finalizing(client):
+    upload_id = _start(client, 4)
+    up = wifix.CHUNKED_UPLOADS[upload_id]
+    assert up.close(0)
+    assert client.put(f'/upload/chunked/{upload_id}?offset=0', data=b'abcd').status_code == 409
+    up.reopen()
+    assert client.put(f'/upload/chunked/{upload_id}?offset=0', data=b'abcd').status_code == 200
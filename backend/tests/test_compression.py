@@ -0,0 +1,48 @@
+"""Compressed-variant cache: size accounting and variants vanishing under a request."""
+import gzip
+
+import app as wifix
+
+
+def test_refilling_a_variant_counts_it_once(tmp_path):
+    cache = wifix.CompressionCache(tmp_path, 1 << 20)
+    variant = tmp_path / 'v.gzip'
+    variant.write_bytes(b'x' * 100)
+    cache._add(variant, 100)
+    cache._add(variant, 100)
+    assert cache.stats()['bytes'] == 100
+
+
+def test_evicted_variant_falls_back_to_streaming(client, upload):
+    if not wifix.COMPRESSION_ENABLED:
+        return
+    body = b'timestamp,level,message\n' * 20000
+    url = '/download/' + upload(body, 'log.csv')
+    for _ in range(2):  # the second compressed download fills the cache
+        assert gzip.decompress(client.get(url, headers={'Accept-Encoding': 'gzip'}).data) == body
+    variants = list(wifix.COMPRESSION._variants)
+    assert variants
+    for p in variants:
+        p.unlink()
+    resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert gzip.decompress(resp.data) == body
+
+
+def test_head_requests_do_not_warm_the_cache(client, upload):
+    if not wifix.COMPRESSION_ENABLED:
+        return
+    body = b'timestamp,level,message\n' * 20000
+    url = '/download/' + upload(body, 'log.csv')
+    gz = {'Accept-Encoding': 'gzip'}
+    for _ in range(3):
+        resp = client.head(url, headers=gz)
+        assert resp.status_code == 200 and resp.headers['Content-Encoding'] == 'gzip'
+    assert wifix.COMPRESSION.stats()['variants'] == 0
+    assert gzip.decompress(client.get(url, headers=gz).data) == body
+    assert wifix.COMPRESSION.stats()['variants'] == 0  # the first GET only streams
+    assert gzip.decompress(client.get(url, headers=gz).data) == body
+    stats = wifix.COMPRESSION.stats()
+    assert stats['variants'] == 1 and stats['served_streamed'] == 2
+    assert client.head(url, headers=gz).status_code == 200
+    assert wifix.COMPRESSION.stats()['served_cached'] == 0
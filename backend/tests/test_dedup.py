@@ -0,0 +1,51 @@
+"""Content-addressed storage (ENABLE_DEDUP=1): identical uploads share one blob until the last delete."""
+import hashlib
+
+import pytest
+
+import app as wifix
+
+
+@pytest.fixture()
+def app(make_app, monkeypatch):
+    monkeypatch.setattr(wifix, 'DEDUP_ENABLED', True)
+    return make_app()
+
+
+def _blobs():
+    return sorted(p.name for p in wifix.BLOBS.folder.iterdir())
+
+
+def test_identical_uploads_share_a_blob(client):
+    body = b'installer' * 1000
+    digest = hashlib.sha256(body).hexdigest()
+    first = client.post('/upload/stream?filename=a.bin', data=body).get_json()
+    second = client.post('/upload/stream?filename=b.bin', data=body).get_json()
+    assert (first['deduplicated'], second['deduplicated']) == (False, True)
+    assert _blobs() == [digest]
+    assert (wifix.UPLOAD_FOLDER / second['filename']).stat().st_nlink == 3
+
+    assert client.delete('/delete/' + first['filename']).status_code == 200
+    assert _blobs() == [digest]
+    assert client.get('/download/' + second['filename']).data == body
+    assert client.delete('/delete/' + second['filename']).status_code == 200
+    assert _blobs() == []
+
+
+def test_upload_by_digest_skips_the_bytes(client):
+    body = b'dataset' * 1000
+    digest = hashlib.sha256(body).hexdigest()
+    assert client.post('/upload/digest', json={'sha256': digest, 'filename': 'd.bin'}).status_code == 404
+    client.post('/upload/stream?filename=d.bin', data=body)
+    resp = client.post('/upload/digest', json={'sha256': digest, 'filename': 'copy.bin'})
+    assert resp.status_code == 201 and resp.get_json()['deduplicated'] is True
+    assert client.get('/download/' + resp.get_json()['filename']).data == body
+    assert client.post('/upload/digest', json={'sha256': 'xyz', 'filename': 'd.bin'}).status_code == 400
+
+
+def test_unreferenced_blobs_are_dropped_at_startup(make_app, client):
+    name = client.post('/upload/stream?filename=a.bin', data=b'abc').get_json()['filename']
+    wifix._close_state()
+    (wifix.UPLOAD_FOLDER / name).unlink()  # removed behind the app's back
+    make_app()
+    assert _blobs() == []
@@ -0,0 +1,69 @@
+"""Delta uploads: block signatures of a stored file, and new versions rebuilt from it plus the changes."""
+import base64
+import hashlib
+import io
+import random
+import struct
+
+import pytest
+
+import app as wifix
+import delta_sync
+
+
+def _signature(client, name, **params):
+    data = client.get(f'/upload/delta/{name}/signature', query_string=params).get_json()
+    weak = base64.b64decode(data['weak'])
+    data['weak'] = struct.unpack(f'>{len(weak) // 4}I', weak)
+    strong = base64.b64decode(data['strong'])
+    data['strong'] = [strong[i:i + delta_sync.STRONG_BYTES] for i in range(0, len(strong), delta_sync.STRONG_BYTES)]
+    return data
+
+
+@pytest.fixture()
+def versions(tmp_path):
+    rng = random.Random(25)
+    old = rng.randbytes(300_000)
+    new = old[:100_000] + b'inserted bytes' + old[100_000:250_000] + old[260_000:]
+    (tmp_path / 'new.img').write_bytes(new)
+    return old, new, tmp_path / 'new.img'
+
+
+def test_new_version_is_rebuilt_from_the_basis(client, upload, versions):
+    old, new, path = versions
+    basis = upload(old, name='disk.img')
+    sig = _signature(client, basis, block_size=4096)
+    delta = io.BytesIO()
+    stats, sha256 = delta_sync.make_delta(path, sig, delta)
+    resp = client.post(f'/upload/delta/{basis}', data=delta.getvalue(),
+                       query_string={'size': len(new), 'version': sig['version'], 'sha256': sha256})
+    assert resp.status_code == 201, resp.get_json()
+    body = resp.get_json()
+    assert body['sha256'] == hashlib.sha256(new).hexdigest()
+    assert body['delta']['copied_bytes'] == stats['copied_bytes'] > 0.9 * len(new)
+    assert body['delta']['wire_bytes'] < len(new) // 10
+    assert client.get('/download/' + body['filename']).data == new
+    assert (wifix.UPLOAD_FOLDER / basis).read_bytes() == old
+
+
+def test_changed_basis_is_refused(client, upload):
+    basis = upload(b'x' * 100, name='disk.img')
+    resp = client.post(f'/upload/delta/{basis}', data=delta_sync.OP_END,
+                       query_string={'size': 0, 'version': 'stale'})
+    assert resp.status_code == 409
+
+
+def test_invalid_delta_leaves_nothing_behind(client, upload):
+    basis = upload(b'x' * 100, name='disk.img')
+    outside = delta_sync.OP_COPY + struct.pack('>QQ', 50, 100) + delta_sync.OP_END
+    assert client.post(f'/upload/delta/{basis}?size=100', data=outside).status_code == 400
+    short = delta_sync.OP_LITERAL + struct.pack('>I', 10) + b'abc'
+    assert client.post(f'/upload/delta/{basis}?size=10', data=short).status_code == 400
+    assert [p.name for p in wifix.UPLOAD_FOLDER.iterdir() if not p.name.startswith('.')] == [basis]
+    assert list(wifix.PARTIAL_FOLDER.iterdir()) == []
+    assert wifix.QUOTA.usage()['reserved_bytes'] == 0
+
+
+def test_signature_validates_the_block_size(client, upload):
+    basis = upload(b'x' * 100, name='disk.img')
+    assert client.get(f'/upload/delta/{basis}/signature?block_size=1').status_code == 400
@@ -0,0 +1,58 @@
+"""TTL expiry: a deadline heap drained in batches, with per-file TTLs that survive restarts."""
+import json
+import time
+
+import app as wifix
+from core.expiry import ExpiryScheduler
+
+
+def _scheduler(tmp_path, default_ttl=0):
+    removed, batches = [], []
+    expiry = ExpiryScheduler(default_ttl, tmp_path / 'expiry.json', removed.append, batches.append)
+    return expiry, removed, batches
+
+
+def test_due_deadlines_expire_in_one_batch(tmp_path):
+    expiry, removed, batches = _scheduler(tmp_path, default_ttl=60)
+    now = time.time()
+    expiry.load([{'filename': 'old', 'mtime': now - 120}, {'filename': 'older', 'mtime': now - 121},
+                 {'filename': 'fresh', 'mtime': now}])
+    expiry.run_once()
+    assert removed == ['older', 'old'] and batches == [['older', 'old']]
+    stats = expiry.stats()
+    assert stats['queued'] == 1 and stats['expired_total'] == 2 and stats['lateness_max_seconds'] >= 59
+
+
+def test_cancelled_and_rescheduled_entries_are_skipped(tmp_path):
+    expiry, removed, _ = _scheduler(tmp_path)
+    expiry.schedule('gone', time.time() - 5)
+    expiry.schedule('moved', time.time() - 5)
+    expiry.schedule('due', time.time() - 1)
+    expiry.cancel('gone')
+    expiry.schedule('moved', time.time() + 3600)
+    expiry.run_once()
+    assert removed == ['due']
+    assert expiry.deadline('moved') > time.time()
+
+
+def test_per_file_ttl_from_upload(upload, socket_client):
+    name = upload(b'x', ttl='3600')
+    deadline = wifix.EXPIRY.deadline(name)
+    assert 3590 < deadline - time.time() <= 3600
+    assert json.loads((wifix.META_FOLDER / 'expiry.json').read_text()) == {name: deadline}
+
+    wifix.EXPIRY.schedule(name, time.time() - 1, persist=True)
+    socket_client.get_received()
+    wifix.EXPIRY.run_once()
+    assert not (wifix.UPLOAD_FOLDER / name).exists()
+    assert name not in [f['filename'] for f in wifix.FILE_INDEX.page()[0]]
+    (event,) = [e for e in socket_client.get_received() if e['name'] == 'files_deleted']
+    assert event['args'][0] == {'filenames': [name], 'reason': 'expired'}
+
+
+def test_per_file_ttl_survives_a_restart(make_app, upload):
+    name = upload(b'x', ttl='3600')
+    deadline = wifix.EXPIRY.deadline(name)
+    wifix._close_state()
+    make_app()
+    assert wifix.EXPIRY.deadline(name) == deadline
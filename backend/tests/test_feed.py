@@ -0,0 +1,29 @@
+"""File change feed: one coalesced ``files_changed`` per batch, deletions included."""
+import app as wifix
+
+
+def _events(socket_client):
+    return [(e['name'], e['args'][0]) for e in socket_client.get_received()]
+
+
+def test_delete_is_broadcast_once_through_the_feed(client, upload, socket_client):
+    socket_client.emit('subscribe_files', {})
+    assert [name for name, _ in _events(socket_client)] == ['files_snapshot']
+    name = upload(b'hello')
+    wifix.FEED.flush()
+    _events(socket_client)
+
+    assert client.delete('/delete/' + name).status_code == 200
+    wifix.FEED.flush()
+    events = _events(socket_client)
+    assert [event for event, _ in events] == ['files_changed']
+    assert events[0][1]['deletes'] == [name] and events[0][1]['upserts'] == []
+
+
+def test_reconnect_catches_up_from_the_replay_log(upload, socket_client):
+    socket_client.emit('subscribe_files', {})
+    snapshot = _events(socket_client)[0][1]
+    first, second = upload(b'a', name='a.txt'), upload(b'b', name='b.txt')
+    socket_client.emit('subscribe_files', {'since': snapshot['seq'], 'epoch': snapshot['epoch']})
+    (delta,) = [payload for event, payload in _events(socket_client) if event == 'files_changed']
+    assert [f['filename'] for f in delta['upserts']] == [first, second]
@@ -0,0 +1,37 @@
+"""Per-file PINs must hold however the file name is spelled in the URL."""
+import pytest
+
+import app as wifix
+
+PIN = '4321'
+
+
+@pytest.fixture()
+def protected(upload):
+    return upload(b'secret', 'secret.txt', pin=PIN)
+
+
+@pytest.mark.parametrize('spelling', ['{}', './{}', 'x/../{}'])
+def test_download_requires_pin(client, protected, spelling):
+    url = '/download/' + spelling.format(protected)
+    assert client.get(url).status_code == 403
+    resp = client.get(url, query_string={'pin': PIN})
+    assert resp.status_code == 200
+    assert resp.data == b'secret'
+
+
+@pytest.mark.parametrize('spelling', ['./{}', 'x/../{}'])
+def test_delta_signature_requires_pin(client, protected, spelling):
+    assert client.get(f'/upload/delta/{spelling.format(protected)}/signature').status_code == 403
+
+
+@pytest.mark.parametrize('spelling', ['./{}', 'x/../{}'])
+def test_bulk_download_requires_pin(client, protected, spelling):
+    resp = client.post('/download/bulk', json={'filenames': [spelling.format(protected)]})
+    assert resp.status_code == 403
+
+
+@pytest.mark.parametrize('spelling', ['./{}', 'x/../{}'])
+def test_delete_drops_pin(client, protected, spelling):
+    assert client.delete('/delete/' + spelling.format(protected)).status_code == 200
+    assert protected not in wifix.FILE_PINS
@@ -0,0 +1,40 @@
+"""Disk I/O helpers shared by every engine: run_io offloading, copy_stream and iter_file."""
+import hashlib
+import io
+import threading
+import warnings
+
+import pytest
+
+from core import fileio
+
+
+def test_run_io_counts_inflight_work():
+    seen = []
+    assert fileio.run_io(lambda: seen.append(fileio.io_inflight()) or 'done') == 'done'
+    assert seen == [1] and fileio.io_inflight() == 0
+
+
+def test_run_io_uses_the_eventlet_thread_pool(monkeypatch):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        pytest.importorskip('eventlet')
+    monkeypatch.setattr(fileio, 'ASYNC_MODE', 'eventlet')
+    assert fileio.run_io(threading.get_ident) != threading.get_ident()
+
+
+def test_copy_stream_hashes_what_it_writes(monkeypatch):
+    monkeypatch.setattr(fileio, 'STREAM_BUFFER_SIZE', 7)
+    body = bytes(range(100))
+    out, hasher = io.BytesIO(), hashlib.sha256()
+    assert fileio.copy_stream(io.BytesIO(body), out, 64, hasher) == 64
+    assert out.getvalue() == body[:64] and hasher.hexdigest() == hashlib.sha256(body[:64]).hexdigest()
+    assert fileio.copy_stream(io.BytesIO(body), io.BytesIO()) == 100
+
+
+def test_iter_file_reads_a_range(tmp_path):
+    path = tmp_path / 'f'
+    path.write_bytes(bytes(range(256)) * 10)
+    chunks = list(fileio.iter_file(path, 10, 1000, buffer_size=300))
+    assert [len(c) for c in chunks] == [300, 300, 300, 100]
+    assert b''.join(chunks) == path.read_bytes()[10:1010]
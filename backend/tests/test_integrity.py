@@ -0,0 +1,40 @@
+"""Integrity: SHA-256 computed while writing, listed, served as Repr-Digest and checked against the client's."""
+import base64
+import hashlib
+import io
+
+import app as wifix
+
+BODY = b'firmware image ' * 5000
+HEX = hashlib.sha256(BODY).hexdigest()
+B64 = base64.b64encode(hashlib.sha256(BODY).digest()).decode()
+
+
+def test_digest_is_returned_listed_and_served(client):
+    resp = client.post('/upload', data={'file': (io.BytesIO(BODY), 'fw.bin')}, content_type='multipart/form-data')
+    name = resp.get_json()['filename']
+    assert resp.get_json()['sha256'] == HEX
+    assert [f['sha256'] for f in client.get('/files').get_json()] == [HEX]
+    download = client.get('/download/' + name)
+    assert download.headers['Repr-Digest'] == f'sha-256=:{B64}:'
+    assert download.headers['Digest'] == f'SHA-256={B64}'
+    # a range carries the digest of the whole representation
+    assert client.get('/download/' + name, headers={'Range': 'bytes=0-9'}).headers['Repr-Digest'] == f'sha-256=:{B64}:'
+
+
+def test_client_digest_is_verified(client):
+    form = {'file': (io.BytesIO(BODY), 'fw.bin'), 'sha256': HEX}
+    assert client.post('/upload', data=form, content_type='multipart/form-data').status_code == 201
+    resp = client.post('/upload/stream?filename=fw.bin', data=BODY + b'!', headers={'Repr-Digest': f'sha-256=:{B64}:'})
+    assert resp.status_code == 400
+    assert resp.get_json() == {'error': 'checksum mismatch', 'expected': HEX,
+                               'sha256': hashlib.sha256(BODY + b'!').hexdigest()}
+    assert client.post('/upload/stream?filename=fw.bin', data=BODY, headers={'Digest': f'SHA-256={B64}'}).status_code == 201
+    assert client.post('/upload/stream?filename=fw.bin&sha256=nothex', data=BODY).status_code == 400
+
+
+def test_digests_are_kept_across_restarts(make_app, upload):
+    name = upload(BODY, name='fw.bin')
+    wifix._close_state()
+    make_app()
+    assert wifix.FILE_INDEX.get(name)['sha256'] == HEX
@@ -0,0 +1,47 @@
+"""GET /files: ETags per listing, pagination cursors and ``since``."""
+import os
+
+import app as wifix
+
+
+def _touch(tmp_path, name, mtime):
+    path = tmp_path / 'uploads' / name
+    path.write_bytes(b'x')
+    os.utime(path, (mtime, mtime))
+
+
+def test_pages_follow_the_cursor(client, tmp_path):
+    for i in range(5):
+        _touch(tmp_path, f'f{i}.txt', 1000 + i)
+    wifix.FILE_INDEX.reconcile(force=True)
+    first = client.get('/files?limit=2')
+    assert [f['filename'] for f in first.get_json()] == ['f4.txt', 'f3.txt']
+    second = client.get('/files?limit=2&cursor=' + first.headers['X-Next-Cursor'])
+    assert [f['filename'] for f in second.get_json()] == ['f2.txt', 'f1.txt']
+    assert [f['filename'] for f in client.get('/files?since=1002').get_json()] == ['f4.txt', 'f3.txt']
+
+
+def test_etag_depends_on_the_listing_parameters(client, upload):
+    upload(b'a', name='a.txt')
+    upload(b'b', name='b.txt')
+    full = client.get('/files')
+    page = client.get('/files?limit=1')
+    assert full.headers['ETag'] != page.headers['ETag']
+    # a tag from one page must not validate another view of the same index
+    assert client.get('/files', headers={'If-None-Match': page.headers['ETag']}).status_code == 200
+    assert client.get('/files?limit=1', headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+    assert client.get('/files?since=0', headers={'If-None-Match': client.get('/files?since=0.0').headers['ETag']}
+                      ).status_code == 304
+
+
+def test_etag_changes_with_the_index(client, upload):
+    upload(b'a')
+    etag = client.get('/files').headers['ETag']
+    assert client.get('/files', headers={'If-None-Match': etag}).status_code == 304
+    upload(b'b')
+    assert client.get('/files', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_bad_parameters_are_rejected(client):
+    assert client.get('/files?limit=0').status_code == 400
+    assert client.get('/files?cursor=***').status_code == 400
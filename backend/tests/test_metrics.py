@@ -0,0 +1,32 @@
+"""/metrics: per-endpoint request counters and gauges read at scrape time."""
+import re
+
+import app as wifix
+
+
+def _sample(text, name, labels=''):
+    match = re.search(rf'^{re.escape(name + labels)} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_requests_are_counted_per_endpoint(client):
+    labels = '{endpoint="stats",method="GET",status="200"}'
+    before = _sample(client.get('/metrics').get_data(as_text=True), 'wifix_http_requests_total', labels)
+    client.get('/stats')
+    client.get('/stats')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert _sample(text, 'wifix_http_requests_total', labels) == before + 2
+    assert 'wifix_http_request_duration_seconds_bucket{endpoint="stats",method="GET",le="+Inf"}' in text
+
+
+def test_active_transfers_gauge(client, upload):
+    name = upload(b'x' * 4096)
+    resp = client.get('/download/' + name, buffered=False)
+    assert _sample(client.get('/metrics').get_data(as_text=True), 'wifix_active_transfers') == 1
+    resp.close()
+    assert _sample(client.get('/metrics').get_data(as_text=True), 'wifix_active_transfers') == 0
+
+
+def test_metrics_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(wifix, 'ENABLE_METRICS', False)
+    assert client.get('/metrics').status_code == 404
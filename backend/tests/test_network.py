@@ -0,0 +1,56 @@
+"""LAN address discovery: enumerated once, cached, and served by /info without syscalls."""
+import socket
+
+import app as wifix
+from core.network import NetworkInfo
+
+
+def _network(monkeypatch, routed, interfaces, include_ipv6=True):
+    net = NetworkInfo(include_ipv6)
+    monkeypatch.setattr(net, '_route_address', lambda family, probe: routed.get(family))
+    monkeypatch.setattr(net, '_interface_addresses', lambda: set(interfaces))
+    return net
+
+
+def test_primary_first_and_unusable_addresses_dropped(monkeypatch):
+    net = _network(monkeypatch, {socket.AF_INET: '192.168.1.20'},
+                   {'127.0.0.1', '10.0.0.5', '192.168.1.20', 'fe80::1', 'fd00::5', '::1'})
+    assert net.refresh()
+    assert net.addresses == ['192.168.1.20', '10.0.0.5', 'fd00::5']
+    assert net.urls(5000) == ['http://192.168.1.20:5000/', 'http://10.0.0.5:5000/', 'http://[fd00::5]:5000/']
+
+
+def test_ipv6_only_when_asked_for(monkeypatch):
+    net = _network(monkeypatch, {}, {'10.0.0.5', 'fd00::5'}, include_ipv6=False)
+    net.refresh()
+    assert net.addresses == ['10.0.0.5']
+
+
+def test_listeners_hear_only_changes(monkeypatch):
+    interfaces = {'10.0.0.5'}
+    net = _network(monkeypatch, {}, interfaces)
+    heard = []
+    net.listeners.append(heard.append)
+    net.refresh()
+    assert not net.refresh()
+    interfaces.add('10.0.0.6')
+    assert net.refresh()
+    assert heard == [['10.0.0.5'], ['10.0.0.5', '10.0.0.6']]
+
+
+def test_no_route_falls_back_to_loopback(monkeypatch):
+    net = _network(monkeypatch, {}, {'127.0.0.1'})
+    net.refresh()
+    assert net.primary == '127.0.0.1' and net.urls() == ['http://127.0.0.1/']
+
+
+def test_info_serves_the_cached_addresses(client, monkeypatch):
+    monkeypatch.setattr(wifix.NETWORK, 'addresses', ['192.168.1.20', '10.0.0.5'])
+    monkeypatch.setattr(wifix.NETWORK, 'primary', '192.168.1.20')
+
+    def no_sockets(*args, **kwargs):
+        raise AssertionError('socket opened on the request path')
+    monkeypatch.setattr(socket, 'socket', no_sockets)
+    body = client.get('/info', base_url='http://localhost:8080').get_json()
+    assert body['lan_urls'] == ['http://192.168.1.20:8080/', 'http://10.0.0.5:8080/']
+    assert body['lan_url'] == 'http://192.168.1.20:8080/' and body['lan_ip'] == '192.168.1.20'
@@ -0,0 +1,66 @@
+"""Previews: queued after upload, built off the request path, served with long-lived caching."""
+import io
+import time
+
+import pytest
+
+import app as wifix
+
+
+def _build_all():
+    while wifix.PREVIEWS.dispatch():
+        pass
+    deadline = time.time() + 10
+    while wifix.PREVIEWS.stats()['running'] and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_text_snippet(client, upload):
+    name = upload(b'line one\nline two\n', name='notes.txt')
+    assert client.get('/preview/' + name).status_code == 202
+    _build_all()
+    resp = client.get('/preview/' + name)
+    assert resp.status_code == 200
+    assert resp.get_json()['snippet'] == 'line one\nline two'
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert client.get('/preview/' + name, headers={'If-None-Match': resp.headers['ETag']}).status_code == 304
+
+
+def test_image_thumbnail(client, upload):
+    image = pytest.importorskip('PIL.Image')
+    buf = io.BytesIO()
+    image.new('RGB', (1200, 600), 'red').save(buf, format='PNG')
+    name = upload(buf.getvalue(), name='photo.png')
+    _build_all()
+    meta = client.get('/preview/' + name).get_json()
+    assert (meta['kind'], meta['width'], meta['height']) == ('image', 1200, 600)
+    thumb = client.get(meta['thumbnail_url'])
+    assert thumb.mimetype == 'image/jpeg'
+    assert image.open(io.BytesIO(thumb.data)).size == (320, 160)
+
+
+def test_delete_drops_pending_work_and_sidecars(client, upload):
+    queued = upload(b'queued', name='a.txt')
+    built = upload(b'built', name='b.txt')
+    wifix.PREVIEWS.cancel(queued)
+    _build_all()
+    sidecar = wifix.PREVIEWS.sidecar(built)
+    assert sidecar.with_suffix('.json').exists()
+    wifix.PREVIEWS.enqueue(queued)
+    client.delete('/delete/' + queued)
+    client.delete('/delete/' + built)
+    assert wifix.PREVIEWS.stats()['queued'] == 0
+    assert not sidecar.with_suffix('.json').exists()
+
+
+def test_queue_is_bounded(make_app, upload, monkeypatch):
+    monkeypatch.setattr(wifix, 'PREVIEW_QUEUE_SIZE', 1)
+    make_app()
+    for i in range(3):
+        upload(b'x', name=f'{i}.txt')  # uploads succeed even when preview jobs are dropped
+    assert wifix.PREVIEWS.stats()['dropped'] == 2
+
+
+def test_files_without_a_preview(client, upload):
+    assert client.get('/preview/' + upload(b'\0\1', name='blob.bin')).status_code == 404
+    assert client.get('/preview/missing.txt').status_code == 404
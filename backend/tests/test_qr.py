@@ -0,0 +1,33 @@
+"""/qr: rendered images come from a bounded LRU and carry validators."""
+import pytest
+
+from core.qrcodes import QRCodeCache
+
+pytest.importorskip('qrcode')
+
+
+def test_cache_is_bounded_and_pinned_entries_stay(monkeypatch):
+    renders = []
+    monkeypatch.setattr(QRCodeCache, 'render', staticmethod(lambda url, size, fmt: renders.append(url) or url.encode()))
+    cache = QRCodeCache(2)
+    cache.get('http://lan/', 10, 'svg', pin=True)
+    for i in range(5):
+        cache.get(f'http://x/{i}', 10, 'svg')
+    assert cache.get('http://lan/', 10, 'svg')[0] == b'http://lan/'
+    cache.get('http://x/4', 10, 'svg')
+    assert renders == ['http://lan/'] + [f'http://x/{i}' for i in range(5)]
+    stats = cache.stats()
+    assert (stats['cached'], stats['pinned'], stats['hits'], stats['misses']) == (2, 1, 2, 6)
+
+
+def test_svg_with_etag_and_304(client):
+    resp = client.get('/qr?url=http://192.168.1.5:5000/&format=svg')
+    assert resp.status_code == 200 and resp.mimetype == 'image/svg+xml'
+    assert b'<svg' in resp.data and 'max-age' in resp.headers['Cache-Control']
+    again = client.get('/qr?url=http://192.168.1.5:5000/&format=svg', headers={'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('query', ['format=gif', 'size=0', 'size=x', 'url=http://' + 'a' * 3000])
+def test_invalid_parameters(client, query):
+    assert client.get('/qr?' + query).status_code == 400
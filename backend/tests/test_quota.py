@@ -0,0 +1,49 @@
+"""Storage quota: reservations before writing, least-recently-downloaded eviction, exemptions."""
+import pytest
+
+import app as wifix
+
+
+@pytest.fixture()
+def app(make_app, monkeypatch):
+    monkeypatch.setattr(wifix, 'QUOTA_BYTES', 3000)
+    monkeypatch.setattr(wifix, 'QUOTA_MIN_FREE_BYTES', 0)
+    return make_app()
+
+
+def _put(client, name, size, **params):
+    return client.post('/upload/stream', query_string={'filename': name, **params}, data=b'x' * size)
+
+
+def _names():
+    return sorted(e['filename'].split('_', 1)[1] for e in wifix.FILE_INDEX.page()[0])
+
+
+def test_least_recently_downloaded_file_is_evicted(client, socket_client):
+    a = _put(client, 'a.bin', 1000).get_json()['filename']
+    _put(client, 'b.bin', 1000)
+    client.get('/download/' + a).close()  # a is now more recent than b
+    socket_client.get_received()
+    assert _put(client, 'c.bin', 1500).status_code == 201
+    assert _names() == ['a.bin', 'c.bin']
+    (event,) = [e for e in socket_client.get_received() if e['name'] == 'files_deleted']
+    assert event['args'][0]['reason'] == 'evicted'
+    assert client.get('/info').get_json()['storage']['used_bytes'] == 2500
+
+
+def test_pinned_and_kept_files_are_exempt(client, socket_client):
+    _put(client, 'locked.bin', 1000, pin='1234')
+    kept = _put(client, 'kept.bin', 1000).get_json()['filename']
+    socket_client.emit('become_host', {})
+    socket_client.emit('keep_file', {'filename': kept})
+    resp = _put(client, 'big.bin', 1500)
+    assert resp.status_code == 507
+    assert resp.get_json()['quota']['evictable_files'] == 0
+    assert _names() == ['kept.bin', 'locked.bin']
+    assert wifix.QUOTA.usage()['reserved_bytes'] == 0
+
+
+def test_upload_larger_than_the_quota_is_refused_without_evicting(client):
+    _put(client, 'a.bin', 1000)
+    assert _put(client, 'huge.bin', 4000).status_code == 507
+    assert _names() == ['a.bin']
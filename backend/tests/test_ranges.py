@@ -0,0 +1,26 @@
+"""Range requests: merging, the full-file shortcut and the range cap."""
+import os
+
+from core.httputil import MAX_RANGES, parse_ranges
+
+
+def test_overlapping_and_adjacent_ranges_are_merged():
+    assert parse_ranges('bytes=50-59,0-9,5-19,20-29', 100) == [(0, 30), (50, 60)]
+
+
+def test_ranges_covering_the_file_mean_full_body():
+    assert parse_ranges('bytes=0-,0-,0-', 100) is None
+    assert parse_ranges('bytes=0-49,50-', 100) is None
+
+
+def test_too_many_ranges_are_unsatisfiable():
+    header = 'bytes=' + ','.join(f'{i}-{i}' for i in range(0, 2 * (MAX_RANGES + 1), 2))
+    assert parse_ranges(header, 1000) == []
+
+
+def test_repeated_ranges_are_not_amplified(client, upload):
+    url = '/download/' + upload(os.urandom(4096), 'r.bin')
+    resp = client.get(url, headers={'Range': 'bytes=' + ','.join(['0-'] * 10)})
+    assert resp.status_code == 200 and len(resp.data) == 4096
+    resp = client.get(url, headers={'Range': 'bytes=' + ','.join(['0-'] * (MAX_RANGES + 1))})
+    assert resp.status_code == 416
@@ -0,0 +1,69 @@
+"""Client rate limits: stream slots are released however a download ends, and lost ones expire."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app as wifix
+from core.fileio import io_queued, submit_io
+from core.rate_limits import ClientRateLimiter
+
+
+def _limiter(**kwargs):
+    return ClientRateLimiter(10, 0, 1, kwargs.pop('max_clients', 100), lambda: (0, 0), **kwargs)
+
+
+def test_stale_stream_slot_expires():
+    rates = _limiter()
+    rates.opened('10.0.0.1')
+    assert rates.admit('10.0.0.1')[0] == 'too many concurrent transfers'
+    rates._clients['10.0.0.1'].active -= 10  # nothing moved for a whole window: close() was lost
+    assert rates.admit('10.0.0.1') is None
+    assert rates.stats()['expired_streams'] == 1
+
+
+def test_sweep_evicts_clients_with_stale_streams():
+    rates = _limiter(max_clients=1)
+    rates.opened('10.0.0.1')
+    w = rates._clients['10.0.0.1']
+    w.active -= 30
+    w.seen -= 30
+    rates.admit('10.0.0.2')
+    assert '10.0.0.1' not in rates._clients
+
+
+def test_download_releases_its_slot_when_closed(client, upload):
+    name = upload(b'x' * 4096)
+    resp = client.get('/download/' + name, buffered=False)
+    assert wifix.TRANSFERS._active
+    resp.close()
+    assert not wifix.TRANSFERS._active
+
+
+def test_download_failing_after_start_releases_its_slot(client, upload, monkeypatch):
+    name = upload(b'x' * 4096)
+
+    def broken(*args, **kwargs):
+        raise OSError('disk gone')
+
+    monkeypatch.setattr(wifix, '_file_body', broken)
+    with pytest.raises(OSError):
+        client.get('/download/' + name)
+    assert not wifix.TRANSFERS._active
+
+
+def test_queued_disk_writes_are_counted():
+    gate = threading.Event()
+    with ThreadPoolExecutor(1) as pool:
+        running = submit_io(pool, gate.wait)
+        while io_queued():  # until the worker has picked it up
+            time.sleep(0.001)
+        queued = submit_io(pool, len, b'abc')
+        cancelled = submit_io(pool, len, b'')
+        assert io_queued() == 2
+        assert cancelled.cancel()
+        assert io_queued() == 1
+        gate.set()
+        assert running.result() and queued.result() == 3
+    assert io_queued() == 0
@@ -0,0 +1,67 @@
+"""Peer relay: approved sockets pipe a file through a bounded buffer, never touching the uploads folder."""
+import threading
+
+import pytest
+
+import app as wifix
+from core.relay import Relay, RelayAborted
+
+
+def _last(sc, event):
+    return [e['args'][0] for e in sc.get_received() if e['name'] == event][-1]
+
+
+@pytest.fixture()
+def peers(app):
+    host, guest = wifix.socketio.test_client(app), wifix.socketio.test_client(app)
+    host.emit('become_host', {})
+    guest.emit('request_connect', {'name': 'guest'})
+    guest_sid = _last(host, 'incoming_request')['sid']
+    host.emit('approve_request', {'sid': guest_sid})
+    yield host, guest, guest_sid
+    host.disconnect()
+    guest.disconnect()
+
+
+def test_buffer_applies_backpressure():
+    relay = Relay('a', 'b', 'f.bin', 6, max_buffer=4)
+    relay.put(b'abcd', 1)
+    with pytest.raises(RelayAborted):
+        relay.put(b'ef', 0.05)  # nobody reads: the sender stalls and the relay fails
+    assert relay.error == 'receiver stalled'
+
+
+def test_file_is_piped_to_the_approved_peer(app, peers, monkeypatch):
+    host, guest, guest_sid = peers
+    monkeypatch.setattr(wifix.RELAYS, 'max_buffer', 64 * 1024)  # smaller than the file: the sender waits
+    body = bytes(range(256)) * 1000
+    host.emit('relay_offer', {'to': guest_sid, 'filename': 'clip.bin', 'size': len(body), 'ref': 7})
+    created = _last(host, 'relay_created')
+    incoming = _last(guest, 'relay_incoming')
+    assert created['ref'] == 7 and incoming['size'] == len(body)
+
+    sent = {}
+    sender = threading.Thread(target=lambda: sent.update(
+        resp=app.test_client().put(created['url'], data=body)))
+    sender.start()
+    assert app.test_client().get(incoming['url']).data == body
+    sender.join(10)
+    assert sent['resp'].status_code == 200 and sent['resp'].get_json()['bytes'] == len(body)
+    assert [p for p in wifix.UPLOAD_FOLDER.iterdir() if not p.name.startswith('.')] == []
+    assert app.test_client().get(incoming['url']).status_code == 404  # one-time URL
+
+
+def test_only_approved_peers_can_relay(app, peers):
+    stranger = wifix.socketio.test_client(app)
+    stranger.emit('relay_offer', {'to': 'someone', 'filename': 'x.bin', 'size': 1})
+    assert _last(stranger, 'relay_error')['error'] == 'peer not approved'
+    stranger.disconnect()
+
+
+def test_wrong_key_or_size_is_refused(app, peers):
+    host, guest, guest_sid = peers
+    host.emit('relay_offer', {'to': guest_sid, 'filename': 'x.bin', 'size': 10})
+    url = _last(host, 'relay_created')['url']
+    client = app.test_client()
+    assert client.put(url.split('?')[0] + '?key=nope', data=b'x' * 10).status_code == 404
+    assert client.put(url, data=b'x' * 9).status_code == 400
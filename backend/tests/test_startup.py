@@ -0,0 +1,38 @@
+"""Startup: importing the module has no side effects; create_app() builds the state, requests wait for the index."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import app as wifix
+
+BACKEND = Path(wifix.__file__).resolve().parent
+
+
+def test_import_has_no_side_effects(tmp_path):
+    uploads = tmp_path / 'uploads'
+    probe = ('import sys, threading; import app; '
+             'print(threading.active_count(), "qrcode" in sys.modules, "zeroconf" in sys.modules, app.DB)')
+    out = subprocess.run([sys.executable, '-c', probe], cwd=BACKEND, capture_output=True, text=True, check=True,
+                         env={**os.environ, 'UPLOAD_FOLDER': str(uploads), 'PYTHONPATH': str(BACKEND)}).stdout
+    assert out.split() == ['1', 'False', 'False', 'None']
+    assert not uploads.exists()
+
+
+def test_each_app_gets_its_own_folder_and_state(make_app, tmp_path):
+    first = make_app(UPLOAD_FOLDER=str(tmp_path / 'one'))
+    index = wifix.FILE_INDEX
+    second = make_app(UPLOAD_FOLDER=str(tmp_path / 'two'))
+    assert first is not second and wifix.FILE_INDEX is not index
+    assert wifix.UPLOAD_FOLDER == tmp_path / 'two' and (tmp_path / 'two').is_dir()
+    assert {'imports', 'module', 'index_ready'} <= set(wifix.STARTUP)
+
+
+def test_requests_needing_the_index_wait_for_it(client, monkeypatch):
+    monkeypatch.setattr(wifix, 'INDEX_READY', type(wifix.INDEX_READY)())
+    monkeypatch.setattr(wifix, 'INDEX_READY_TIMEOUT_SECONDS', 0.01)
+    resp = client.get('/files')
+    assert resp.status_code == 503 and resp.headers['Retry-After'] == '1'
+    assert client.get('/info').status_code == 200
+    wifix.INDEX_READY.set()
+    assert client.get('/files').status_code == 200
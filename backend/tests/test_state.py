@@ -0,0 +1,90 @@
+"""Shared state: one SQLite connection per database, PIN checks that cost no query, and state
+seen by every worker (host, PINs, rate-limit counters)."""
+import sqlite3
+import threading
+
+import pytest
+
+import app as wifix
+from core.state import PinStore, SQLiteDB, SQLiteLimiterStorage, SQLiteStateBackend
+
+
+def _count_statements(db):
+    seen = []
+    db._db.set_trace_callback(seen.append)
+    return seen
+
+
+def test_connection_is_shared_between_threads(tmp_path):
+    db = SQLiteDB(tmp_path / 'state.db')
+    db.execute('CREATE TABLE t (n INTEGER)')
+    threads = [threading.Thread(target=db.execute, args=('INSERT INTO t VALUES (?)', (i,))) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert db.query('SELECT COUNT(*) FROM t') == [(8,)]
+    assert db.query('PRAGMA journal_mode') == [('wal',)]
+    db.close()
+
+
+def test_pin_check_needs_no_query(client, upload):
+    name = upload(b'open', 'open.txt')
+    pinned = upload(b'secret', 'secret.txt', pin='1234')
+    seen = _count_statements(wifix.DB)
+    assert name not in wifix.FILE_PINS
+    assert pinned in wifix.FILE_PINS
+    assert client.get('/download/' + name).status_code == 200
+    assert not [s for s in seen if 'file_pins' in s]
+
+
+def test_shared_store_sees_pins_set_by_another_worker(tmp_path):
+    path = tmp_path / 'state.db'
+    mine, theirs = SQLiteDB(path), SQLiteDB(path)
+    store = PinStore(mine, 3600, shared=True)
+    other = PinStore(theirs, 3600, shared=True)
+    assert not store.has_pin('a.txt')
+    other.set_pin('a.txt', '1234')
+    assert store.has_pin('a.txt') and store.verify('a.txt', '1234')
+    other.delete_pin('a.txt')
+    assert not store.has_pin('a.txt')
+
+
+def test_new_app_closes_the_previous_database(make_app):
+    make_app()
+    db = wifix.DB
+    make_app()
+    assert wifix.DB is not db
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.query('SELECT 1')
+
+
+def test_workers_share_the_host_and_only_the_host_clears_it(tmp_path):
+    path = tmp_path / 'state.db'
+    mine, theirs = SQLiteStateBackend(SQLiteDB(path)), SQLiteStateBackend(SQLiteDB(path))
+    mine.set_host_sid('sid-1')
+    assert theirs.get_host_sid() == 'sid-1'
+    assert not theirs.clear_host_sid('sid-2')
+    assert theirs.clear_host_sid('sid-1')
+    assert mine.get_host_sid() is None
+
+
+def test_workers_share_rate_limit_counters(tmp_path):
+    uri = f"sqlite://{tmp_path / 'limits.db'}"
+    mine, theirs = SQLiteLimiterStorage(uri), SQLiteLimiterStorage(uri)
+    assert mine.incr('k', 60) == 1
+    assert theirs.incr('k', 60) == 2
+    assert mine.get('k') == 2
+    assert theirs.incr('short', -1) == 1  # already expired: the next window starts over
+    assert mine.incr('short', 60) == 1
+
+
+def test_become_host_is_visible_to_other_workers(make_app, monkeypatch):
+    monkeypatch.setattr(wifix, 'STATE_BACKEND', 'sqlite')
+    app = make_app()
+    sc = wifix.socketio.test_client(app)
+    sc.emit('become_host', {})
+    other = SQLiteStateBackend(SQLiteDB(wifix.STATE_DB))
+    assert other.get_host_sid() == wifix.STATE.get_host_sid() is not None
+    sc.disconnect()
+    assert other.get_host_sid() is None
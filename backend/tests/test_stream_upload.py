@@ -0,0 +1,36 @@
+"""Raw-body uploads on /upload/stream: copied straight from the request stream, renamed into place."""
+import hashlib
+import io
+
+import app as wifix
+
+
+def _stream(client, body, **params):
+    return client.post('/upload/stream', query_string={'filename': 'raw.bin', **params}, data=body,
+                       content_type='application/octet-stream')
+
+
+def test_body_lands_intact_with_stats(client):
+    body = bytes(range(256)) * 4096
+    resp = _stream(client, body)
+    assert resp.status_code == 201
+    result = resp.get_json()
+    assert (wifix.UPLOAD_FOLDER / result['filename']).read_bytes() == body
+    assert result['sha256'] == hashlib.sha256(body).hexdigest()
+    assert result['stats']['bytes'] == len(body) and result['stats']['peak_rss'] > 0
+    assert list(wifix.PARTIAL_FOLDER.iterdir()) == []
+
+
+def test_length_is_required(client):
+    resp = client.post('/upload/stream?filename=raw.bin', input_stream=io.BytesIO(b'abc'),
+                       headers={'Transfer-Encoding': 'chunked'}, environ_overrides={'wsgi.input_terminated': True})
+    assert resp.status_code == 411
+
+
+def test_truncated_or_mismatched_bodies_leave_nothing_behind(client):
+    resp = client.post('/upload/stream?filename=raw.bin', input_stream=io.BytesIO(b'short'),
+                       environ_overrides={'CONTENT_LENGTH': '100'})
+    assert resp.status_code == 500
+    assert _stream(client, b'hello', sha256='0' * 64).status_code == 400
+    assert [p.name for p in wifix.UPLOAD_FOLDER.iterdir() if not p.name.startswith('.')] == []
+    assert list(wifix.PARTIAL_FOLDER.iterdir()) == []
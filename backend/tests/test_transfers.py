@@ -0,0 +1,48 @@
+"""Transfer scheduling: weighted fair shares, unshaped small files and live limits from the host."""
+from core.rate_limits import ClientRateLimiter
+from core.transfers import TransferScheduler
+
+import app as wifix
+
+
+def _scheduler(**kwargs):
+    return TransferScheduler(ClientRateLimiter(60, 0, 0, 100, lambda: (0, 0)), **kwargs)
+
+
+def test_global_cap_is_shared_by_weight():
+    transfers = _scheduler(global_bps=4000, small_file_bytes=10)
+    transfers.client_weights = {'10.0.0.2': 3.0}
+    light = transfers.start('download', 'a', 1000, client='10.0.0.1')
+    heavy = transfers.start('download', 'b', 1000, client='10.0.0.2')
+    transfers.throttle(light, 1)
+    transfers.throttle(heavy, 1)
+    assert (light.bucket.rate, heavy.bucket.rate) == (1000, 3000)
+    assert transfers.active_count() == 2
+    light.close()
+    heavy.close()
+    assert transfers.active_count() == 0
+    assert transfers.stats()['completed_bytes']['download'] == 2000
+
+
+def test_small_files_are_not_shaped():
+    transfers = _scheduler(global_bps=1, small_file_bytes=1024)
+    small = transfers.start('download', 'small', 1024, client='10.0.0.1')
+    transfers.throttle(small, 1024)  # would sleep ~1000 s if it were shaped
+    assert not small.shaped and small.bucket.rate == 0
+
+
+def test_active_transfers_in_stats(client, upload):
+    name = upload(b'x' * 4096)
+    resp = client.get('/download/' + name, buffered=False)
+    assert client.get('/stats').get_json()['active_transfers'] == 1
+    resp.close()
+    assert client.get('/stats').get_json()['active_transfers'] == 0
+
+
+def test_only_the_host_changes_limits(app, socket_client):
+    socket_client.emit('set_bandwidth_limits', {'global_bps': 1000})
+    assert wifix.TRANSFERS.global_bps == 0
+    socket_client.emit('become_host', {})
+    socket_client.emit('set_bandwidth_limits', {'global_bps': 1000, 'weights': {'10.0.0.9': 2}})
+    replies = [e['args'][0] for e in socket_client.get_received() if e['name'] == 'bandwidth_limits']
+    assert replies[-1]['global_bps'] == 1000 and replies[-1]['weights'] == {'10.0.0.9': 2.0}
@@ -20,7 +20,7 @@ import { useFileUpload } from "./hooks/useFileUpload";
 import { useAuth } from "./hooks/useAuth";
 
 // Utils
-import { fetchDeviceInfo, fetchFiles, deleteFile } from "./utils/api";
+import { fetchDeviceInfo, fetchFiles, deleteFile, normalizeFile } from "./utils/api";
 
 function App() {
   const [files, setFiles] = useState([]);
@@ -70,8 +70,25 @@ function App() {
     });
   };
 
-  const handleFileDeleted = (filename) => {
-    setFiles((prev) => prev.filter((f) => f.name !== filename));
+  const handleFileDeleted = (filename, reason) => {
+    // The files feed usually removed it already; keep the same array then
+    setFiles((prev) =>
+      prev.some((f) => f.name === filename) ? prev.filter((f) => f.name !== filename) : prev
+    );
+    if (reason === "evicted") {
+      toast(`${filename} was removed to free up storage`);
+    }
+  };
+
+  // Change feed: a full snapshot on (re)subscribe, then coalesced deltas
+  const handleFilesFeed = (update) => {
+    if (update.type === "snapshot") {
+      setFiles(update.files.map(normalizeFile));
+      return;
+    }
+    const upserts = update.upserts.map(normalizeFile);
+    const replaced = new Set([...update.deletes, ...upserts.map((f) => f.name)]);
+    setFiles((prev) => [...upserts, ...prev.filter((f) => !replaced.has(f.name))]);
   };
 
   // Socket hook
@@ -82,7 +99,9 @@ function App() {
     stopServer: socketStopServer,
     connectToHost: socketConnectToHost,
     setupSocketHandlers,
-  } = useSocket(isHost, isApproved, handleFileUploaded, handleFileDeleted);
+    subscribeFiles,
+    unsubscribeFiles,
+  } = useSocket(isHost, isApproved, handleFileUploaded, handleFileDeleted, handleFilesFeed);
 
   // Load files from backend
   const loadFiles = async () => {
@@ -131,44 +150,13 @@ function App() {
 
   useAuth(handleAuthComplete);
 
-  // Periodic file sync - check for new/deleted files every 3 seconds
+  // Live file list: subscribe to the server's change feed while connected
   useEffect(() => {
     if (!isHost && !isApproved) return; // Only sync if connected
 
-    const interval = setInterval(async () => {
-      try {
-        const serverFiles = await fetchFiles();
-        const serverFileNames = new Set(serverFiles.map((f) => f.name));
-        const currentFileNames = new Set(files.map((f) => f.name));
-
-        // Check for new files on server
-        const newFiles = serverFiles.filter(
-          (f) => !currentFileNames.has(f.name)
-        );
-        if (newFiles.length > 0) {
-          console.log(
-            "Found new files on server:",
-            newFiles.map((f) => f.name)
-          );
-          setFiles((prev) => [...newFiles, ...prev]);
-        }
-
-        // Check for deleted files on server
-        const deletedFiles = files.filter((f) => !serverFileNames.has(f.name));
-        if (deletedFiles.length > 0) {
-          console.log(
-            "Found deleted files on server:",
-            deletedFiles.map((f) => f.name)
-          );
-          setFiles((prev) => prev.filter((f) => serverFileNames.has(f.name)));
-        }
-      } catch (e) {
-        console.warn("File sync check failed:", e);
-      }
-    }, 3000); // Check every 3 seconds
-
-    return () => clearInterval(interval);
-  }, [isHost, isApproved, files]);
+    subscribeFiles();
+    return () => unsubscribeFiles();
+  }, [isHost, isApproved]);
 
   // Server control handlers
   const handleStartServer = async () => {
@@ -447,31 +435,104 @@ function App() {
     }
   };
 
-  // Upload multiple files sequentially
+  // Upload multiple files in a single batch request (one progress bar, one
+  // files_uploaded event); falls back to one request per file on older servers
   const uploadMultipleFiles = async (files, pin) => {
-    let successCount = 0;
-    let failCount = 0;
-
-    for (let i = 0; i < files.length; i++) {
-      const file = files[i];
-      setStatusMsg(`Uploading ${i + 1}/${files.length}: ${file.name}...`);
-
-      try {
-        await performUpload(file, pin);
-        successCount++;
-      } catch (e) {
-        console.error(`Failed to upload ${file.name}:`, e);
-        failCount++;
+    const key = `${files.length} files`;
+    const total = files.reduce((sum, f) => sum + f.size, 0);
+    const startTime = Date.now();
+    setStatusMsg(`Uploading ${files.length} files...`);
+    setUploadingFiles((prev) => ({
+      ...prev,
+      [key]: { progress: 0, speed: "0 KB/s", loaded: 0, total },
+    }));
+    const clearProgress = () =>
+      setUploadingFiles((prev) => {
+        const updated = { ...prev };
+        delete updated[key];
+        return updated;
+      });
+
+    let result;
+    try {
+      result = await new Promise((resolve, reject) => {
+        const xhr = new XMLHttpRequest();
+        const apiBase = import.meta.env.VITE_API_URL || window.location.origin;
+        xhr.open("POST", `${apiBase.replace(/\/$/, "")}/upload/batch`, true);
+        xhr.withCredentials = true;
+
+        xhr.upload.onprogress = function (e) {
+          if (!e.lengthComputable) return;
+          const seconds = (Date.now() - startTime) / 1000;
+          const bytesPerSecond = seconds > 0 ? e.loaded / seconds : 0;
+          const speed =
+            bytesPerSecond > 1024 * 1024
+              ? `${(bytesPerSecond / (1024 * 1024)).toFixed(2)} MB/s`
+              : `${(bytesPerSecond / 1024).toFixed(2)} KB/s`;
+          setUploadingFiles((prev) => ({
+            ...prev,
+            [key]: {
+              progress: Math.round((e.loaded / e.total) * 100),
+              speed,
+              loaded: e.loaded,
+              total: e.total,
+            },
+          }));
+        };
+
+        xhr.onload = function () {
+          let json = {};
+          try {
+            json = JSON.parse(xhr.responseText);
+          } catch (e) {}
+          if (xhr.status >= 200 && xhr.status < 300) {
+            resolve(json);
+          } else {
+            const err = new Error(json.error || `Upload failed (${xhr.status})`);
+            err.status = xhr.status;
+            reject(err);
+          }
+        };
+
+        xhr.onerror = () => reject(new Error("Network error"));
+        xhr.ontimeout = () => reject(new Error("Upload timeout"));
+
+        const fd = new FormData();
+        if (pin) fd.append("pin", pin);
+        files.forEach((file) => fd.append("files", file));
+        xhr.send(fd);
+      });
+    } catch (e) {
+      clearProgress();
+      if (e.status === 404) {
+        for (const file of files) await performUpload(file, pin);
+        return;
       }
+      console.error("Batch upload error:", e);
+      setUploadError(
+        e.message || "Upload failed. Please check your connection and try again."
+      );
+      setShowUploadError(true);
+      setStatusMsg("Upload failed");
+      toast.error(`Failed to upload ${files.length} files`);
+      return;
     }
 
-    // Show summary
+    (result.files || []).forEach(handleFileUploaded);
+    setTimeout(clearProgress, 1000);
+    const inputEl = fileInputRef.current;
+    if (inputEl) inputEl.value = "";
+    setSelectedFileName("");
+
+    const successCount = (result.files || []).length;
+    const failCount = (result.skipped || []).length;
     if (failCount === 0) {
       setStatusMsg(
         `✓ Successfully uploaded ${successCount} file${
           successCount > 1 ? "s" : ""
         }!`
       );
+      toast.success(`${successCount} files uploaded successfully!`);
     } else {
       setStatusMsg(`Uploaded ${successCount} file(s), ${failCount} failed`);
     }
@@ -1,9 +1,55 @@
 import { useRef, useEffect, useState } from "react";
 import { getApiBase } from "../utils/api";
 
-export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted) => {
+export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted, onFilesFeed) => {
   const socketRef = useRef(null);
   const [autoRequested, setAutoRequested] = useState(false);
+  // last change-feed position seen, so a reconnect only replays what was missed
+  const feedRef = useRef({ epoch: null, seq: 0 });
+  const subscribedRef = useRef(false);
+
+  const emitSubscribe = (s) => {
+    const { epoch, seq } = feedRef.current;
+    s.emit("subscribe_files", epoch ? { epoch, since: seq } : {});
+  };
+
+  const attachFileFeed = (s) => {
+    s.on("connect", () => {
+      if (subscribedRef.current) emitSubscribe(s);
+    });
+
+    s.on("files_snapshot", (d) => {
+      if (!d) return;
+      feedRef.current = { epoch: d.epoch, seq: d.seq };
+      if (onFilesFeed) onFilesFeed({ type: "snapshot", files: d.files || [] });
+    });
+
+    s.on("files_changed", (d) => {
+      const feed = feedRef.current;
+      if (!d || d.epoch !== feed.epoch || d.seq <= feed.seq) return;
+      if (d.from > feed.seq + 1) {
+        // missed a batch: ask the server to replay from where we are
+        emitSubscribe(s);
+        return;
+      }
+      feedRef.current = { epoch: d.epoch, seq: d.seq };
+      if (onFilesFeed) {
+        onFilesFeed({ type: "delta", upserts: d.upserts || [], deletes: d.deletes || [] });
+      }
+    });
+  };
+
+  const subscribeFiles = () => {
+    subscribedRef.current = true;
+    const s = socketRef.current;
+    if (s && s.connected) emitSubscribe(s);
+  };
+
+  const unsubscribeFiles = () => {
+    subscribedRef.current = false;
+    const s = socketRef.current;
+    if (s && s.connected) s.emit("unsubscribe_files", {});
+  };
 
   const initSocket = async () => {
     try {
@@ -13,6 +59,7 @@ export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted) =>
       const API_BASE = getApiBase();
       const { io } = await import("socket.io-client");
       const s = io(API_BASE);
+      attachFileFeed(s);
 
       s.on("connect", () => {
         console.debug("socket connected", s.id);
@@ -34,11 +81,18 @@ export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted) =>
         onFileUploaded(data);
       });
 
-      s.on("file_deleted", (d) => {
-        // Allow ALL users to see file deletions in real-time
-        if (!d || !d.filename) return;
-        console.log("file_deleted event received:", d);
-        onFileDeleted(d.filename);
+      // Batch uploads announce all their files in one event
+      s.on("files_uploaded", (data) => {
+        if (!data || !Array.isArray(data.files)) return;
+        console.log("files_uploaded event received:", data.files.length);
+        data.files.forEach((f) => f && f.filename && onFileUploaded(f));
+      });
+
+      // Expired files and files evicted to free storage are removed in batches
+      s.on("files_deleted", (d) => {
+        if (!d || !Array.isArray(d.filenames)) return;
+        console.log("files_deleted event received:", d);
+        d.filenames.forEach((name) => onFileDeleted(name, d.reason));
       });
 
       socketRef.current = s;
@@ -64,6 +118,7 @@ export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted) =>
     try {
       const { io } = await import("socket.io-client");
       const s = io(API_BASE, { autoConnect: false });
+      attachFileFeed(s);
 
       s.on("connect", () => {
         console.log("Socket connected", s.id);
@@ -80,10 +135,16 @@ export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted) =>
         onFileUploaded(data);
       });
 
-      s.on("file_deleted", (d) => {
-        if (!d || !d.filename) return;
-        console.log("file_deleted event received:", d);
-        onFileDeleted(d.filename);
+      s.on("files_uploaded", (data) => {
+        if (!data || !Array.isArray(data.files)) return;
+        console.log("files_uploaded event received:", data.files.length);
+        data.files.forEach((f) => f && f.filename && onFileUploaded(f));
+      });
+
+      s.on("files_deleted", (d) => {
+        if (!d || !Array.isArray(d.filenames)) return;
+        console.log("files_deleted event received:", d);
+        d.filenames.forEach((name) => onFileDeleted(name, d.reason));
       });
 
       s.connect();
@@ -183,6 +244,8 @@ export const useSocket = (isHost, isApproved, onFileUploaded, onFileDeleted) =>
     stopServer,
     connectToHost,
     setupSocketHandlers,
+    subscribeFiles,
+    unsubscribeFiles,
     autoRequested,
   };
 };
@@ -27,6 +27,16 @@ export const fetchDeviceInfo = async () => {
   return null;
 };
 
+// normalize a /files item or change-feed entry into local file shape
+export const normalizeFile = (it) => ({
+  name: it.filename || it.name,
+  url: it.url || (it.path ? `${getApiBase().replace(/\/$/, "")}/${it.path}` : null),
+  size: it.size || 0,
+  mtime: it.mtime ? it.mtime * 1000 : Date.now(),
+  type: it.type || "file",
+  has_pin: it.has_pin || false,
+});
+
 export const fetchFiles = async () => {
   try {
     const res = await fetch(`${getApiBase().replace(/\/$/, "")}/files`, {
@@ -34,15 +44,7 @@ export const fetchFiles = async () => {
     });
     if (!res.ok) throw new Error("fetch files failed");
     const items = await res.json();
-    // normalize into local file shape
-    return (items || []).map((it) => ({
-      name: it.filename || it.name,
-      url: it.url || null,
-      size: it.size || 0,
-      mtime: it.mtime ? it.mtime * 1000 : Date.now(),
-      type: it.type || "file",
-      has_pin: it.has_pin || false,
-    }));
+    return (items || []).map(normalizeFile);
   } catch (e) {
     console.warn("loadFiles", e);
     return [];
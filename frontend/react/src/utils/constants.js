@@ -27,7 +27,8 @@ export const SOCKET_EVENTS = {
   CONNECT: "connect",
   DISCONNECT: "disconnect",
   FILE_UPLOADED: "file_uploaded",
-  FILE_DELETED: "file_deleted",
+  FILES_UPLOADED: "files_uploaded",
+  FILES_DELETED: "files_deleted",
   REQUEST_APPROVED: "request_approved",
   REQUEST_DENIED: "request_denied",
   INCOMING_REQUEST: "incoming_request",